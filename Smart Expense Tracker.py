@@ -3,13 +3,2908 @@ from tkinter import ttk, messagebox, filedialog
 import sqlite3
 import datetime
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
 import pandas as pd
+import numpy as np
 import hashlib
+import json
 import os
+import sys
+import re
 import time
+import argparse
+import threading
+import calendar
+import collections
+import contextlib
+import functools
+import bisect
+import io
+import pathlib
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from fpdf import FPDF
 
+DATABASE_FILE = 'expense_tracker.db'
+
+RECURRING_FREQUENCIES = ("weekly", "monthly", "yearly")
+
+# Fiscal year runs July to June
+FISCAL_YEAR_START_MONTH = 7
+
+# Length of each calendar period in months (weeks are handled separately)
+PERIOD_MONTHS = {
+    "month": 1,
+    "quarter": 3,
+    "year": 12,
+    "fiscal": 12,
+}
+
+PERIOD_TITLES = {
+    "week": "Weekly Expenses",
+    "month": "Monthly Expenses",
+    "quarter": "Quarterly Expenses",
+    "year": "Yearly Expenses",
+    "fiscal": "Fiscal Year Expenses",
+}
+
+PERIOD_COLUMN_NAMES = {
+    "week": "Week",
+    "month": "Month",
+    "quarter": "Quarter",
+    "year": "Year",
+    "fiscal": "Fiscal Year",
+}
+
+# Cached report figures kept per session
+REPORT_FIGURE_CACHE_SIZE = 8
+
+# Custom daily reports longer than this are exported with the streaming PDF writer
+STREAMING_EXPORT_DAYS = 366
+
+# Periods covered by a comparison report unless asked otherwise, and the largest allowed
+COMPARISON_PERIODS = 2
+MAX_COMPARISON_PERIODS = 36
+
+# Categories listed as top movers in a comparison
+COMPARISON_TOP_MOVERS = 5
+
+# Periods a comparison also compares with the same period last year. For years that is
+# simply the previous period, already shown as period over period.
+YEAR_OVER_YEAR_PERIODS = ("week", "month", "quarter")
+
+# Anomaly detection: scores at or above the threshold are flagged, and a category needs
+# this much history before it is scored. MAD_SCALE turns a median absolute deviation
+# into a standard deviation estimate.
+ANOMALY_THRESHOLD = 3.0
+ANOMALY_MIN_EXPENSES = 5
+ANOMALY_MIN_MONTHS = 3
+MAD_SCALE = 1.4826
+
+# Expenses with the same amount and description this many days apart count as possible duplicates
+DUPLICATE_WINDOW_DAYS = 1
+
+# Trash: default days deleted expenses are kept (0 keeps them forever), rows shown per
+# page, and rows permanently deleted per batch with a pause between batches (seconds)
+TRASH_RETENTION_DAYS = 30
+TRASH_RETENTION_CHOICES = [7, 30, 90, 365, 0]
+TRASH_PAGE_SIZE = 100
+PURGE_BATCH_SIZE = 500
+PURGE_PAUSE = 0.05
+
+# Goals are read in pages and only the visible ones get widgets, each row this many pixels high
+GOALS_PAGE_SIZE = 50
+GOAL_ROW_HEIGHT = 130
+GOALS_VISIBLE_ROWS = 5
+
+# Completion dates are projected from the contributions of this many recent days and
+# the average budget surplus of this many complete months
+GOAL_RATE_DAYS = 90
+SURPLUS_MONTHS = 3
+DAYS_PER_MONTH = 30.4375
+
+# Notes of goal ledger rows that set an amount rather than save towards it, left out of the rate
+GOAL_LEDGER_NOTES = ("Opening balance", "Starting amount", "Adjustment")
+
+# Synthetic data for benchmarks: category -> (share of expenses, median amount, descriptions)
+SYNTHETIC_CATEGORIES = {
+    "Food": (0.35, 900, ["Groceries", "Lunch", "Dinner out", "Bakery", "Coffee", "Fruit market"]),
+    "Transportation": (0.20, 600, ["Fuel", "Taxi", "Bus fare", "Car wash", "Parking"]),
+    "Shopping": (0.15, 3500, ["Clothes", "Shoes", "Online order", "Electronics", "Gift"]),
+    "Entertainment": (0.10, 1500, ["Cinema", "Concert", "Streaming subscription", "Games"]),
+    "Utilities": (0.10, 4000, ["Electricity bill", "Gas bill", "Water bill", "Internet", "Mobile top up"]),
+    "Rent": (0.03, 45000, ["Rent"]),
+    "Others": (0.07, 1200, ["Pharmacy", "Doctor", "Donation", "Repairs", "Stationery"]),
+}
+SYNTHETIC_FRIENDS = ["Ali", "Sara", "Ahmed", "Fatima", "Bilal", "Ayesha", "Usman", "Hina", "Omar", "Zainab"]
+SYNTHETIC_EXPENSES_PER_USER = 2000
+SYNTHETIC_YEARS = 3
+SYNTHETIC_CHUNK_SIZE = 100000
+BENCHMARK_REPEATS = 5
+
+# Statements slower than this many milliseconds are kept for the Diagnostics window,
+# and also appended to a log file when one is given with --slow-query-log
+SLOW_QUERY_MS = 200
+SLOW_QUERY_LOG = None
+SLOW_QUERY_HISTORY = 200
+DIAGNOSTICS_TOP = 25
+TRACE_EVENT_LIMIT = 200000
+
+# Buckets shown by the period report for each period type: (count, span)
+# "year" means every bucket of the current year, otherwise the last `count` periods
+PERIOD_BREAKDOWN = {
+    "week": (12, "last"),
+    "month": (12, "year"),
+    "quarter": (4, "year"),
+    "year": (5, "last"),
+    "fiscal": (5, "last"),
+}
+
+def add_months(date, months):
+    # Move a date by whole months, clamping the day to the target month's length
+    month_index = date.month - 1 + months
+    year = date.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(date.day, calendar.monthrange(year, month)[1])
+    return date.replace(year=year, month=month, day=day)
+
+def recurrence_date(start_date, frequency, index):
+    # Date of the index-th occurrence, always anchored to the rule's start date
+    # so that e.g. a rule starting on the 31st comes back to the 31st after February
+    if frequency == "weekly":
+        return start_date + datetime.timedelta(weeks=index)
+    if frequency == "monthly":
+        return add_months(start_date, index)
+    if frequency == "yearly":
+        return add_months(start_date, 12 * index)
+    raise ValueError(f"Unknown frequency: {frequency}")
+
+def period_start(period, day):
+    # First day of the period containing day
+    if period == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    if period == "quarter":
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if period == "year":
+        return day.replace(month=1, day=1)
+    if period == "fiscal":
+        year = day.year if day.month >= FISCAL_YEAR_START_MONTH else day.year - 1
+        return datetime.date(year, FISCAL_YEAR_START_MONTH, 1)
+    raise ValueError(f"Unknown period: {period}")
+
+def shift_period(period, start, count):
+    # Start of the period `count` periods after (or before, if negative) the one starting at start
+    if period == "week":
+        return start + datetime.timedelta(weeks=count)
+    return add_months(start, PERIOD_MONTHS[period] * count)
+
+def year_ago_start(period, start):
+    # Start of the same period a year earlier: the same ISO week number for weeks, as
+    # years have 52 or 53 of them (the 53rd maps to the 52nd), otherwise twelve months back
+    if period == "week":
+        year, week, _ = start.isocalendar()
+        weeks = datetime.date(year - 1, 12, 28).isocalendar()[1]
+        return datetime.date.fromisocalendar(year - 1, min(week, weeks), 1)
+    return add_months(start, -12)
+
+def period_range(period, day=None):
+    # Half-open [start, end) range of the period containing day
+    start = period_start(period, day or datetime.date.today())
+    return (start, shift_period(period, start, 1))
+
+def custom_range(from_date, to_date):
+    # Half-open range for an inclusive pair of YYYY-MM-DD strings, raises ValueError if invalid
+    start = datetime.datetime.strptime(from_date, "%Y-%m-%d").date()
+    end = datetime.datetime.strptime(to_date, "%Y-%m-%d").date() + datetime.timedelta(days=1)
+    if end <= start:
+        raise ValueError("End date is before start date")
+    return (start, end)
+
+def previous_range(period, start, end):
+    # The range immediately before [start, end) with the same length
+    if period == "custom":
+        return (start - (end - start), start)
+    return (shift_period(period, start, -1), start)
+
+def period_label(period, start, end):
+    if period == "week":
+        year, week, _ = start.isocalendar()
+        return f"W{week:02d} {year}"
+    if period == "month":
+        return start.strftime("%b %Y")
+    if period == "quarter":
+        return f"Q{(start.month - 1) // 3 + 1} {start.year}"
+    if period == "year":
+        return str(start.year)
+    if period == "fiscal":
+        return f"FY {start.year}-{(start.year + 1) % 100:02d}"
+    last_day = end - datetime.timedelta(days=1)
+    return f"{start.strftime('%d %b %Y')} to {last_day.strftime('%d %b %Y')}"
+
+def period_breakdown(period, day=None):
+    # Consecutive (start, end, label) buckets shown by the period report
+    day = day or datetime.date.today()
+    count, span = PERIOD_BREAKDOWN[period]
+    
+    if span == "year":
+        first = datetime.date(day.year, 1, 1)
+    else:
+        first = shift_period(period, period_start(period, day), 1 - count)
+    
+    buckets = []
+    for i in range(count):
+        start = shift_period(period, first, i)
+        end = shift_period(period, first, i + 1)
+        buckets.append((start, end, period_label(period, start, end)))
+    
+    return buckets
+
+def sql_range(start, end):
+    # Query parameters for "date >= ? AND date < ?"
+    return (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+
+def sum_by_buckets(cursor, user_id, buckets):
+    # Totals per bucket from a single range query over all of them
+    cursor.execute('''
+        SELECT date, SUM(amount) 
+        FROM expenses 
+        WHERE user_id=? AND date >= ? AND date < ? AND is_deleted=0
+        GROUP BY date
+    ''', (user_id,) + sql_range(buckets[0][0], buckets[-1][1]))
+    
+    bounds = [bucket[1].strftime("%Y-%m-%d") for bucket in buckets]
+    totals = [0] * len(buckets)
+    
+    for date, amount in cursor.fetchall():
+        totals[bisect.bisect_right(bounds, date[:10])] += amount
+    
+    return totals
+
+def report_range(time_period, from_date=None, to_date=None, day=None):
+    # Half-open range covered by a report, raises ValueError for an invalid custom range
+    if time_period == "custom":
+        return custom_range(from_date, to_date)
+    return period_range(time_period, day)
+
+def build_category_report(cursor, user_id, time_period, from_date=None, to_date=None):
+    start, end = report_range(time_period, from_date, to_date)
+    
+    cursor.execute('''
+        SELECT category, SUM(amount) as total 
+        FROM expenses 
+        WHERE user_id=? AND date >= ? AND date < ? AND is_deleted=0
+        GROUP BY category 
+        ORDER BY total DESC
+    ''', (user_id,) + sql_range(start, end))
+    
+    data = cursor.fetchall()
+    total = sum(amount for _, amount in data)
+    
+    return {
+        "type": "category",
+        "period": time_period,
+        "title": "Expenses by Category",
+        "range": (start, end),
+        "labels": [category for category, _ in data],
+        "values": [amount for _, amount in data],
+        "percentages": [(amount / total) * 100 if total > 0 else 0 for _, amount in data],
+        "total": total,
+        "empty": not any(amount > 0 for _, amount in data),
+    }
+
+def build_period_report(cursor, user_id, time_period, from_date=None, to_date=None):
+    if time_period != "custom":
+        buckets = period_breakdown(time_period)
+        totals = sum_by_buckets(cursor, user_id, buckets)
+        
+        return {
+            "type": "period",
+            "period": time_period,
+            "title": PERIOD_TITLES[time_period],
+            "column": PERIOD_COLUMN_NAMES[time_period],
+            "range": (buckets[0][0], buckets[-1][1]),
+            "labels": [bucket[2] for bucket in buckets],
+            "values": totals,
+            "total": sum(totals),
+            "empty": False,
+        }
+    
+    start, end = custom_range(from_date, to_date)
+    
+    # Daily expenses
+    cursor.execute('''
+        SELECT date, SUM(amount) 
+        FROM expenses 
+        WHERE user_id=? AND date >= ? AND date < ? AND is_deleted=0
+        GROUP BY date 
+        ORDER BY date
+    ''', (user_id,) + sql_range(start, end))
+    
+    data = cursor.fetchall()
+    dates = [datetime.datetime.strptime(date, "%Y-%m-%d") for date, _ in data]
+    
+    return {
+        "type": "period",
+        "period": time_period,
+        "title": "Daily Expenses",
+        "column": "Date",
+        "range": (start, end),
+        "labels": [date.strftime("%d %b") for date in dates],
+        "dates": [date.strftime("%d %b %Y") for date in dates],
+        "days": [date.strftime("%A") for date in dates],
+        "values": [amount for _, amount in data],
+        "total": sum(amount for _, amount in data),
+        "empty": not data,
+    }
+
+def comparison_buckets(time_period, start, end, count):
+    # `count` consecutive (start, end, label) periods ending with [start, end), oldest first
+    buckets = []
+    for i in range(count):
+        buckets.append((start, end, period_label(time_period, start, end)))
+        start, end = previous_range(time_period, start, end)
+    return buckets[::-1]
+
+def period_changes(current, previous):
+    # Absolute and percentage change per row, percentage is NaN where nothing was spent before
+    change = current - previous
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change_pct = np.where(previous != 0, change / previous * 100, np.nan)
+    return change, change_pct
+
+def build_comparison_report(cursor, user_id, time_period, from_date=None, to_date=None, periods=COMPARISON_PERIODS):
+    # Category totals for the selected period and the periods before it, pivoted from a single query
+    start, end = report_range(time_period, from_date, to_date)
+    buckets = comparison_buckets(time_period, start, end, max(periods, 2))
+    
+    cursor.execute('''
+        SELECT date, category, SUM(amount) 
+        FROM expenses 
+        WHERE user_id=? AND date >= ? AND date < ? AND is_deleted=0
+        GROUP BY date, category
+    ''', (user_id,) + sql_range(buckets[0][0], buckets[-1][1]))
+    
+    frame = pd.DataFrame(cursor.fetchall(), columns=["date", "category", "amount"])
+    bounds = np.array([bucket[1].strftime("%Y-%m-%d") for bucket in buckets])
+    frame["bucket"] = np.searchsorted(bounds, frame["date"].str[:10].to_numpy(dtype=str), side="right")
+    
+    pivot = frame.pivot_table(index="category", columns="bucket", values="amount", aggfunc="sum", fill_value=0)
+    pivot = pivot.reindex(columns=range(len(buckets)), fill_value=0).sort_index()
+    amounts = pivot.to_numpy(dtype=float)
+    totals = amounts.sum(axis=0)
+    categories = list(pivot.index)
+    
+    # Latest period against the one before it
+    change, change_pct = period_changes(amounts[:, -1], amounts[:, -2])
+    total_change, total_change_pct = period_changes(totals[1:], totals[:-1])
+    
+    order = np.argsort(-np.abs(change), kind="stable")[:COMPARISON_TOP_MOVERS]
+    movers = [(categories[i], float(change[i]), float(change_pct[i])) for i in order if change[i] != 0]
+    
+    data = {
+        "type": "comparison",
+        "period": time_period,
+        "title": "Expense Comparison",
+        "range": (start, end),
+        "labels": [bucket[2] for bucket in buckets],
+        "categories": categories,
+        "series": amounts.T.tolist(),
+        "totals": totals.tolist(),
+        "change": change.tolist(),
+        "change_pct": change_pct.tolist(),
+        "total_change": total_change.tolist(),
+        "total_change_pct": total_change_pct.tolist(),
+        "movers": movers,
+        "year_ago": None,
+        "empty": not categories,
+    }
+    
+    # Year-over-year when the same period of last year is part of the range
+    starts = [bucket[0] for bucket in buckets]
+    if time_period in YEAR_OVER_YEAR_PERIODS and year_ago_start(time_period, start) in starts:
+        year_ago = starts.index(year_ago_start(time_period, start))
+        yoy_change, yoy_change_pct = period_changes(amounts[:, -1], amounts[:, year_ago])
+        data["year_ago"] = year_ago
+        data["yoy_change"] = yoy_change.tolist()
+        data["yoy_change_pct"] = yoy_change_pct.tolist()
+    
+    return data
+
+REPORT_BUILDERS = {
+    "category": build_category_report,
+    "period": build_period_report,
+    "comparison": build_comparison_report,
+}
+
+def build_report(cursor, user_id, report_type, time_period, from_date=None, to_date=None, periods=COMPARISON_PERIODS):
+    # Build any report type, `periods` is the number of periods a comparison covers
+    if report_type == "comparison":
+        return build_comparison_report(cursor, user_id, time_period, from_date, to_date, periods)
+    return REPORT_BUILDERS[report_type](cursor, user_id, time_period, from_date, to_date)
+
+def add_bar_labels(ax, bars):
+    # Add value labels
+    for bar in bars:
+        height = bar.get_height()
+        ax.annotate(f'{height:,.2f}',
+                    xy=(bar.get_x() + bar.get_width() / 2, height),
+                    xytext=(0, 3),  # 3 points vertical offset
+                    textcoords="offset points",
+                    ha='center', va='bottom')
+
+def render_report_figure(data):
+    # The chart for a report dataset, shared by the Reports screen and PDF export. Made
+    # without pyplot, whose global state is not thread-safe, so tasks can draw it too.
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    
+    if data["type"] == "category":
+        # Filter out categories with non-positive totals
+        filtered = [(cat, amt) for cat, amt in zip(data["labels"], data["values"]) if amt > 0]
+        categories = [item[0] for item in filtered]
+        amounts = [item[1] for item in filtered]
+        
+        if len(categories) <= 5:
+            # Pie chart for small number of categories
+            ax.pie(amounts, labels=categories, autopct='%1.1f%%', startangle=90)
+            ax.set_title('Expense Distribution by Category')
+        else:
+            # Bar chart for many categories
+            bars = ax.bar(categories, amounts)
+            ax.set_title('Expenses by Category')
+            ax.set_ylabel('Amount (PKR)')
+            ax.tick_params(axis='x', rotation=45)
+            add_bar_labels(ax, bars)
+    
+    elif data["type"] == "period" and data["period"] == "custom":
+        amounts = data["values"]
+        ax.plot(data["labels"], amounts, marker='o')
+        ax.set_title(data["title"])
+        ax.set_ylabel('Amount (PKR)')
+        ax.tick_params(axis='x', rotation=45)
+        
+        # Add value labels
+        for i, amount in enumerate(amounts):
+            ax.annotate(f'{amount:,.2f}',
+                        xy=(i, amount),
+                        xytext=(0, 5),  # 5 points vertical offset
+                        textcoords="offset points",
+                        ha='center', va='bottom')
+    
+    elif data["type"] == "period":
+        bars = ax.bar(data["labels"], data["values"])
+        ax.set_title(data["title"])
+        ax.set_ylabel('Amount (PKR)')
+        if len(data["labels"]) > 5:
+            ax.tick_params(axis='x', rotation=45)
+        add_bar_labels(ax, bars)
+    
+    elif data["type"] == "comparison" and len(data["labels"]) <= 3:
+        # Grouped bars per category for a few periods
+        categories = data["categories"]
+        labels = data["labels"]
+        x = range(len(categories))
+        width = 0.8 / len(labels)
+        
+        for i, label in enumerate(labels):
+            ax.bar([p + i*width for p in x], data["series"][i], width, label=label)
+        
+        ax.set_title(data["title"])
+        ax.set_ylabel('Amount (PKR)')
+        ax.set_xticks([p + width * (len(labels) - 1) / 2 for p in x])
+        ax.set_xticklabels(categories, rotation=45)
+        ax.legend()
+    
+    elif data["type"] == "comparison":
+        # One line per category across many periods
+        labels = data["labels"]
+        series = np.array(data["series"])
+        
+        for i, category in enumerate(data["categories"]):
+            ax.plot(labels, series[:, i], marker='o', label=category)
+        
+        ax.set_title(data["title"])
+        ax.set_ylabel('Amount (PKR)')
+        ax.tick_params(axis='x', rotation=45)
+        ax.legend(fontsize='small')
+    
+    return fig
+
+def render_figure_png(fig):
+    # Rasterize a figure into an in-memory PNG
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=100)
+    return buffer.getvalue()
+
+def write_chart(pdf, chart_png):
+    # Embed a PNG chart at full content width, starting a new page if it does not fit
+    width = pdf.w - pdf.l_margin - pdf.r_margin
+    pdf.image(io.BytesIO(chart_png), x=pdf.l_margin, w=width)
+    pdf.ln(5)
+
+def write_category_report(pdf, data, chart_png=None):
+    if data["empty"]:
+        pdf.cell(200, 10, txt="No expense data available for the selected period", ln=1)
+        return
+    
+    start_date, end_date = data["range"]
+    total = data["total"]
+    
+    # Add section header
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(200, 10, txt=data["title"], ln=1)
+    pdf.set_font("Arial", size=12)
+    
+    # Add summary
+    last_date = end_date - datetime.timedelta(days=1)
+    pdf.cell(200, 10, txt=f"Date Range: {start_date.strftime('%Y-%m-%d')} to {last_date.strftime('%Y-%m-%d')}", ln=1)
+    pdf.cell(200, 10, txt=f"Total Expenses: PKR {total:,.2f}", ln=1)
+    pdf.ln(5)
+    
+    # Create table header
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(90, 10, "Category", border=1)
+    pdf.cell(50, 10, "Amount", border=1)
+    pdf.cell(50, 10, "Percentage", border=1)
+    pdf.ln()
+    pdf.set_font("Arial", size=12)
+    
+    # Add table rows
+    for category, amount, percentage in zip(data["labels"], data["values"], data["percentages"]):
+        pdf.cell(90, 10, category, border=1)
+        pdf.cell(50, 10, f"PKR {amount:,.2f}", border=1)
+        pdf.cell(50, 10, f"{percentage:.1f}%", border=1)
+        pdf.ln()
+    
+    pdf.ln(10)
+    
+    # Add pie chart
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(200, 10, txt="Expense Distribution:", ln=1)
+    
+    if chart_png:
+        write_chart(pdf, chart_png)
+        return
+    
+    pdf.set_font("Arial", size=10)
+    
+    for category, amount, percentage in zip(data["labels"], data["values"], data["percentages"]):
+        pdf.cell(200, 10, txt=f"{category}: {percentage:.1f}% (PKR {amount:,.2f})", ln=1)
+
+def write_period_report(pdf, data, chart_png=None):
+    if data["empty"]:
+        pdf.cell(200, 10, txt="No expense data available for the selected period", ln=1)
+        return
+    
+    start_date, end_date = data["range"]
+    last_date = end_date - datetime.timedelta(days=1)
+    
+    # Add section header
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(200, 10, txt=data["title"], ln=1)
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, txt=f"From: {start_date.strftime('%Y-%m-%d')} To: {last_date.strftime('%Y-%m-%d')}", ln=1)
+    pdf.ln(5)
+    
+    if data["period"] != "custom":
+        # Create table header
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(100, 10, data["column"], border=1)
+        pdf.cell(90, 10, "Amount", border=1)
+        pdf.ln()
+        pdf.set_font("Arial", size=12)
+        
+        # Add table rows
+        for label, amount in zip(data["labels"], data["values"]):
+            pdf.cell(100, 10, label, border=1)
+            pdf.cell(90, 10, f"PKR {amount:,.2f}", border=1)
+            pdf.ln()
+        
+        # Add summary
+        pdf.ln(5)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(100, 10, "Total:", border=1)
+        pdf.cell(90, 10, f"PKR {data['total']:,.2f}", border=1)
+        pdf.ln()
+        
+        if chart_png:
+            pdf.ln(10)
+            write_chart(pdf, chart_png)
+        return
+    
+    # Create table header
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(70, 10, "Date", border=1)
+    pdf.cell(60, 10, "Day", border=1)
+    pdf.cell(60,  10, "Amount", border=1)
+    pdf.ln()
+    pdf.set_font("Arial", size=12)
+    
+    # Add table rows
+    for formatted_date, day_name, amount in zip(data["dates"], data["days"], data["values"]):
+        pdf.cell(70, 10, formatted_date, border=1)
+        pdf.cell(60, 10, day_name, border=1)
+        pdf.cell(60, 10, f"PKR {amount:,.2f}", border=1)
+        pdf.ln()
+    
+    # Add summary
+    pdf.ln(5)
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(130, 10, "Total:", border=1)
+    pdf.cell(60, 10, f"PKR {data['total']:,.2f}", border=1)
+    pdf.ln()
+    
+    if chart_png:
+        pdf.ln(10)
+        write_chart(pdf, chart_png)
+
+def format_change(change, change_pct):
+    # "+PKR 1,200.00" / "-PKR 300.00" and "+12.5%", "new" when nothing was spent before
+    sign = "+" if change > 0 else "-" if change < 0 else ""
+    if np.isnan(change_pct):
+        pct = "new" if change > 0 else "-"
+    else:
+        pct = f"{change_pct:+.1f}%"
+    return f"{sign}PKR {abs(change):,.2f}", pct
+
+def write_change_table(pdf, title, first_label, second_label, rows):
+    # rows of (name, first amount, second amount, change, change %)
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(200, 10, txt=title, ln=1)
+    pdf.set_font("Arial", 'B', 10)
+    pdf.cell(50, 8, "Category", border=1)
+    pdf.cell(40, 8, first_label, border=1)
+    pdf.cell(40, 8, second_label, border=1)
+    pdf.cell(40, 8, "Change", border=1)
+    pdf.cell(20, 8, "%", border=1)
+    pdf.ln()
+    
+    for name, first, second, change, change_pct in rows:
+        pdf.set_font("Arial", 'B' if name == "Total" else '', 10)
+        change_text, pct_text = format_change(change, change_pct)
+        pdf.cell(50, 8, name, border=1)
+        pdf.cell(40, 8, f"PKR {first:,.2f}", border=1)
+        pdf.cell(40, 8, f"PKR {second:,.2f}", border=1)
+        pdf.cell(40, 8, change_text, border=1)
+        pdf.cell(20, 8, pct_text, border=1)
+        pdf.ln()
+    
+    pdf.ln(5)
+
+def write_comparison_report(pdf, data, chart_png=None):
+    if data["empty"]:
+        pdf.cell(200, 10, txt="No expense data available for the selected periods", ln=1)
+        return
+    
+    labels = data["labels"]
+    series = data["series"]
+    totals = data["totals"]
+    categories = data["categories"]
+    
+    # Add section header
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(200, 10, txt=data["title"], ln=1)
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, txt=f"Comparing {len(labels)} periods: {labels[0]} to {labels[-1]}", ln=1)
+    pdf.ln(5)
+    
+    # Latest period against the previous one
+    rows = list(zip(categories, series[-2], series[-1], data["change"], data["change_pct"]))
+    rows.append(("Total", totals[-2], totals[-1], data["total_change"][-1], data["total_change_pct"][-1]))
+    write_change_table(pdf, "Period over period", labels[-2], labels[-1], rows)
+    
+    # Latest period against the same period last year
+    year_ago = data["year_ago"]
+    if year_ago is not None:
+        total_change, total_change_pct = period_changes(np.array(totals[-1]), np.array(totals[year_ago]))
+        rows = list(zip(categories, series[year_ago], series[-1], data["yoy_change"], data["yoy_change_pct"]))
+        rows.append(("Total", totals[year_ago], totals[-1], float(total_change), float(total_change_pct)))
+        write_change_table(pdf, "Year over year", labels[year_ago], labels[-1], rows)
+    
+    # Biggest changes since the previous period
+    if data["movers"]:
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(200, 10, txt="Top movers", ln=1)
+        pdf.set_font("Arial", size=10)
+        for category, change, change_pct in data["movers"]:
+            change_text, pct_text = format_change(change, change_pct)
+            pdf.cell(200, 8, txt=f"{category}: {change_text} ({pct_text})", ln=1)
+        pdf.ln(5)
+    
+    # Totals of every period
+    if len(labels) > 2:
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(200, 10, txt="Totals by period", ln=1)
+        pdf.set_font("Arial", 'B', 10)
+        pdf.cell(50, 8, "Period", border=1)
+        pdf.cell(40, 8, "Total", border=1)
+        pdf.cell(40, 8, "Change", border=1)
+        pdf.cell(20, 8, "%", border=1)
+        pdf.ln()
+        pdf.set_font("Arial", size=10)
+        
+        for i, label in enumerate(labels):
+            pdf.cell(50, 8, label, border=1)
+            pdf.cell(40, 8, f"PKR {totals[i]:,.2f}", border=1)
+            if i == 0:
+                pdf.cell(40, 8, "", border=1)
+                pdf.cell(20, 8, "", border=1)
+            else:
+                change_text, pct_text = format_change(data["total_change"][i - 1], data["total_change_pct"][i - 1])
+                pdf.cell(40, 8, change_text, border=1)
+                pdf.cell(20, 8, pct_text, border=1)
+            pdf.ln()
+    
+    if chart_png:
+        pdf.ln(10)
+        write_chart(pdf, chart_png)
+
+REPORT_WRITERS = {
+    "category": write_category_report,
+    "period": write_period_report,
+    "comparison": write_comparison_report,
+}
+
+def create_report_pdf(username, data, chart_png=None):
+    # Create a new PDF document
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    
+    # Add title
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(200, 10, txt="Expense Report", ln=1, align='C')
+    pdf.set_font("Arial", size=12)
+    
+    # Add user info and date
+    pdf.cell(200, 10, txt=f"User: {username}", ln=1)
+    pdf.cell(200, 10, txt=f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=1)
+    pdf.ln(5)
+    
+    # Add report parameters
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(200, 10, txt="Report Parameters:", ln=1)
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, txt=f"Report Type: {data['type'].capitalize()}", ln=1)
+    pdf.cell(200, 10, txt=f"Time Period: {data['period'].capitalize()}", ln=1)
+    
+    if data["period"] == "custom":
+        start_date, end_date = data["range"]
+        last_date = end_date - datetime.timedelta(days=1)
+        pdf.cell(200, 10, txt=f"From: {start_date.strftime('%Y-%m-%d')} To: {last_date.strftime('%Y-%m-%d')}", ln=1)
+    
+    pdf.ln(10)
+    
+    REPORT_WRITERS[data["type"]](pdf, data, chart_png)
+    
+    return pdf
+
+class ReportCancelled(Exception):
+    pass
+
+class StreamingPDF:
+    # Minimal PDF writer for plain text tables. Every finished page is written to
+    # the output file straight away, so memory use is bounded by a single page
+    # however long the document gets. Units are millimetres on an A4 page, the
+    # same as FPDF's defaults, and text uses the built-in Helvetica fonts.
+    PAGE_WIDTH = 210
+    PAGE_HEIGHT = 297
+    MARGIN = 10
+    SCALE = 72 / 25.4
+    
+    def __init__(self, output):
+        self.output = output
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+        # Objects 1-4 are the catalog, the page tree and the two fonts, written last
+        self.next_id = 5
+        self.content = None
+        self.font = "F1"
+        self.font_size = 12
+        self.x = self.MARGIN
+        self.y = self.MARGIN
+        self.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    
+    def write(self, data):
+        self.output.write(data)
+        self.position += len(data)
+    
+    def write_object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        self.write(f"{object_id} 0 obj\n".encode() + body + b"\nendobj\n")
+    
+    def add_page(self):
+        if self.content is not None:
+            self.finish_page()
+        self.content = []
+        self.x = self.MARGIN
+        self.y = self.MARGIN
+    
+    def fits(self, height):
+        return self.y + height <= self.PAGE_HEIGHT - self.MARGIN
+    
+    def set_font(self, bold=False, size=12):
+        self.font = "F2" if bold else "F1"
+        self.font_size = size
+    
+    def cell(self, w, h, text="", border=0, ln=0):
+        k = self.SCALE
+        if border:
+            self.content.append(f"{self.x * k:.2f} {(self.PAGE_HEIGHT - self.y) * k:.2f} {w * k:.2f} {-h * k:.2f} re S")
+        if text:
+            escaped = str(text).replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            baseline = self.y + h / 2 + 0.3 * self.font_size / k
+            self.content.append(
+                f"BT /{self.font} {self.font_size} Tf {(self.x + 1) * k:.2f} {(self.PAGE_HEIGHT - baseline) * k:.2f} Td ({escaped}) Tj ET"
+            )
+        self.x += w
+        if ln:
+            self.ln(h)
+    
+    def ln(self, h):
+        self.x = self.MARGIN
+        self.y += h
+    
+    def finish_page(self):
+        stream = zlib.compress("\n".join(self.content).encode("latin-1", "replace"))
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        
+        self.write_object(content_id, f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode() + stream + b"\nendstream")
+        self.write_object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R "
+            f"/MediaBox [0 0 {self.PAGE_WIDTH * self.SCALE:.2f} {self.PAGE_HEIGHT * self.SCALE:.2f}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode())
+        
+        self.page_ids.append(page_id)
+        self.content = None
+    
+    def close(self):
+        if self.content is not None:
+            self.finish_page()
+        
+        for object_id, font in ((3, "Helvetica"), (4, "Helvetica-Bold")):
+            self.write_object(object_id, f"<< /Type /Font /Subtype /Type1 /BaseFont /{font} /Encoding /WinAnsiEncoding >>".encode())
+        
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self.write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        self.write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        
+        xref_position = self.position
+        lines = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[object_id]:010d} 00000 n \n" for object_id in range(1, self.next_id)]
+        lines.append(f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n")
+        self.write("".join(lines).encode())
+
+def use_streaming_export(report_type, time_period, from_date, to_date):
+    # Long custom daily reports are streamed page by page instead of built in memory
+    if report_type != "period" or time_period != "custom":
+        return False
+    start, end = custom_range(from_date, to_date)
+    return (end - start).days > STREAMING_EXPORT_DAYS
+
+def expense_day_count(cursor, user_id, start, end):
+    # Days with expenses in [start, end), the rows write_daily_report_stream reports progress in
+    cursor.execute('''
+        SELECT COUNT(DISTINCT date) 
+        FROM expenses 
+        WHERE user_id=? AND date >= ? AND date < ? AND is_deleted=0
+    ''', (user_id,) + sql_range(start, end))
+    return cursor.fetchone()[0]
+
+def write_daily_report_stream(cursor, user_id, username, from_date, to_date, output, progress=None):
+    # Daily expenses table streamed from the cursor with a repeated header and a subtotal on every page.
+    # progress(rows, pages) is called as rows are written and may raise ReportCancelled to stop.
+    start, end = custom_range(from_date, to_date)
+    row_height = 10
+    
+    pdf = StreamingPDF(output)
+    pdf.add_page()
+    
+    # Add title
+    pdf.set_font(bold=True, size=16)
+    pdf.cell(190, 10, "Expense Report", ln=1)
+    pdf.set_font(size=12)
+    
+    # Add user info and report parameters
+    pdf.cell(190, 10, f"User: {username}", ln=1)
+    pdf.cell(190, 10, f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=1)
+    pdf.cell(190, 10, "Report Type: Period    Time Period: Custom", ln=1)
+    pdf.ln(5)
+    
+    pdf.set_font(bold=True, size=14)
+    pdf.cell(190, 10, "Daily Expenses", ln=1)
+    pdf.set_font(size=12)
+    pdf.cell(190, 10, f"From: {from_date} To: {to_date}", ln=1)
+    pdf.ln(5)
+    
+    def table_header():
+        pdf.set_font(bold=True)
+        pdf.cell(70, row_height, "Date", border=1)
+        pdf.cell(60, row_height, "Day", border=1)
+        pdf.cell(60, row_height, "Amount", border=1, ln=1)
+        pdf.set_font()
+    
+    def subtotal_row(label, amount):
+        pdf.set_font(bold=True)
+        pdf.cell(130, row_height, label, border=1)
+        pdf.cell(60, row_height, f"PKR {amount:,.2f}", border=1, ln=1)
+        pdf.set_font()
+    
+    table_header()
+    
+    cursor.execute('''
+        SELECT date, SUM(amount) 
+        FROM expenses 
+        WHERE user_id=? AND date >= ? AND date < ? AND is_deleted=0
+        GROUP BY date 
+        ORDER BY date
+    ''', (user_id,) + sql_range(start, end))
+    
+    total = 0
+    page_total = 0
+    rows = 0
+    
+    for date_str, amount in cursor:
+        # Keep room for this row, the page subtotal and the grand total so the
+        # totals always end the last data page
+        if not pdf.fits(3 * row_height):
+            subtotal_row("Page subtotal:", page_total)
+            pdf.add_page()
+            table_header()
+            page_total = 0
+        
+        date = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+        pdf.cell(70, row_height, date.strftime("%d %b %Y"), border=1)
+        pdf.cell(60, row_height, date.strftime("%A"), border=1)
+        pdf.cell(60, row_height, f"PKR {amount:,.2f}", border=1, ln=1)
+        
+        total += amount
+        page_total += amount
+        rows += 1
+        
+        if progress and rows % 100 == 0:
+            progress(rows, len(pdf.page_ids))
+    
+    if rows == 0:
+        pdf.cell(190, 10, "No expense data available for the selected period", ln=1)
+    else:
+        subtotal_row("Page subtotal:", page_total)
+        subtotal_row("Total:", total)
+    
+    pdf.close()
+    
+    if progress:
+        progress(rows, len(pdf.page_ids))
+    return rows
+
+# Read-only connection of a batch report worker process
+batch_connection = None
+
+def connect_read_only(database):
+    # as_uri() percent-encodes characters such as "?", "#" and "%" in the path
+    return sqlite3.connect(pathlib.Path(database).resolve().as_uri() + "?mode=ro", uri=True)
+
+def init_batch_worker(database):
+    global batch_connection
+    # Workers only rasterize charts, never show them
+    plt.switch_backend("Agg")
+    batch_connection = connect_read_only(database)
+
+def write_user_report(cursor, user_id, username, report_type, time_period, from_date, to_date, output_dir,
+                      compare_periods):
+    # Write one report for one user and return its path
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", username)
+    
+    if use_streaming_export(report_type, time_period, from_date, to_date):
+        file_path = os.path.join(output_dir, f"{user_id}_{safe_name}_{report_type}_{time_period}_{from_date.replace('-', '')}.pdf")
+        with open(file_path, "wb") as output:
+            write_daily_report_stream(cursor, user_id, username, from_date, to_date, output)
+        return file_path
+    
+    data = build_report(cursor, user_id, report_type, time_period, from_date, to_date, compare_periods)
+    
+    chart_png = None
+    if not data["empty"]:
+        chart_png = render_figure_png(render_report_figure(data))
+    
+    pdf = create_report_pdf(username, data, chart_png)
+    
+    start_date = data["range"][0].strftime("%Y%m%d")
+    file_path = os.path.join(output_dir, f"{user_id}_{safe_name}_{report_type}_{time_period}_{start_date}.pdf")
+    pdf.output(file_path)
+    return file_path
+
+def generate_user_reports(job):
+    # Write every requested report for one user, runs inside a worker process.
+    # A failed report is returned as an error and does not stop the others.
+    user_id, username, report_types, periods, from_date, to_date, output_dir, compare_periods = job
+    cursor = batch_connection.cursor()
+    files = []
+    errors = []
+    
+    for report_type in report_types:
+        for time_period in periods:
+            try:
+                files.append(write_user_report(cursor, user_id, username, report_type, time_period,
+                                               from_date, to_date, output_dir, compare_periods))
+            except Exception as e:
+                errors.append(f"{report_type} {time_period}: {e}")
+    
+    return username, files, errors
+
+def run_batch_reports(database, usernames, report_types, periods, from_date=None, to_date=None,
+                      output_dir="reports", workers=None, compare_periods=COMPARISON_PERIODS):
+    # Generate PDF statements for many users without the GUI, one user per task.
+    # Returns the number of failures (unknown users and reports that could not be written).
+    conn = connect_read_only(database)
+    cursor = conn.cursor()
+    
+    if usernames:
+        placeholders = ",".join("?" * len(usernames))
+        cursor.execute(f"SELECT user_id, username FROM users WHERE username IN ({placeholders}) ORDER BY user_id", usernames)
+    else:
+        cursor.execute("SELECT user_id, username FROM users ORDER BY user_id")
+    
+    users = cursor.fetchall()
+    conn.close()
+    
+    missing = set(usernames or ()) - {username for _, username in users}
+    for username in sorted(missing):
+        print(f"Unknown user: {username}", file=sys.stderr)
+    failed = len(missing)
+    
+    os.makedirs(output_dir, exist_ok=True)
+    
+    jobs = [(user_id, username, report_types, periods, from_date, to_date, output_dir, compare_periods)
+            for user_id, username in users]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+    
+    started = time.perf_counter()
+    written = 0
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker, initargs=(database,)) as pool:
+        for username, files, errors in pool.map(generate_user_reports, jobs, chunksize=chunksize):
+            written += len(files)
+            failed += len(errors)
+            print(f"{username}: {len(files)} report(s)")
+            for error in errors:
+                print(f"{username}: failed {error}", file=sys.stderr)
+    
+    print(f"Wrote {written} report(s) for {len(users)} user(s) to {output_dir} in {time.perf_counter() - started:.1f}s")
+    if failed:
+        print(f"{failed} failure(s)", file=sys.stderr)
+    return failed
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Smart Expense Tracker")
+    parser.add_argument("--database", default=DATABASE_FILE, help="SQLite database file")
+    parser.add_argument("--check-query-plans", action="store_true",
+                        help="check that the app's queries use their indexes and exit")
+    
+    parser.add_argument("--slow-query-ms", type=float, default=SLOW_QUERY_MS,
+                        help="log statements slower than this many milliseconds")
+    parser.add_argument("--slow-query-log", default=SLOW_QUERY_LOG,
+                        help="also append the slow statements to this file (default: no file)")
+    
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write a Chrome trace of the session's screens and queries to FILE on exit")
+    
+    bench = parser.add_argument_group("benchmarks")
+    bench.add_argument("--generate-data", type=int, metavar="EXPENSES",
+                       help="fill a new --database with this many synthetic expenses and exit")
+    bench.add_argument("--seed", type=int, default=0, help="random seed of the synthetic data")
+    bench.add_argument("--synthetic-users", type=int,
+                       help=f"users in the synthetic data (default: one per {SYNTHETIC_EXPENSES_PER_USER} expenses)")
+    bench.add_argument("--benchmark", action="store_true", help="time the screen queries on --database and exit")
+    bench.add_argument("--benchmark-repeats", type=int, default=BENCHMARK_REPEATS, help="runs of each query")
+    bench.add_argument("--benchmark-output", help="write the benchmark results to this JSON file")
+    
+    batch = parser.add_argument_group("batch reports")
+    batch.add_argument("--batch-reports", action="store_true",
+                       help="generate PDF reports without starting the GUI")
+    batch.add_argument("--users", help="comma separated usernames (default: all users)")
+    batch.add_argument("--reports", default="category,period,comparison",
+                       help="comma separated report types: " + ", ".join(REPORT_BUILDERS))
+    batch.add_argument("--periods", default="month",
+                       help="comma separated time periods: week, month, quarter, year, fiscal, custom")
+    batch.add_argument("--compare-periods", type=int, default=COMPARISON_PERIODS,
+                       help=f"periods covered by comparison reports (2-{MAX_COMPARISON_PERIODS})")
+    batch.add_argument("--from-date", help="start of a custom period (YYYY-MM-DD)")
+    batch.add_argument("--to-date", help="end of a custom period (YYYY-MM-DD)")
+    batch.add_argument("--output", default="reports", help="directory for the generated PDFs")
+    batch.add_argument("--workers", type=int, help="worker processes (default: number of CPUs)")
+    
+    args = parser.parse_args(argv)
+    
+    args.users = [name.strip() for name in args.users.split(",") if name.strip()] if args.users else []
+    args.reports = [name.strip() for name in args.reports.split(",") if name.strip()]
+    args.periods = [name.strip() for name in args.periods.split(",") if name.strip()]
+    
+    for report_type in args.reports:
+        if report_type not in REPORT_BUILDERS:
+            parser.error(f"unknown report type: {report_type}")
+    if args.generate_data is not None and args.generate_data < 1:
+        parser.error("--generate-data needs a positive number of expenses")
+    if args.benchmark_repeats < 1:
+        parser.error("--benchmark-repeats must be at least 1")
+    if not 2 <= args.compare_periods <= MAX_COMPARISON_PERIODS:
+        parser.error(f"--compare-periods must be between 2 and {MAX_COMPARISON_PERIODS}")
+    for time_period in args.periods:
+        if time_period not in PERIOD_BREAKDOWN and time_period != "custom":
+            parser.error(f"unknown time period: {time_period}")
+        if time_period == "custom":
+            try:
+                custom_range(args.from_date or "", args.to_date or "")
+            except ValueError:
+                parser.error("custom period needs valid --from-date and --to-date (YYYY-MM-DD)")
+    
+    return args
+
+def load_monthly_history(cursor, user_id):
+    # Per-month, per-category totals for the user's whole history, read from the rollup
+    cursor.execute('''
+        SELECT month, category, total 
+        FROM category_monthly_totals 
+        WHERE user_id=?
+    ''', (user_id,))
+    
+    return pd.DataFrame(cursor.fetchall(), columns=["month", "category", "amount"])
+
+def forecast_spending(history, months_ahead=3, window=3, trend_months=12, start_month=None):
+    # Project spending per category for the months following the history.
+    #
+    # history is either monthly totals (month, category, amount) as returned by
+    # load_monthly_history, or raw expense rows (date, category, amount).
+    # Every category is handled at once on a months x categories matrix:
+    #   - seasonality: average of each calendar month relative to the category mean
+    #     (only used once two full years of history are available)
+    #   - level: moving average of the last `window` deseasonalized months
+    #   - trend: least-squares slope over the last `trend_months` deseasonalized months
+    # The result has one row per forecast month ("YYYY-MM") and one column per category.
+    if history.empty:
+        return pd.DataFrame()
+    
+    if "month" not in history.columns:
+        history = history.assign(month=history["date"].str.slice(0, 7))
+    
+    matrix = history.pivot_table(index="month", columns="category", values="amount", aggfunc="sum", fill_value=0.0)
+    
+    # Fill months without any spending so that positions match calendar months
+    first = pd.Period(matrix.index.min(), freq="M")
+    last = pd.Period(start_month, freq="M") - 1 if start_month else pd.Period(matrix.index.max(), freq="M")
+    months = pd.period_range(first, last, freq="M")
+    matrix = matrix.reindex(months.strftime("%Y-%m"), fill_value=0.0)
+    
+    values = matrix.to_numpy(dtype=float)
+    calendar_months = months.month.to_numpy() - 1
+    
+    # Seasonal index, 12 x categories
+    seasonal = np.ones((12, values.shape[1]))
+    if len(months) >= 24:
+        sums = np.zeros((12, values.shape[1]))
+        np.add.at(sums, calendar_months, values)
+        counts = np.bincount(calendar_months, minlength=12)[:, None]
+        monthly_mean = sums / np.maximum(counts, 1)
+        overall_mean = values.mean(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            seasonal = np.where(overall_mean > 0, monthly_mean / overall_mean, 1.0)
+        seasonal = np.where((counts > 0) & (seasonal > 0), seasonal, 1.0)
+    
+    deseasonalized = values / seasonal[calendar_months]
+    
+    level = deseasonalized[-window:].mean(axis=0)
+    
+    recent = deseasonalized[-trend_months:]
+    if len(recent) >= 2:
+        x = np.arange(len(recent), dtype=float)
+        x -= x.mean()
+        slope = (x[:, None] * (recent - recent.mean(axis=0))).sum(axis=0) / (x ** 2).sum()
+    else:
+        slope = np.zeros(values.shape[1])
+    
+    # The moving average sits in the middle of its window
+    window_used = min(window, len(deseasonalized))
+    steps = np.arange(1, months_ahead + 1) + (window_used - 1) / 2
+    future = pd.period_range(last + 1, periods=months_ahead, freq="M")
+    
+    projection = (level + steps[:, None] * slope) * seasonal[future.month.to_numpy() - 1]
+    
+    return pd.DataFrame(np.clip(projection, 0, None), index=future.strftime("%Y-%m"), columns=matrix.columns)
+
+# Running per-category rollups kept up to date by triggers on expenses. The bodies
+# add or remove one expense row (NEW or OLD) from the monthly totals and from the
+# count / sum / sum of squares used for expense-level statistics.
+ROLLUP_ADD_SQL = '''
+    INSERT INTO category_monthly_totals (user_id, category, month, total, count)
+    VALUES ({row}.user_id, {row}.category, substr({row}.date, 1, 7), {row}.amount, 1)
+    ON CONFLICT (user_id, category, month) DO UPDATE SET total = total + excluded.total, count = count + 1;
+    INSERT INTO category_stats (user_id, category, n, total, total_sq)
+    VALUES ({row}.user_id, {row}.category, 1, {row}.amount, {row}.amount * {row}.amount)
+    ON CONFLICT (user_id, category) DO UPDATE SET
+        n = n + 1, total = total + excluded.total, total_sq = total_sq + excluded.total_sq;
+'''
+
+ROLLUP_REMOVE_SQL = '''
+    UPDATE category_monthly_totals SET total = total - {row}.amount, count = count - 1
+    WHERE user_id = {row}.user_id AND category = {row}.category AND month = substr({row}.date, 1, 7);
+    DELETE FROM category_monthly_totals
+    WHERE user_id = {row}.user_id AND category = {row}.category AND month = substr({row}.date, 1, 7) AND count <= 0;
+    UPDATE category_stats SET
+        n = n - 1, total = total - {row}.amount, total_sq = total_sq - {row}.amount * {row}.amount
+    WHERE user_id = {row}.user_id AND category = {row}.category;
+'''
+
+def migrate_category_rollups(conn):
+    conn.executescript(f'''
+        BEGIN;
+        
+        CREATE TABLE IF NOT EXISTS category_monthly_totals (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            month TEXT NOT NULL,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, category, month)
+        );
+        
+        CREATE TABLE IF NOT EXISTS category_stats (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            total REAL NOT NULL,
+            total_sq REAL NOT NULL,
+            PRIMARY KEY (user_id, category)
+        );
+        
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_insert AFTER INSERT ON expenses
+        WHEN NEW.is_deleted = 0
+        BEGIN {ROLLUP_ADD_SQL.format(row="NEW")} END;
+        
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_delete AFTER DELETE ON expenses
+        WHEN OLD.is_deleted = 0
+        BEGIN {ROLLUP_REMOVE_SQL.format(row="OLD")} END;
+        
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_update_old
+        AFTER UPDATE OF user_id, amount, category, date, is_deleted ON expenses
+        WHEN OLD.is_deleted = 0
+        BEGIN {ROLLUP_REMOVE_SQL.format(row="OLD")} END;
+        
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_update_new
+        AFTER UPDATE OF user_id, amount, category, date, is_deleted ON expenses
+        WHEN NEW.is_deleted = 0
+        BEGIN {ROLLUP_ADD_SQL.format(row="NEW")} END;
+        
+        -- Backfill from existing expenses
+        DELETE FROM category_monthly_totals;
+        DELETE FROM category_stats;
+        
+        INSERT INTO category_monthly_totals (user_id, category, month, total, count)
+        SELECT user_id, category, substr(date, 1, 7), SUM(amount), COUNT(*)
+        FROM expenses WHERE is_deleted = 0
+        GROUP BY user_id, category, substr(date, 1, 7);
+        
+        INSERT INTO category_stats (user_id, category, n, total, total_sq)
+        SELECT user_id, category, COUNT(*), SUM(amount), SUM(amount * amount)
+        FROM expenses WHERE is_deleted = 0
+        GROUP BY user_id, category;
+        
+        COMMIT;
+    ''')
+
+def description_tokens(description):
+    # Lower-case words of a description used by the category model, numbers are ignored
+    return re.findall(r"[a-z][a-z0-9]+", (description or "").lower())
+
+def migrate_category_tokens(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS category_tokens (
+            user_id INTEGER NOT NULL,
+            token TEXT NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, token, category)
+        )
+    ''')
+    
+    # Backfill from existing descriptions in one pass
+    counts = {}
+    for user_id, category, description in conn.execute('''
+        SELECT user_id, category, description FROM expenses 
+        WHERE is_deleted=0 AND description IS NOT NULL AND description != ''
+    '''):
+        for token in set(description_tokens(description)):
+            key = (user_id, token, category)
+            counts[key] = counts.get(key, 0) + 1
+    
+    conn.execute("DELETE FROM category_tokens")
+    conn.executemany('''
+        INSERT INTO category_tokens (user_id, token, category, count) VALUES (?, ?, ?, ?)
+    ''', [key + (count,) for key, count in counts.items()])
+
+def record_category_tokens(cursor, user_id, rows):
+    # Count the description tokens of saved (category, description) rows
+    params = [(user_id, token, category) for category, description in rows
+              for token in set(description_tokens(description))]
+    cursor.executemany('''
+        INSERT INTO category_tokens (user_id, token, category, count) VALUES (?, ?, ?, 1)
+        ON CONFLICT (user_id, token, category) DO UPDATE SET count = count + 1
+    ''', params)
+
+class CategoryModel:
+    # Token -> category frequencies from the user's past expense descriptions. Every known
+    # word of a description votes with its category distribution, held as a tokens x categories matrix
+    def __init__(self, counts=()):
+        self.counts = {}
+        for token, category, count in counts:
+            self.counts.setdefault(token, {})[category] = count
+        self.matrix = None
+    
+    def learn(self, category, description):
+        for token in set(description_tokens(description)):
+            categories = self.counts.setdefault(token, {})
+            categories[category] = categories.get(category, 0) + 1
+        self.matrix = None
+    
+    def build(self):
+        # Rebuilt lazily after learning, so a burst of saves costs one rebuild
+        self.tokens = {token: i for i, token in enumerate(self.counts)}
+        self.categories = sorted({category for categories in self.counts.values() for category in categories})
+        columns = {category: i for i, category in enumerate(self.categories)}
+        
+        counts = np.zeros((len(self.tokens), len(self.categories)))
+        for token, categories in self.counts.items():
+            for category, count in categories.items():
+                counts[self.tokens[token], columns[category]] = count
+        
+        self.matrix = counts / counts.sum(axis=1, keepdims=True)
+    
+    def scores(self, descriptions):
+        # Rows x categories votes of the known words
+        if self.matrix is None:
+            self.build()
+        
+        rows, ids = [], []
+        for row, description in enumerate(descriptions):
+            for token in description_tokens(description):
+                if token in self.tokens:
+                    rows.append(row)
+                    ids.append(self.tokens[token])
+        
+        scores = np.zeros((len(descriptions), len(self.categories)))
+        np.add.at(scores, np.array(rows, dtype=int), self.matrix[np.array(ids, dtype=int)])
+        return scores
+    
+    def suggest(self, description, allowed=None):
+        # Most likely category for one description, None if none of its words are known
+        return self.classify([description], allowed, None)[0]
+    
+    def classify(self, descriptions, allowed=None, default=None):
+        # Most likely category for every description in one vectorized pass. allowed limits
+        # the result to existing categories; rows without a vote for any of them get `default`.
+        if not self.counts or not len(descriptions):
+            return [default] * len(descriptions)
+        
+        scores = self.scores(descriptions)
+        if allowed is not None:
+            allowed = set(allowed)
+            scores[:, [category not in allowed for category in self.categories]] = 0
+        
+        best = np.where(scores.max(axis=1) > 0, scores.argmax(axis=1), len(self.categories))
+        return list(np.array(self.categories + [default], dtype=object)[best])
+
+def load_category_model(cursor, user_id):
+    cursor.execute("SELECT token, category, count FROM category_tokens WHERE user_id=?", (user_id,))
+    return CategoryModel(cursor.fetchall())
+
+def prepare_expense_import(frame, model, categories):
+    # Clean imported rows (date, amount, optional description / category) and fill missing
+    # categories from the model in one pass. Returns the rows, with a "classified" flag on
+    # those categorized automatically, and how many rows were skipped as invalid.
+    frame = frame.rename(columns=lambda column: str(column).strip().lower())
+    for column in ("description", "category"):
+        if column not in frame.columns:
+            frame[column] = ""
+    
+    dates = pd.to_datetime(frame["date"], format="%Y-%m-%d", errors="coerce")
+    amounts = pd.to_numeric(frame["amount"], errors="coerce")
+    valid = dates.notna() & (amounts > 0)
+    
+    rows = pd.DataFrame({
+        "date": dates.dt.strftime("%Y-%m-%d"),
+        "amount": amounts,
+        "description": frame["description"].fillna("").astype(str).str.strip(),
+        "category": frame["category"].fillna("").astype(str).str.strip(),
+    })[valid]
+    
+    rows["classified"] = rows["category"] == ""
+    missing = rows["classified"].to_numpy()
+    default = "Others" if "Others" in categories else (categories[0] if categories else "Others")
+    rows.loc[missing, "category"] = model.classify(rows.loc[missing, "description"].tolist(), categories, default)
+    
+    return rows, int((~valid).sum())
+
+def migrate_duplicate_index(conn):
+    # Duplicate lookups match on user, amount and normalized description, then a date window
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_duplicate 
+        ON expenses (user_id, amount, lower(trim(coalesce(description, ''))), date) 
+        WHERE is_deleted = 0
+    ''')
+
+def find_duplicates(cursor, user_id, amount, date, description, window=DUPLICATE_WINDOW_DAYS):
+    # Existing expenses that look like the same one entered again, a single index lookup
+    cursor.execute('''
+        SELECT expense_id, date, category, amount, description 
+        FROM expenses 
+        WHERE user_id=? AND amount=? AND lower(trim(coalesce(description, ''))) = lower(trim(coalesce(?, '')))
+            AND date >= date(?, ?) AND date <= date(?, ?) AND is_deleted=0
+        ORDER BY date
+    ''', (user_id, amount, description, date, f"-{window} days", date, f"+{window} days"))
+    
+    return cursor.fetchall()
+
+def find_duplicate_pairs(cursor, user_id, window=DUPLICATE_WINDOW_DAYS):
+    # Every (duplicate, original) pair in the user's history from one self-join over the
+    # duplicate index; the original is the earlier (or, on the same day, older) expense
+    cursor.execute('''
+        SELECT b.expense_id, b.date, b.category, b.amount, b.description, a.expense_id, a.date 
+        FROM expenses a 
+        JOIN expenses b ON b.user_id = a.user_id AND b.amount = a.amount 
+            AND lower(trim(coalesce(b.description, ''))) = lower(trim(coalesce(a.description, ''))) 
+            AND b.date >= a.date AND b.date <= date(a.date, ?) AND b.is_deleted = 0 
+            AND (b.date > a.date OR b.expense_id > a.expense_id) 
+        WHERE a.user_id=? AND a.is_deleted=0 
+        ORDER BY b.date DESC, b.expense_id DESC
+    ''', (f"+{window} days", user_id))
+    
+    return cursor.fetchall()
+
+def migrate_trash_retention(conn):
+    # ALTER TABLE would otherwise commit on its own, leaving the columns behind without the
+    # version bump if a later step fails. migrate_database commits.
+    conn.execute("BEGIN")
+    conn.execute("ALTER TABLE expenses ADD COLUMN deleted_at TEXT")
+    conn.execute(f"ALTER TABLE users ADD COLUMN trash_retention_days INTEGER DEFAULT {TRASH_RETENTION_DAYS}")
+    
+    # Items already in the trash start their retention period now
+    conn.execute("UPDATE expenses SET deleted_at = datetime('now') WHERE is_deleted = 1")
+    
+    # Stamp deletions (and clear the stamp on restore) whichever code path moves a row
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_deleted_at AFTER UPDATE OF is_deleted ON expenses 
+        WHEN NEW.is_deleted != OLD.is_deleted 
+        BEGIN 
+            UPDATE expenses SET deleted_at = CASE WHEN NEW.is_deleted = 1 THEN datetime('now') END 
+            WHERE expense_id = NEW.expense_id; 
+        END
+    ''')
+    
+    # Trash paging and purging only touch deleted rows
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_trash 
+        ON expenses (user_id, deleted_at, expense_id) 
+        WHERE is_deleted = 1
+    ''')
+
+def purge_trash(conn, user_id=None, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE, stop=None):
+    # Permanently delete trashed expenses past their owner's retention period, or every
+    # trashed expense of user_id if given. Works in small committed batches so that the
+    # write lock is never held for long; stop is an optional threading.Event.
+    # The shares of a purged expense go with it (which settles them in friend_balances)
+    # and goal contributions made through it keep their amount but lose the link.
+    if user_id is None:
+        query = '''
+            SELECT e.expense_id FROM users u 
+            JOIN expenses e ON e.user_id = u.user_id AND e.is_deleted = 1 
+                AND e.deleted_at < datetime('now', '-' || u.trash_retention_days || ' days') 
+            WHERE u.trash_retention_days > 0 
+            LIMIT ?
+        '''
+        params = (batch_size,)
+    else:
+        query = "SELECT expense_id FROM expenses WHERE user_id=? AND is_deleted=1 LIMIT ?"
+        params = (user_id, batch_size)
+    
+    purged = 0
+    while not (stop and stop.is_set()):
+        ids = [row[0] for row in conn.execute(query, params).fetchall()]
+        if ids:
+            marks = ", ".join("?" * len(ids))
+            conn.execute(f"DELETE FROM shared_expenses WHERE expense_id IN ({marks})", ids)
+            conn.execute(f"UPDATE goal_contributions SET expense_id = NULL WHERE expense_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM expenses WHERE expense_id IN ({marks})", ids)
+        conn.commit()
+        purged += len(ids)
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+    
+    return purged
+
+def load_trash_page(cursor, user_id, before=None, page_size=TRASH_PAGE_SIZE):
+    # One page of the trash, most recently deleted first. before is the (deleted_at, expense_id)
+    # of the last row of the previous page, so every page is a single index range scan.
+    query = '''
+        SELECT expense_id, date, category, amount, description, deleted_at 
+        FROM expenses 
+        WHERE user_id=? AND is_deleted=1
+    '''
+    params = [user_id]
+    if before:
+        query += " AND (deleted_at, expense_id) < (?, ?)"
+        params.extend(before)
+    query += " ORDER BY deleted_at DESC, expense_id DESC LIMIT ?"
+    params.append(page_size)
+    
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+def month_range(month_year):
+    # Query parameters for "date >= ? AND date < ?" covering a "YYYY-MM" month
+    start = datetime.datetime.strptime(month_year, "%Y-%m").date()
+    return sql_range(start, add_months(start, 1))
+
+def expense_list_query(user_id, period="all", category=None, search=None, day=None):
+    # Query and parameters for the View Expenses list
+    query = '''
+        SELECT expense_id, date, category, amount, description 
+        FROM expenses 
+        WHERE user_id=? AND is_deleted=0
+    '''
+    params = [user_id]
+    
+    day = day or datetime.date.today()
+    
+    if period == "month":
+        query += " AND date >= ? AND date < ?"
+        params.extend(sql_range(*period_range("month", day)))
+    elif period == "week":
+        query += " AND date >= ?"
+        params.append(period_start("week", day).strftime("%Y-%m-%d"))
+    elif period == "today":
+        query += " AND date=?"
+        params.append(day.strftime("%Y-%m-%d"))
+    
+    if category and category != "All Categories":
+        query += " AND category=?"
+        params.append(category)
+    
+    if search:
+        query += " AND (category LIKE ? OR description LIKE ?)"
+        params.extend([f"%{search}%", f"%{search}%"])
+    
+    query += " ORDER BY date DESC, expense_id DESC"
+    return query, params
+
+def recent_expenses(cursor, user_id, limit=10):
+    cursor.execute('''
+        SELECT date, category, amount, description 
+        FROM expenses 
+        WHERE user_id=? AND is_deleted=0
+        ORDER BY date DESC, expense_id DESC 
+        LIMIT ?
+    ''', (user_id, limit))
+    
+    return cursor.fetchall()
+
+def month_total(cursor, user_id, month_year):
+    cursor.execute('''
+        SELECT COALESCE(SUM(amount), 0) 
+        FROM expenses 
+        WHERE user_id=? AND date >= ? AND date < ? AND is_deleted=0
+    ''', (user_id,) + month_range(month_year))
+    
+    return cursor.fetchone()[0]
+
+def budget_history(cursor, user_id, limit=12):
+    # (month_year, budget, actual spending) for the latest budgeted months
+    cursor.execute('''
+        SELECT month_year, amount 
+        FROM budgets 
+        WHERE user_id=?
+        ORDER BY month_year DESC
+        LIMIT ?
+    ''', (user_id, limit))
+    
+    return [(month_year, amount, month_total(cursor, user_id, month_year))
+            for month_year, amount in cursor.fetchall()]
+
+def month_category_totals(cursor, user_id, month_year):
+    # (category, total) for the month, largest first
+    cursor.execute('''
+        SELECT category, SUM(amount) as total 
+        FROM expenses 
+        WHERE user_id=? AND date >= ? AND date < ? AND is_deleted=0
+        GROUP BY category 
+        ORDER BY total DESC
+    ''', (user_id,) + month_range(month_year))
+    
+    return cursor.fetchall()
+
+def current_challenges(cursor, user_id, month_year):
+    # Challenges running at any point during the month
+    start, end = month_range(month_year)
+    cursor.execute('''
+        SELECT challenge_id, category, target_amount, current_amount, is_completed 
+        FROM challenges 
+        WHERE user_id=? AND start_date < ? AND end_date >= ?
+    ''', (user_id, end, start))
+    
+    return cursor.fetchall()
+
+def category_month_spending(cursor, user_id, category, month_year):
+    # Positive spending only, refunds do not count towards a challenge
+    cursor.execute('''
+        SELECT COALESCE(SUM(amount), 0)
+        FROM expenses
+        WHERE user_id=? AND category=? AND date >= ? AND date < ? AND is_deleted=0 AND amount > 0
+    ''', (user_id, category) + month_range(month_year))
+    
+    return cursor.fetchone()[0]
+
+def shared_expense_list(cursor, user_id):
+    cursor.execute('''
+        SELECT e.expense_id, e.date, e.description, e.amount, 
+               GROUP_CONCAT(se.friend_name || ' (PKR ' || se.amount_owed || ')', ', ')
+        FROM shared_expenses se
+        JOIN expenses e ON e.expense_id = se.expense_id
+        WHERE se.user_id=? AND e.user_id=?
+        GROUP BY se.expense_id
+        ORDER BY e.date DESC
+    ''', (user_id, user_id))
+    
+    return cursor.fetchall()
+
+def shared_expense_friends(cursor, expense_id):
+    cursor.execute('''
+        SELECT friend_name, amount_owed, is_paid 
+        FROM shared_expenses 
+        WHERE expense_id=?
+        ORDER BY friend_name
+    ''', (expense_id,))
+    
+    return cursor.fetchall()
+
+def goal_count(cursor, user_id):
+    cursor.execute("SELECT COUNT(*) FROM goals WHERE user_id=?", (user_id,))
+    return cursor.fetchone()[0]
+
+def load_goals_page(cursor, user_id, offset, limit=GOALS_PAGE_SIZE):
+    # Goals in display order, open ones first and the nearest target date first
+    cursor.execute('''
+        SELECT goal_id, goal_name, target_amount, current_amount, target_date, is_completed 
+        FROM goals 
+        WHERE user_id=?
+        ORDER BY is_completed, target_date, goal_id
+        LIMIT ? OFFSET ?
+    ''', (user_id, limit, offset))
+    
+    return cursor.fetchall()
+
+def goal_date_text(target_date, now):
+    try:
+        target = datetime.datetime.strptime(target_date, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return "Target: No date set"
+    return f"Target: {target.strftime('%d %b %Y')} ({(target - now).days} days left)"
+
+def migrate_live_indexes(conn):
+    # Live queries always filter is_deleted=0, so their indexes leave trashed rows out
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_live_date 
+        ON expenses (user_id, date) 
+        WHERE is_deleted = 0
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expenses_live_category 
+        ON expenses (user_id, category, date) 
+        WHERE is_deleted = 0
+    ''')
+
+def migrate_shared_indexes(conn):
+    # Shared expenses are listed per user and looked up per expense
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_shared_expenses_user 
+        ON shared_expenses (user_id, expense_id)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_shared_expenses_expense 
+        ON shared_expenses (expense_id, friend_name)
+    ''')
+
+def migrate_goal_index(conn):
+    # The goals list is read in pages in (is_completed, target_date) order
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_goals_order 
+        ON goals (user_id, is_completed, target_date)
+    ''')
+
+def migrate_goal_contributions(conn):
+    conn.executescript('''
+        BEGIN;
+        
+        CREATE TABLE IF NOT EXISTS goal_contributions (
+            contribution_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            goal_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            date TEXT NOT NULL,
+            note TEXT,
+            expense_id INTEGER,
+            FOREIGN KEY (goal_id) REFERENCES goals (goal_id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        );
+        
+        CREATE INDEX IF NOT EXISTS idx_goal_contributions_goal 
+        ON goal_contributions (goal_id, date);
+        
+        -- What goals already hold becomes their opening contribution
+        INSERT INTO goal_contributions (goal_id, user_id, amount, date, note)
+        SELECT goal_id, user_id, current_amount, created_date, 'Opening balance' 
+        FROM goals WHERE current_amount != 0;
+        
+        -- current_amount is the running sum of the ledger, updated in the same statement
+        -- as each contribution so concurrent writers can never lose one another's update
+        CREATE TRIGGER IF NOT EXISTS goal_contributions_insert AFTER INSERT ON goal_contributions 
+        BEGIN 
+            UPDATE goals SET current_amount = current_amount + NEW.amount WHERE goal_id = NEW.goal_id; 
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS goal_contributions_delete AFTER DELETE ON goal_contributions 
+        BEGIN 
+            UPDATE goals SET current_amount = current_amount - OLD.amount WHERE goal_id = OLD.goal_id; 
+        END;
+        
+        CREATE TRIGGER IF NOT EXISTS goals_delete_contributions AFTER DELETE ON goals 
+        BEGIN 
+            DELETE FROM goal_contributions WHERE goal_id = OLD.goal_id; 
+        END;
+    ''')
+    # Left open for migrate_database to commit with the version bump, a re-run would
+    # otherwise record the opening balances twice
+
+def add_goal_contribution(cursor, user_id, goal_id, amount, date, note=None, expense_id=None):
+    cursor.execute('''
+        INSERT INTO goal_contributions (goal_id, user_id, amount, date, note, expense_id) 
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (goal_id, user_id, amount, date, note, expense_id))
+
+def set_goal_amount(cursor, goal_id, amount, date):
+    # Record the difference to an absolute amount as an adjustment, computed against the
+    # stored amount inside the statement itself
+    cursor.execute('''
+        INSERT INTO goal_contributions (goal_id, user_id, amount, date, note) 
+        SELECT goal_id, user_id, ? - current_amount, ?, 'Adjustment' 
+        FROM goals 
+        WHERE goal_id=? AND current_amount != ?
+    ''', (amount, date, goal_id, amount))
+
+def load_goal_contributions(cursor, goal_id):
+    # (date, amount, note) oldest first
+    cursor.execute('''
+        SELECT date, amount, note 
+        FROM goal_contributions 
+        WHERE goal_id=?
+        ORDER BY date, contribution_id
+    ''', (goal_id,))
+    
+    return cursor.fetchall()
+
+def monthly_surplus(cursor, user_id, today, months=SURPLUS_MONTHS):
+    # Average of budget minus spending over the last complete months that had a budget
+    first = add_months(today.replace(day=1), -months)
+    cursor.execute('''
+        SELECT b.amount - COALESCE(SUM(t.total), 0) 
+        FROM budgets b 
+        LEFT JOIN category_monthly_totals t ON t.user_id = b.user_id AND t.month = b.month_year 
+        WHERE b.user_id=? AND b.month_year >= ? AND b.month_year < ?
+        GROUP BY b.budget_id
+    ''', (user_id, first.strftime("%Y-%m"), today.strftime("%Y-%m")))
+    
+    surpluses = [row[0] for row in cursor.fetchall()]
+    return sum(surpluses) / len(surpluses) if surpluses else 0.0
+
+def project_goals(cursor, user_id, today=None, days=GOAL_RATE_DAYS):
+    # Projections for all of a user's open goals in one pass: two queries, then array maths.
+    # rate is the average saved per month over the last `days` days, required the monthly
+    # saving that still meets the target date. The monthly surplus is shared between the
+    # goals in proportion to what they require, giving a second, with-surplus projection.
+    today = today or datetime.date.today()
+    surplus = monthly_surplus(cursor, user_id, today)
+    
+    cursor.execute('''
+        SELECT goal_id, target_amount, current_amount, target_date 
+        FROM goals 
+        WHERE user_id=? AND is_completed=0
+        ORDER BY goal_id
+    ''', (user_id,))
+    goals = cursor.fetchall()
+    
+    if not goals:
+        return {"goals": {}, "surplus": surplus, "required": 0.0}
+    
+    ids = np.array([goal[0] for goal in goals])
+    target = np.array([goal[1] for goal in goals], dtype=float)
+    current = np.array([goal[2] for goal in goals], dtype=float)
+    target_dates = pd.to_datetime(pd.Series([goal[3] for goal in goals]), format="%Y-%m-%d", errors="coerce")
+    
+    cursor.execute('''
+        SELECT goal_id, SUM(amount) 
+        FROM goal_contributions 
+        WHERE user_id=? AND date > ? AND (note IS NULL OR note NOT IN (?, ?, ?))
+        GROUP BY goal_id
+    ''', (user_id, (today - datetime.timedelta(days=days)).strftime("%Y-%m-%d")) + GOAL_LEDGER_NOTES)
+    saved = np.zeros(len(ids))
+    contributed = cursor.fetchall()
+    if contributed:
+        contributed_ids = np.array([row[0] for row in contributed])
+        index = np.searchsorted(ids, contributed_ids)
+        known = (index < len(ids)) & (ids[np.minimum(index, len(ids) - 1)] == contributed_ids)
+        saved[index[known]] = np.array([row[1] for row in contributed], dtype=float)[known]
+    
+    rate = saved / (days / DAYS_PER_MONTH)
+    remaining = np.maximum(target - current, 0)
+    
+    # Goals without a target date have no required saving, overdue ones need the rest now
+    days_left = (target_dates - pd.Timestamp(today)).dt.days.to_numpy(dtype=float)
+    months_left = days_left / DAYS_PER_MONTH
+    with np.errstate(divide="ignore", invalid="ignore"):
+        required = np.where(np.isnan(months_left), 0.0,
+                            np.where(months_left > 0, remaining / np.maximum(months_left, 1e-9), remaining))
+        share = surplus * required / required.sum() if surplus > 0 and required.sum() > 0 else np.zeros(len(ids))
+        months = np.where(rate > 0, remaining / rate, np.inf)
+        months_with_surplus = np.where(rate + share > 0, remaining / (rate + share), np.inf)
+    
+    def finish_date(months_needed):
+        return today + datetime.timedelta(days=round(months_needed * DAYS_PER_MONTH)) if np.isfinite(months_needed) else None
+    
+    projections = {}
+    for i, goal_id in enumerate(ids.tolist()):
+        projected = finish_date(months[i])
+        projections[goal_id] = {
+            "rate": float(rate[i]),
+            "remaining": float(remaining[i]),
+            "required": float(required[i]),
+            "projected": projected,
+            "surplus_share": float(share[i]),
+            "projected_with_surplus": finish_date(months_with_surplus[i]),
+            "on_track": bool(np.isnan(days_left[i]) or (projected is not None and (projected - today).days <= days_left[i])),
+        }
+    
+    return {"goals": projections, "surplus": surplus, "required": float(required.sum())}
+
+def goal_projection_text(projection):
+    # Completed goals have no projection
+    if projection is None or projection["remaining"] <= 0:
+        return "Target reached"
+    
+    parts = []
+    if projection["required"] > 0:
+        parts.append(f"Needs PKR {projection['required']:,.2f}/month")
+    if projection["projected"]:
+        parts.append(f"at your current pace done by {projection['projected'].strftime('%d %b %Y')}")
+    elif projection["projected_with_surplus"]:
+        parts.append(f"with your surplus done by {projection['projected_with_surplus'].strftime('%d %b %Y')}")
+    else:
+        parts.append("no recent savings to project from")
+    if not projection["on_track"]:
+        parts.append("behind schedule")
+    return ", ".join(parts)
+
+def migrate_goal_projection_index(conn):
+    # Projections read every goal's recent contributions in one range scan per user
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_goal_contributions_user 
+        ON goal_contributions (user_id, date)
+    ''')
+
+# Per-friend balances kept up to date by triggers on shared_expenses, one row per
+# (user, friend, paid or not) holding the sum and count of those shares
+FRIEND_BALANCE_ADD_SQL = '''
+    INSERT INTO friend_balances (user_id, friend_id, is_paid, total, count)
+    VALUES ({row}.user_id, {row}.friend_id, COALESCE({row}.is_paid, 0), {row}.amount_owed, 1)
+    ON CONFLICT (user_id, friend_id, is_paid) DO UPDATE SET total = total + excluded.total, count = count + 1;
+'''
+
+FRIEND_BALANCE_REMOVE_SQL = '''
+    UPDATE friend_balances SET total = total - {row}.amount_owed, count = count - 1
+    WHERE user_id = {row}.user_id AND friend_id = {row}.friend_id AND is_paid = COALESCE({row}.is_paid, 0);
+    DELETE FROM friend_balances
+    WHERE user_id = {row}.user_id AND friend_id = {row}.friend_id AND is_paid = COALESCE({row}.is_paid, 0) AND count <= 0;
+'''
+
+def normalize_friend_name(name):
+    # "  sara  khan" and "Sara Khan" are the same friend
+    return " ".join(name.split()).casefold()
+
+def friend_id_for(cursor, user_id, name):
+    # The user's friend with this name, added on first use
+    cursor.execute('''
+        SELECT friend_id FROM friends WHERE user_id=? AND normalized_name=?
+    ''', (user_id, normalize_friend_name(name)))
+    
+    row = cursor.fetchone()
+    if row:
+        return row[0]
+    
+    cursor.execute('''
+        INSERT INTO friends (user_id, name, normalized_name) VALUES (?, ?, ?)
+    ''', (user_id, " ".join(name.split()), normalize_friend_name(name)))
+    return cursor.lastrowid
+
+def migrate_friend_balances(conn):
+    conn.executescript(f'''
+        BEGIN;
+        
+        CREATE TABLE IF NOT EXISTS friends (
+            friend_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            normalized_name TEXT NOT NULL,
+            UNIQUE (user_id, normalized_name),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        );
+        
+        ALTER TABLE shared_expenses ADD COLUMN friend_id INTEGER REFERENCES friends (friend_id);
+        
+        CREATE TABLE IF NOT EXISTS friend_balances (
+            user_id INTEGER NOT NULL,
+            friend_id INTEGER NOT NULL,
+            is_paid INTEGER NOT NULL,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, friend_id, is_paid)
+        );
+        
+        -- A friend's shares, paid or unpaid
+        CREATE INDEX IF NOT EXISTS idx_shared_expenses_friend 
+        ON shared_expenses (user_id, friend_id, is_paid);
+        
+        CREATE TRIGGER IF NOT EXISTS shared_expenses_balance_insert AFTER INSERT ON shared_expenses
+        WHEN NEW.friend_id IS NOT NULL
+        BEGIN {FRIEND_BALANCE_ADD_SQL.format(row="NEW")} END;
+        
+        CREATE TRIGGER IF NOT EXISTS shared_expenses_balance_delete AFTER DELETE ON shared_expenses
+        WHEN OLD.friend_id IS NOT NULL
+        BEGIN {FRIEND_BALANCE_REMOVE_SQL.format(row="OLD")} END;
+        
+        CREATE TRIGGER IF NOT EXISTS shared_expenses_balance_update_old
+        AFTER UPDATE OF user_id, friend_id, amount_owed, is_paid ON shared_expenses
+        WHEN OLD.friend_id IS NOT NULL
+        BEGIN {FRIEND_BALANCE_REMOVE_SQL.format(row="OLD")} END;
+        
+        CREATE TRIGGER IF NOT EXISTS shared_expenses_balance_update_new
+        AFTER UPDATE OF user_id, friend_id, amount_owed, is_paid ON shared_expenses
+        WHEN NEW.friend_id IS NOT NULL
+        BEGIN {FRIEND_BALANCE_ADD_SQL.format(row="NEW")} END;
+    ''')
+    
+    # Backfill friends from the names typed so far, keeping the first spelling of each.
+    # The balances follow from the update triggers. This runs in the transaction opened
+    # above, which migrate_database commits together with the version bump.
+    cursor = conn.cursor()
+    names = cursor.execute('''
+        SELECT user_id, friend_name FROM shared_expenses 
+        GROUP BY user_id, friend_name 
+        ORDER BY MIN(shared_id)
+    ''').fetchall()
+    params = [(friend_id_for(cursor, user_id, name), user_id, name) for user_id, name in names]
+    cursor.executemany('''
+        UPDATE shared_expenses SET friend_id=? WHERE user_id=? AND friend_name=?
+    ''', params)
+
+def load_friend_balances(cursor, user_id):
+    # (friend_id, name, outstanding, paid, shares) per friend, largest outstanding balance first.
+    # Reads at most two rollup rows per friend, however many expenses were shared.
+    cursor.execute('''
+        SELECT f.friend_id, f.name, 
+               SUM(CASE WHEN b.is_paid = 0 THEN b.total ELSE 0 END) AS outstanding, 
+               SUM(CASE WHEN b.is_paid = 1 THEN b.total ELSE 0 END), 
+               SUM(b.count)
+        FROM friend_balances b
+        JOIN friends f ON f.friend_id = b.friend_id
+        WHERE b.user_id=?
+        GROUP BY b.friend_id
+        ORDER BY outstanding DESC, f.name
+    ''', (user_id,))
+    
+    return cursor.fetchall()
+
+def friend_shared_expenses(cursor, user_id, friend_id, is_paid=0):
+    # (expense_id, date, description, amount_owed) of one friend's unpaid (or paid) shares
+    cursor.execute('''
+        SELECT se.expense_id, e.date, e.description, se.amount_owed
+        FROM shared_expenses se
+        JOIN expenses e ON e.expense_id = se.expense_id
+        WHERE se.user_id=? AND se.friend_id=? AND se.is_paid=?
+        ORDER BY e.date DESC
+    ''', (user_id, friend_id, is_paid))
+    
+    return cursor.fetchall()
+
+# Schema changes applied to existing databases, in order: (user_version, migration)
+MIGRATIONS = [
+    (1, migrate_category_rollups),
+    (2, migrate_category_tokens),
+    (3, migrate_duplicate_index),
+    (4, migrate_trash_retention),
+    (5, migrate_live_indexes),
+    (6, migrate_shared_indexes),
+    (7, migrate_goal_index),
+    (8, migrate_goal_contributions),
+    (9, migrate_goal_projection_index),
+    (10, migrate_friend_balances),
+]
+
+def migrate_database(conn):
+    # Bring the database up to the latest schema version recorded in PRAGMA user_version.
+    # A migration that leaves its transaction open gets the version bump in the same commit.
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, migration in MIGRATIONS:
+        if version < target:
+            try:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            version = target
+
+def expense_anomaly(cursor, user_id, category, amount, included=True):
+    # How unusual one expense is for its category, from the running count / sum / sum of squares.
+    # included means the expense is already part of the rollup and is left out of the baseline.
+    # Returns None while the category has too little history.
+    cursor.execute('''
+        SELECT n, total, total_sq FROM category_stats 
+        WHERE user_id=? AND category=?
+    ''', (user_id, category))
+    
+    row = cursor.fetchone()
+    if not row:
+        return None
+    
+    n, total, total_sq = row
+    if included:
+        n, total, total_sq = n - 1, total - amount, total_sq - amount * amount
+    
+    if n < ANOMALY_MIN_EXPENSES:
+        return None
+    
+    mean = total / n
+    std = float(np.sqrt(max((total_sq - total * total / n) / (n - 1), 0)))
+    if std > 0:
+        score = (amount - mean) / std
+    else:
+        score = float('inf') if amount > mean else 0.0
+    
+    return {"category": category, "amount": amount, "typical": mean, "score": score,
+            "unusual": score >= ANOMALY_THRESHOLD}
+
+def category_month_anomalies(cursor, user_id, month=None, category=None):
+    # Categories whose total for `month` ("YYYY-MM", default current) is far above their usual
+    # month, scored with the median and median absolute deviation of the earlier monthly totals
+    month = month or datetime.date.today().strftime("%Y-%m")
+    
+    query = '''
+        SELECT category, month, total FROM category_monthly_totals 
+        WHERE user_id=? AND month <= ?
+    '''
+    params = (user_id, month)
+    if category:
+        query += " AND category=?"
+        params += (category,)
+    
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    if not rows:
+        return []
+    
+    frame = pd.DataFrame(rows, columns=["category", "month", "total"])
+    matrix = frame.pivot_table(index="month", columns="category", values="total", aggfunc="sum", fill_value=0.0)
+    
+    # Months without spending count as zero from the first month on record
+    months = pd.period_range(pd.Period(matrix.index.min(), freq="M"), pd.Period(month, freq="M"), freq="M")
+    matrix = matrix.reindex(months.strftime("%Y-%m"), fill_value=0.0)
+    
+    results = []
+    for name in matrix.columns:
+        values = matrix[name].to_numpy(dtype=float)
+        current = float(values[-1])
+        
+        # History starts at the category's first month with spending
+        history = values[:-1][np.argmax(values > 0):]
+        if current <= 0 or len(history) < ANOMALY_MIN_MONTHS:
+            continue
+        
+        median = float(np.median(history))
+        spread = MAD_SCALE * float(np.median(np.abs(history - median)))
+        if spread > 0:
+            score = (current - median) / spread
+        else:
+            score = float('inf') if current > median else 0.0
+        
+        results.append({"category": name, "month": month, "total": current, "typical": median,
+                        "score": score, "unusual": score >= ANOMALY_THRESHOLD})
+    
+    results.sort(key=lambda result: result["score"], reverse=True)
+    return results
+
+def unusual_expenses(cursor, user_id, start, end):
+    # Expenses in [start, end) that are unusual for their category, scored leave-one-out
+    # against the category rollup in a single vectorized pass
+    cursor.execute('''
+        SELECT e.expense_id, e.date, e.category, e.amount, e.description, s.n, s.total, s.total_sq 
+        FROM expenses e 
+        JOIN category_stats s ON s.user_id = e.user_id AND s.category = e.category 
+        WHERE e.user_id=? AND e.date >= ? AND e.date < ? AND e.is_deleted=0
+    ''', (user_id,) + sql_range(start, end))
+    
+    frame = pd.DataFrame(cursor.fetchall(),
+                         columns=["expense_id", "date", "category", "amount", "description", "n", "total", "total_sq"])
+    if frame.empty:
+        return []
+    
+    amount = frame["amount"].to_numpy(dtype=float)
+    n = frame["n"].to_numpy(dtype=float) - 1
+    total = frame["total"].to_numpy(dtype=float) - amount
+    total_sq = frame["total_sq"].to_numpy(dtype=float) - amount * amount
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = total / n
+        std = np.sqrt(np.clip((total_sq - total * total / n) / (n - 1), 0, None))
+        score = np.where(std > 0, (amount - mean) / std, np.where(amount > mean, np.inf, 0.0))
+    
+    frame["typical"] = mean
+    frame["score"] = score
+    frame = frame[(n >= ANOMALY_MIN_EXPENSES) & (score >= ANOMALY_THRESHOLD)]
+    
+    return frame.sort_values("score", ascending=False)[
+        ["expense_id", "date", "category", "amount", "description", "typical", "score"]].to_dict("records")
+
+def find_anomalies(cursor, user_id, day=None):
+    # Unusual expenses and category totals in the month containing day
+    start, end = period_range("month", day)
+    
+    return {
+        "expenses": unusual_expenses(cursor, user_id, start, end),
+        "categories": [result for result in category_month_anomalies(cursor, user_id, start.strftime("%Y-%m"))
+                       if result["unusual"]],
+    }
+
+def create_schema(conn):
+    cursor = conn.cursor()
+    
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT,
+            theme TEXT DEFAULT 'light'
+        )
+    ''')
+    
+    # Expenses table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS expenses (
+            expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            date TEXT NOT NULL,
+            description TEXT,
+            is_deleted INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    
+    # Goals table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS goals (
+            goal_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            goal_name TEXT NOT NULL,
+            target_amount REAL NOT NULL,
+            current_amount REAL DEFAULT 0,
+            target_date TEXT,
+            created_date TEXT NOT NULL,
+            is_completed INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    
+    # Shared expenses table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shared_expenses (
+            shared_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            expense_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            friend_name TEXT NOT NULL,
+            amount_owed REAL NOT NULL,
+            is_paid INTEGER DEFAULT 0,
+            FOREIGN KEY (expense_id) REFERENCES expenses (expense_id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    
+    # Categories table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category_name TEXT NOT NULL,
+            monthly_limit REAL,
+            is_locked INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            UNIQUE(user_id, category_name)
+        )
+    ''')
+    
+    # Budgets table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS budgets (
+            budget_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            month_year TEXT NOT NULL,
+            amount REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            UNIQUE(user_id, month_year)
+        )
+    ''')
+    
+    # Challenges table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS challenges (
+            challenge_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            target_amount REAL NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            current_amount REAL DEFAULT 0,
+            is_completed INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    
+    # Recurring expenses table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_expenses (
+            recurring_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT,
+            frequency TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            next_date TEXT NOT NULL,
+            occurrences INTEGER DEFAULT 0,
+            is_active INTEGER DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_recurring_due 
+        ON recurring_expenses (user_id, is_active, next_date)
+    ''')
+    
+    # Budget templates table (one default monthly budget per user)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS budget_templates (
+            template_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            start_month TEXT NOT NULL,
+            is_active INTEGER DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            UNIQUE(user_id)
+        )
+    ''')
+    
+    conn.commit()
+    
+    migrate_database(conn)
+
+def query_plans(conn, run):
+    # EXPLAIN QUERY PLAN of every statement run(cursor) executes: [(sql, [plan details])]
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        run(conn.cursor())
+    finally:
+        conn.set_trace_callback(None)
+    
+    plans = []
+    for sql in statements:
+        if sql.lstrip().upper().startswith("SELECT"):
+            plans.append((sql, [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]))
+    return plans
+
+# Hot-path queries whose plans are checked: (name, run(cursor), index the plan must use or None).
+# Every one of them must also avoid a full scan of expenses and shared_expenses.
+QUERY_PLAN_CHECKS = [
+    # Dashboard
+    ("dashboard month total", lambda cursor: month_total(cursor, 1, "2026-01"), "idx_expenses_live_date"),
+    ("dashboard category totals", lambda cursor: month_category_totals(cursor, 1, "2026-01"), "idx_expenses_live_date"),
+    ("dashboard trend", lambda cursor: sum_by_buckets(cursor, 1, period_breakdown("month")), "idx_expenses_live_date"),
+    ("recent expenses", lambda cursor: recent_expenses(cursor, 1), "idx_expenses_live_date"),
+    ("unusual spending", lambda cursor: find_anomalies(cursor, 1), None),
+    # Expense list
+    ("expense list", lambda cursor: cursor.execute(*expense_list_query(1)), "idx_expenses_live_date"),
+    ("expense list (month)", lambda cursor: cursor.execute(*expense_list_query(1, "month")), "idx_expenses_live_date"),
+    ("expense list (today)", lambda cursor: cursor.execute(*expense_list_query(1, "today")), "idx_expenses_live_date"),
+    ("expense list (category)", lambda cursor: cursor.execute(*expense_list_query(1, "all", "Food")),
+     "idx_expenses_live_category"),
+    ("duplicate check", lambda cursor: find_duplicates(cursor, 1, 100.0, "2026-01-15", "Lunch"), "idx_expenses_duplicate"),
+    ("trash page", lambda cursor: load_trash_page(cursor, 1), "idx_expenses_trash"),
+    ("trash page (older)", lambda cursor: load_trash_page(cursor, 1, ("2026-01-01 00:00:00", 100)), "idx_expenses_trash"),
+    # Reports
+    ("category report", lambda cursor: build_report(cursor, 1, "category", "month"), "idx_expenses_live_date"),
+    ("period report", lambda cursor: build_report(cursor, 1, "period", "year"), "idx_expenses_live_date"),
+    ("comparison report", lambda cursor: build_report(cursor, 1, "comparison", "month", periods=12),
+     "idx_expenses_live_date"),
+    ("daily report days", lambda cursor: expense_day_count(cursor, 1, datetime.date(2026, 1, 1),
+                                                           datetime.date(2026, 2, 1)), "idx_expenses_live_date"),
+    ("daily report export", lambda cursor: write_daily_report_stream(cursor, 1, "plan-check", "2026-01-01",
+                                                                    "2026-01-31", io.BytesIO()),
+     "idx_expenses_live_date"),
+    # Challenges
+    ("challenge spending", lambda cursor: category_month_spending(cursor, 1, "Food", "2026-01"),
+     "idx_expenses_live_category"),
+    ("current challenges", lambda cursor: current_challenges(cursor, 1, "2026-01"), None),
+    # Goals
+    ("goals page", lambda cursor: load_goals_page(cursor, 1, 100), "idx_goals_order"),
+    ("goal contributions", lambda cursor: load_goal_contributions(cursor, 1), "idx_goal_contributions_goal"),
+    ("goal projections", lambda cursor: (cursor.execute("INSERT INTO goals (user_id, goal_name, target_amount, created_date) "
+                                                        "VALUES (1, 'Plan check', 1000, '2026-01-01')"),
+                                         project_goals(cursor, 1, datetime.date(2026, 1, 15))),
+     "idx_goal_contributions_user"),
+    # Budget
+    ("budget history", lambda cursor: (cursor.execute("INSERT OR IGNORE INTO budgets (user_id, month_year, amount) "
+                                                      "VALUES (1, '2026-01', 1000)"),
+                                       budget_history(cursor, 1)), "idx_expenses_live_date"),
+    # Shared expenses
+    ("shared expenses", lambda cursor: shared_expense_list(cursor, 1), "idx_shared_expenses_user"),
+    ("shared expense friends", lambda cursor: shared_expense_friends(cursor, 1), "idx_shared_expenses_expense"),
+    ("friend balances", lambda cursor: load_friend_balances(cursor, 1), "sqlite_autoindex_friend_balances_1"),
+    ("friend unpaid shares", lambda cursor: friend_shared_expenses(cursor, 1, 1), "idx_shared_expenses_friend"),
+]
+
+# Tables a hot-path query must never scan in full
+PLAN_CHECK_TABLES = ("expenses", "shared_expenses")
+
+def scanned_tables(sql, plan):
+    # Checked tables the plan reads in full, through their name or an alias given to them in the query
+    names = {table: table for table in PLAN_CHECK_TABLES}
+    for table, alias in re.findall(r"\b(" + "|".join(PLAN_CHECK_TABLES) + r")\s+(?:AS\s+)?(\w+)", sql, re.I):
+        if alias.upper() not in ("ON", "WHERE", "JOIN", "GROUP", "ORDER", "LIMIT", "SET", "LEFT", "INNER"):
+            names[alias] = table
+    
+    scanned = []
+    for line in plan:
+        words = line.split()
+        if len(words) > 1 and words[0] == "SCAN" and words[1] in names:
+            scanned.append(names[words[1]])
+    return scanned
+
+def check_query_plans(conn, checks=QUERY_PLAN_CHECKS):
+    # Problems found in the plans of the checked queries, empty when all of them use their index
+    problems = []
+    for name, run, index in checks:
+        plans = query_plans(conn, run)
+        if not plans:
+            problems.append(f"{name}: ran no query")
+        if index and not any(f"INDEX {index}" in line for _, plan in plans for line in plan):
+            problems.append(f"{name}: does not use {index}")
+        for sql, plan in plans:
+            for table in scanned_tables(sql, plan):
+                problems.append(f"{name}: scans {table}: {' / '.join(plan)}")
+    return problems
+
+def run_query_plan_checks():
+    # Check the plans against a fresh schema with every migration applied
+    conn = sqlite3.connect(":memory:")
+    create_schema(conn)
+    conn.execute("ANALYZE")
+    
+    problems = check_query_plans(conn)
+    for problem in problems:
+        print(problem)
+    print(f"{len(QUERY_PLAN_CHECKS)} queries checked, {len(problems)} problem(s)")
+    return not problems
+
+class QueryStats:
+    # Timing of the statements run through instrumented connections, per (screen, statement).
+    # Shared by every thread, statements slower than slow_ms are also written to log_file.
+    def __init__(self, slow_ms=SLOW_QUERY_MS, log_file=None):
+        self.slow_ms = slow_ms
+        self.log_file = log_file
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.slow = collections.deque(maxlen=SLOW_QUERY_HISTORY)
+    
+    def record(self, screen, statement, sql, seconds, rows):
+        with self.lock:
+            totals = self.totals.setdefault((screen, statement), [0, 0.0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            totals[3] += rows
+            
+            if self.slow_ms is None or seconds * 1000 < self.slow_ms:
+                return
+            entry = (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), screen, statement,
+                     seconds * 1000, rows, " ".join(sql.split()))
+            self.slow.append(entry)
+        
+        if self.log_file:
+            try:
+                with open(self.log_file, "a") as f:
+                    f.write("%s  %s  %s  %.1f ms  %d rows  %s\n" % entry)
+            except OSError:
+                pass
+    
+    def top(self, limit=DIAGNOSTICS_TOP):
+        # (screen, statement, calls, total s, max s, rows), most total time first
+        with self.lock:
+            rows = [key + tuple(totals) for key, totals in self.totals.items()]
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows[:limit]
+    
+    def reset(self):
+        with self.lock:
+            self.totals.clear()
+            self.slow.clear()
+
+QUERY_STATS = QueryStats()
+
+class Tracer:
+    # Timed spans (screen renders, chart drawing, tree filling, queries) kept in a bounded
+    # buffer and exported in the Chrome trace-event format, for chrome://tracing or Perfetto.
+    # Off unless started with --trace or from the Diagnostics window.
+    def __init__(self, limit=TRACE_EVENT_LIMIT):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.events = collections.deque(maxlen=limit)
+        self.thread_names = {}
+    
+    def complete(self, name, category, started, seconds, args=None):
+        if not self.enabled:
+            return
+        
+        thread = threading.current_thread()
+        self.thread_names[thread.ident] = thread.name
+        event = {"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+                 "ts": round((started - self.origin) * 1e6, 1), "dur": round(seconds * 1e6, 1)}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+    
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        if not self.enabled:
+            yield
+            return
+        
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, category, started, time.perf_counter() - started, args)
+    
+    def export(self, path):
+        events = list(self.events)
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                    for tid, name in list(self.thread_names.items())]
+        
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+    
+    def clear(self):
+        self.events.clear()
+
+TRACER = Tracer()
+
+def traced(category):
+    # Record every call of an ExpenseTracker method as a span. For screens the span also
+    # covers Tk's geometry pass, which otherwise runs unmeasured once the method returns.
+    def decorate(method):
+        @functools.wraps(method)
+        def traced_call(self, *args, **kwargs):
+            if not TRACER.enabled:
+                return method(self, *args, **kwargs)
+            
+            with TRACER.span(method.__name__, category):
+                result = method(self, *args, **kwargs)
+                if category == "screen":
+                    with TRACER.span("layout", "tk"):
+                        self.root.update_idletasks()
+            return result
+        return traced_call
+    return decorate
+
+def query_origin():
+    # (screen, statement) a query is attributed to. The statement is the function that ran it;
+    # the screen is the outermost show_/manage_/view_ method on the stack, else the entry
+    # point the query came from (a button callback, or the name of a background thread).
+    frame = sys._getframe(1)
+    while frame.f_code in INSTRUMENTED_CODE:
+        frame = frame.f_back
+    statement = frame.f_code.co_name
+    
+    screen = entry = None
+    while frame and frame.f_globals is globals() and frame.f_code.co_name != "<module>":
+        name = frame.f_code.co_name
+        if name.startswith(("show_", "manage_", "view_")):
+            screen = name
+        if name != "traced_call":
+            entry = name
+        frame = frame.f_back
+    
+    if threading.current_thread() is not threading.main_thread():
+        return threading.current_thread().name, statement
+    return screen or entry or statement, statement
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Cursor that times each statement, including fetching its rows, into QUERY_STATS
+    pending = None
+    
+    def execute(self, sql, parameters=()):
+        self.finish()
+        screen, statement = query_origin()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.started = started
+            self.pending = [screen, statement, sql, time.perf_counter() - started, 0]
+            if self.description is None:
+                self.pending[4] = max(self.rowcount, 0)
+                self.finish()
+    
+    def executemany(self, sql, seq_of_parameters):
+        self.finish()
+        screen, statement = query_origin()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            seconds = time.perf_counter() - started
+            QUERY_STATS.record(screen, statement, sql, seconds, max(self.rowcount, 0))
+            TRACER.complete(statement, "query", started, seconds, {"screen": screen, "rows": max(self.rowcount, 0)})
+    
+    def executescript(self, sql_script):
+        self.finish()
+        screen, statement = query_origin()
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            QUERY_STATS.record(screen, statement, sql_script, time.perf_counter() - started, 0)
+    
+    def fetched(self, started, rows, done):
+        if self.pending:
+            self.pending[3] += time.perf_counter() - started
+            self.pending[4] += rows
+            if done:
+                self.finish()
+    
+    def fetchone(self):
+        # The app only calls fetchone() for single-row results, so that completes the statement
+        started = time.perf_counter()
+        row = super().fetchone()
+        self.fetched(started, row is not None, True)
+        return row
+    
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.fetched(started, len(rows), len(rows) < (self.arraysize if size is None else size))
+        return rows
+    
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self.fetched(started, len(rows), True)
+        return rows
+    
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.fetched(started, 0, True)
+            raise
+        self.fetched(started, 1, False)
+        return row
+    
+    def close(self):
+        self.finish()
+        super().close()
+    
+    def finish(self):
+        # Record the statement once all of its rows are read, or when the cursor moves on
+        if self.pending:
+            screen, statement, sql, seconds, rows = self.pending
+            QUERY_STATS.record(screen, statement, sql, seconds, rows)
+            TRACER.complete(statement, "query", self.started, seconds, {"screen": screen, "rows": rows})
+            self.pending = None
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection whose cursors, including those behind conn.execute(), are instrumented.
+    # commits counts the commits that changed data on any instrumented connection, so
+    # screens cached against the Tk thread's connection see the worker threads' writes.
+    commits = 0
+    commits_lock = threading.Lock()
+    
+    def commit(self):
+        super().commit()
+        if self.total_changes != getattr(self, "committed_changes", 0):
+            self.committed_changes = self.total_changes
+            with InstrumentedConnection.commits_lock:
+                InstrumentedConnection.commits += 1
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+# Frames skipped when looking for the code that ran a query
+INSTRUMENTED_CODE = {
+    function.__code__ for cls in (InstrumentedCursor, InstrumentedConnection)
+    for function in vars(cls).values() if callable(function) and hasattr(function, "__code__")
+} | {query_origin.__code__}
+
+def connect_instrumented(database, **kwargs):
+    return sqlite3.connect(database, factory=InstrumentedConnection, **kwargs)
+
+def generate_synthetic_data(database, expense_count, seed=0, users=None, years=SYNTHETIC_YEARS):
+    # Fill a new database with reproducible fake users and data: seasonal, category-skewed
+    # expenses over the last `years` years, plus shared splits, budgets, goals and challenges
+    if os.path.exists(database):
+        raise ValueError(f"{database} already exists, synthetic data needs a new database")
+    
+    rng = np.random.default_rng(seed)
+    users = users or max(1, expense_count // SYNTHETIC_EXPENSES_PER_USER)
+    started = time.perf_counter()
+    
+    conn = sqlite3.connect(database)
+    create_schema(conn)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    
+    password = hashlib.sha256(b"password").hexdigest()
+    conn.executemany("INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+                     [(f"user{i}", password, f"user{i}@example.com") for i in range(1, users + 1)])
+    conn.executemany('''
+        INSERT INTO categories (user_id, category_name, monthly_limit) VALUES (?, ?, ?)
+    ''', [(user_id, category, median * 30 * share) for user_id in range(1, users + 1)
+          for category, (share, median, _) in SYNTHETIC_CATEGORIES.items()])
+    conn.executemany("INSERT INTO friends (user_id, name, normalized_name) VALUES (?, ?, ?)",
+                     [(user_id, name, normalize_friend_name(name))
+                      for user_id in range(1, users + 1) for name in SYNTHETIC_FRIENDS])
+    
+    # The rollups and tokens are rebuilt in one pass at the end instead of per row
+    for trigger in ("insert", "delete", "update_old", "update_new"):
+        conn.execute(f"DROP TRIGGER expenses_rollup_{trigger}")
+    
+    today = datetime.date.today()
+    first = add_months(today.replace(day=1), -12 * years)
+    days = np.arange((today - first).days + 1)
+    dates = [(first + datetime.timedelta(days=int(day))).strftime("%Y-%m-%d") for day in days]
+    
+    # More spending around the end of the year and on weekends
+    day_of_year = np.array([(first + datetime.timedelta(days=int(day))).timetuple().tm_yday for day in days])
+    weekday = (first.weekday() + days) % 7
+    day_weights = (1 + 0.3 * np.cos(2 * np.pi * (day_of_year - 350) / 365.25)) * np.where(weekday >= 5, 1.3, 1.0)
+    day_weights /= day_weights.sum()
+    
+    # Some users are much more active than others
+    user_weights = rng.gamma(2.0, size=users)
+    user_weights /= user_weights.sum()
+    
+    categories = list(SYNTHETIC_CATEGORIES)
+    shares = np.array([SYNTHETIC_CATEGORIES[category][0] for category in categories])
+    medians = np.array([SYNTHETIC_CATEGORIES[category][1] for category in categories])
+    
+    expense_id = 0
+    for offset in range(0, expense_count, SYNTHETIC_CHUNK_SIZE):
+        size = min(SYNTHETIC_CHUNK_SIZE, expense_count - offset)
+        user_ids = rng.choice(users, size, p=user_weights) + 1
+        day_index = rng.choice(len(days), size, p=day_weights)
+        category_index = rng.choice(len(categories), size, p=shares)
+        amounts = np.round(medians[category_index] * rng.lognormal(0, 0.6, size), 2)
+        picks = rng.random(size)
+        deleted = rng.random(size) < 0.01
+        
+        rows = []
+        for i in range(size):
+            category = categories[category_index[i]]
+            descriptions = SYNTHETIC_CATEGORIES[category][2]
+            rows.append((int(user_ids[i]), float(amounts[i]), category, dates[day_index[i]],
+                         descriptions[int(picks[i] * len(descriptions))], int(deleted[i]),
+                         dates[day_index[i]] + " 12:00:00" if deleted[i] else None))
+        conn.executemany('''
+            INSERT INTO expenses (user_id, amount, category, date, description, is_deleted, deleted_at) 
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        
+        # About one expense in fifty is split with friends
+        shared = []
+        for i in np.flatnonzero(rng.random(size) < 0.02):
+            friends = rng.choice(len(SYNTHETIC_FRIENDS), int(rng.integers(1, 4)), replace=False)
+            share = round(float(amounts[i]) / (len(friends) + 1), 2)
+            for friend in friends:
+                # Friends were added in the same order for every user
+                friend_id = (int(user_ids[i]) - 1) * len(SYNTHETIC_FRIENDS) + int(friend) + 1
+                shared.append((expense_id + int(i) + 1, int(user_ids[i]), SYNTHETIC_FRIENDS[friend], friend_id,
+                               share, int(rng.random() < 0.5)))
+        conn.executemany('''
+            INSERT INTO shared_expenses (expense_id, user_id, friend_name, friend_id, amount_owed, is_paid) 
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', shared)
+        
+        expense_id += size
+        conn.commit()
+        print(f"{expense_id:,} / {expense_count:,} expenses")
+    
+    months = [add_months(first, i).strftime("%Y-%m") for i in range(12 * years + 1)]
+    budgets = []
+    goals = []
+    contributions = []
+    challenges = []
+    for user_id in range(1, users + 1):
+        base = float(rng.integers(20, 200)) * 1000
+        budgets.extend((user_id, month, round(base * rng.uniform(0.9, 1.1), -2)) for month in months)
+        
+        for i in range(int(rng.integers(0, 8))):
+            target = float(rng.integers(10, 500)) * 1000
+            created = first + datetime.timedelta(days=int(rng.integers(0, len(days))))
+            target_date = created + datetime.timedelta(days=int(rng.integers(60, 1000)))
+            current = min(round(target * rng.uniform(0, 1.1), 2), target)
+            goals.append((user_id, f"Goal {i + 1}", target, 0, target_date.strftime("%Y-%m-%d"),
+                          created.strftime("%Y-%m-%d"), int(current >= target)))
+            
+            # Saved in a handful of contributions between creation and today
+            span = max(1, (min(today, target_date) - created).days)
+            for share in rng.dirichlet(np.ones(int(rng.integers(1, 12)))):
+                day = created + datetime.timedelta(days=int(rng.integers(0, span)))
+                contributions.append((len(goals), user_id, round(current * float(share), 2), day.strftime("%Y-%m-%d")))
+        
+        for category in rng.choice(categories, int(rng.integers(0, 4)), replace=False):
+            start, end = month_range(months[-1])
+            challenges.append((user_id, str(category), float(rng.integers(1, 30)) * 1000, start,
+                               (datetime.date.fromisoformat(end) - datetime.timedelta(days=1)).strftime("%Y-%m-%d")))
+    
+    conn.executemany("INSERT INTO budgets (user_id, month_year, amount) VALUES (?, ?, ?)", budgets)
+    conn.executemany('''
+        INSERT INTO goals (user_id, goal_name, target_amount, current_amount, target_date, created_date, is_completed) 
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', goals)
+    conn.executemany('''
+        INSERT INTO goal_contributions (goal_id, user_id, amount, date) VALUES (?, ?, ?, ?)
+    ''', contributions)
+    conn.executemany('''
+        INSERT INTO challenges (user_id, category, target_amount, start_date, end_date) VALUES (?, ?, ?, ?, ?)
+    ''', challenges)
+    conn.commit()
+    
+    migrate_category_rollups(conn)
+    migrate_category_tokens(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    
+    print(f"Generated {expense_count:,} expenses for {users:,} user(s) in {time.perf_counter() - started:.1f}s")
+
+def benchmark_queries(cursor, user_id, day):
+    # Queries behind each screen: (screen, name, run())
+    month = day.strftime("%Y-%m")
+    queries = [
+        ("show_dashboard", "month total", lambda: month_total(cursor, user_id, month)),
+        ("show_dashboard", "category totals", lambda: month_category_totals(cursor, user_id, month)),
+        ("show_dashboard", "spending trend", lambda: sum_by_buckets(cursor, user_id, period_breakdown("month", day))),
+        ("show_dashboard", "recent expenses", lambda: recent_expenses(cursor, user_id)),
+        ("show_dashboard", "unusual spending", lambda: find_anomalies(cursor, user_id, day)),
+    ]
+    
+    for period in ("all", "month", "week", "today"):
+        queries.append(("load_expenses", f"{period} expenses",
+                        lambda period=period: cursor.execute(*expense_list_query(user_id, period, day=day)).fetchall()))
+    queries.append(("load_expenses", "category filter",
+                    lambda: cursor.execute(*expense_list_query(user_id, "all", "Food", day=day)).fetchall()))
+    queries.append(("load_expenses", "search",
+                    lambda: cursor.execute(*expense_list_query(user_id, "all", search="bill", day=day)).fetchall()))
+    
+    for report_type in REPORT_BUILDERS:
+        for period in ("month", "year"):
+            queries.append(("show_reports", f"{report_type} report ({period})",
+                            lambda report_type=report_type, period=period: build_report(cursor, user_id, report_type, period)))
+    
+    queries.append(("manage_budget", "budget history", lambda: budget_history(cursor, user_id)))
+    queries.append(("manage_budget", "monthly history", lambda: load_monthly_history(cursor, user_id)))
+    queries.append(("manage_challenges", "challenge progress",
+                    lambda: [category_month_spending(cursor, user_id, challenge[1], month)
+                             for challenge in current_challenges(cursor, user_id, month)]))
+    queries.append(("show_shared", "shared expenses", lambda: shared_expense_list(cursor, user_id)))
+    queries.append(("show_friend_balances", "friend balances", lambda: load_friend_balances(cursor, user_id)))
+    queries.append(("show_goals", "goals page", lambda: load_goals_page(cursor, user_id, 0)))
+    queries.append(("show_goals", "goal projections", lambda: project_goals(cursor, user_id, day)))
+    return queries
+
+def run_benchmarks(database, repeats=BENCHMARK_REPEATS, output=None):
+    # Time the screen queries for the busiest user, optionally writing the results as JSON
+    conn = connect_read_only(database)
+    cursor = conn.cursor()
+    
+    user = cursor.execute('''
+        SELECT user_id, COUNT(*) FROM expenses WHERE is_deleted=0 GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1
+    ''').fetchone()
+    if not user:
+        conn.close()
+        raise ValueError(f"{database} has no expenses to benchmark")
+    
+    results = []
+    for screen, name, run in benchmark_queries(cursor, user[0], datetime.date.today()):
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            data = run()
+            timings.append((time.perf_counter() - started) * 1000)
+        
+        timings.sort()
+        results.append({
+            "screen": screen,
+            "query": name,
+            "median_ms": round(timings[len(timings) // 2], 3),
+            "min_ms": round(timings[0], 3),
+            "max_ms": round(timings[-1], 3),
+            "rows": len(data) if isinstance(data, (list, dict)) else 1,
+        })
+        print(f"{screen:<22} {name:<32} {results[-1]['median_ms']:>10.2f} ms")
+    
+    tables = {}
+    for table in ("users", "expenses", "shared_expenses", "friends", "budgets", "goals", "goal_contributions",
+                  "challenges"):
+        tables[table] = cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    conn.close()
+    
+    summary = {
+        "database": os.path.abspath(database),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "sqlite_version": sqlite3.sqlite_version,
+        "python_version": sys.version.split()[0],
+        "user_id": user[0],
+        "user_expenses": user[1],
+        "repeats": repeats,
+        "tables": tables,
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Wrote {output}")
+    return summary
+
 class ExpenseTracker:
     def __init__(self, root):
         self.root = root
@@ -17,109 +2912,21 @@ class ExpenseTracker:
         self.root.geometry("1200x700")
         self.current_user = None
         self.theme = "light"
+        self.report_cache = {}
+        self.report_figures = {}
+        self.report_task = None
+        self.category_model = None
+        self.goal_projections = None
         self.setup_database()
         self.load_settings()
+        self.start_trash_purge()
         self.create_login_screen()
         
     def setup_database(self):
-        self.conn = sqlite3.connect('expense_tracker.db')
+        self.conn = connect_instrumented(DATABASE_FILE)
         self.cursor = self.conn.cursor()
         
-        # Users table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                email TEXT,
-                theme TEXT DEFAULT 'light'
-            )
-        ''')
-        
-        # Expenses table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expenses (
-                expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                category TEXT NOT NULL,
-                date TEXT NOT NULL,
-                description TEXT,
-                is_deleted INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Goals table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS goals (
-                goal_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                goal_name TEXT NOT NULL,
-                target_amount REAL NOT NULL,
-                current_amount REAL DEFAULT 0,
-                target_date TEXT,
-                created_date TEXT NOT NULL,
-                is_completed INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Shared expenses table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shared_expenses (
-                shared_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                expense_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                friend_name TEXT NOT NULL,
-                amount_owed REAL NOT NULL,
-                is_paid INTEGER DEFAULT 0,
-                FOREIGN KEY (expense_id) REFERENCES expenses (expense_id),
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Categories table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS categories (
-                category_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                category_name TEXT NOT NULL,
-                monthly_limit REAL,
-                is_locked INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                UNIQUE(user_id, category_name)
-            )
-        ''')
-        
-        # Budgets table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS budgets (
-                budget_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                month_year TEXT NOT NULL,
-                amount REAL NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                UNIQUE(user_id, month_year)
-            )
-        ''')
-        
-        # Challenges table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS challenges (
-                challenge_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                category TEXT NOT NULL,
-                target_amount REAL NOT NULL,
-                start_date TEXT NOT NULL,
-                end_date TEXT NOT NULL,
-                current_amount REAL DEFAULT 0,
-                is_completed INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        self.conn.commit()
+        create_schema(self.conn)
         
         # Add default categories if they don't exist
         default_categories = [
@@ -289,6 +3096,8 @@ class ExpenseTracker:
             self.load_settings()
             # Destroy login frame
             self.login_frame.destroy()
+            # Materialize recurring expenses and templated budgets that fell due
+            self.generate_recurring_entries()
             # Check if budget is set
             now = datetime.datetime.now()
             current_month = now.strftime("%Y-%m")
@@ -305,6 +3114,98 @@ class ExpenseTracker:
         else:
             messagebox.showerror("Error", "Invalid username or password")
     
+    def generate_recurring_entries(self):
+        today = datetime.date.today()
+        user_id = self.current_user[0]
+        
+        self.cursor.execute('''
+            SELECT recurring_id, amount, category, description, frequency, start_date, end_date, occurrences
+            FROM recurring_expenses 
+            WHERE user_id=? AND is_active=1 AND next_date <= ?
+        ''', (user_id, today.strftime("%Y-%m-%d")))
+        
+        new_expenses = []
+        rule_updates = []
+        
+        for recurring_id, amount, category, description, frequency, start, end, occurrences in self.cursor.fetchall():
+            start_date = datetime.datetime.strptime(start, "%Y-%m-%d").date()
+            end_date = datetime.datetime.strptime(end, "%Y-%m-%d").date() if end else None
+            last_date = min(today, end_date) if end_date else today
+            
+            # Collect every occurrence that became due since the last login
+            index = occurrences
+            due_date = recurrence_date(start_date, frequency, index)
+            while due_date <= last_date:
+                new_expenses.append((user_id, amount, category, due_date.strftime("%Y-%m-%d"), description))
+                index += 1
+                due_date = recurrence_date(start_date, frequency, index)
+            
+            is_active = 0 if end_date and due_date > end_date else 1
+            rule_updates.append((due_date.strftime("%Y-%m-%d"), index, is_active, recurring_id))
+        
+        # Fill every month since the last budget with the user's budget template
+        new_budgets = []
+        self.cursor.execute('''
+            SELECT amount, start_month 
+            FROM budget_templates 
+            WHERE user_id=? AND is_active=1
+        ''', (user_id,))
+        template = self.cursor.fetchone()
+        
+        if template:
+            amount, start_month = template
+            self.cursor.execute("SELECT MAX(month_year) FROM budgets WHERE user_id=?", (user_id,))
+            last_month = self.cursor.fetchone()[0]
+            
+            month = datetime.datetime.strptime(max(start_month, last_month or start_month), "%Y-%m").date()
+            if last_month and last_month >= start_month:
+                month = add_months(month, 1)
+            
+            while month <= today:
+                new_budgets.append((user_id, month.strftime("%Y-%m"), amount))
+                month = add_months(month, 1)
+        
+        if not new_expenses and not rule_updates and not new_budgets:
+            return
+        
+        # Write everything in a single transaction
+        with self.conn:
+            self.cursor.executemany('''
+                INSERT INTO expenses (user_id, amount, category, date, description)
+                VALUES (?, ?, ?, ?, ?)
+            ''', new_expenses)
+            self.cursor.executemany('''
+                UPDATE recurring_expenses 
+                SET next_date=?, occurrences=?, is_active=? 
+                WHERE recurring_id=?
+            ''', rule_updates)
+            self.cursor.executemany('''
+                INSERT OR IGNORE INTO budgets (user_id, month_year, amount)
+                VALUES (?, ?, ?)
+            ''', new_budgets)
+    
+    def save_budget_template(self, amount, enabled):
+        if enabled:
+            self.cursor.execute('''
+                INSERT OR REPLACE INTO budget_templates (user_id, amount, start_month, is_active)
+                VALUES (?, ?, ?, 1)
+            ''', (self.current_user[0], amount, datetime.datetime.now().strftime("%Y-%m")))
+        else:
+            self.cursor.execute('''
+                UPDATE budget_templates 
+                SET is_active=0 
+                WHERE user_id=?
+            ''', (self.current_user[0],))
+    
+    def get_budget_template(self):
+        self.cursor.execute('''
+            SELECT amount FROM budget_templates 
+            WHERE user_id=? AND is_active=1
+        ''', (self.current_user[0],))
+        
+        result = self.cursor.fetchone()
+        return result[0] if result else None
+    
     def load_settings(self):
         if self.current_user:
             self.theme = self.current_user[4] if self.current_user[4] else "light"
@@ -325,6 +3226,7 @@ class ExpenseTracker:
             file_menu = tk.Menu(self.menu_bar, tearoff=0)
             file_menu.add_command(label="Dashboard", command=self.show_dashboard)
             file_menu.add_command(label="Add Expense", command=self.show_add_expense)
+            file_menu.add_command(label="Import Expenses", command=self.import_expenses)
             file_menu.add_command(label="View Expenses", command=self.show_expenses)
             file_menu.add_command(label="Reports", command=self.show_reports)
             file_menu.add_separator()
@@ -342,28 +3244,39 @@ class ExpenseTracker:
             shared_menu = tk.Menu(self.menu_bar, tearoff=0)
             shared_menu.add_command(label="Add Shared Expense", command=self.show_add_shared)
             shared_menu.add_command(label="View Shared Expenses", command=self.show_shared)
+            shared_menu.add_command(label="Friend Balances", command=self.show_friend_balances)
             self.menu_bar.add_cascade(label="Shared", menu=shared_menu)
             
             # Settings menu
             settings_menu = tk.Menu(self.menu_bar, tearoff=0)
             settings_menu.add_command(label="Categories", command=self.manage_categories)
             settings_menu.add_command(label="Budget", command=self.manage_budget)
+            settings_menu.add_command(label="Recurring Expenses", command=self.manage_recurring)
             settings_menu.add_command(label="Challenges", command=self.manage_challenges)
             settings_menu.add_command(label="Profile", command=self.manage_profile)
             settings_menu.add_command(label="Change Theme", command=self.toggle_theme)
+            settings_menu.add_separator()
+            settings_menu.add_command(label="Diagnostics", command=self.show_diagnostics)
             self.menu_bar.add_cascade(label="Settings", menu=settings_menu)
             
             self.root.config(menu=self.menu_bar)
             
-            # Create main frame
-            self.main_frame = ttk.Frame(self.root)
-            self.main_frame.pack(fill=tk.BOTH, expand=True)
+            # Each screen is built once into its own frame in this container and raised
+            # when shown again; screen name -> {"frame", "version", "refresh"}
+            self.screen_container = ttk.Frame(self.root)
+            self.screen_container.pack(fill=tk.BOTH, expand=True)
+            self.screen_container.grid_rowconfigure(0, weight=1)
+            self.screen_container.grid_columnconfigure(0, weight=1)
+            self.screens = {}
+            self.main_frame = None
             
             # Show dashboard by default
             self.show_dashboard()
     
+    @traced("screen")
     def show_dashboard(self):
-        self.clear_main_frame()
+        if self.raise_screen("show_dashboard", self.refresh_dashboard):
+            return
         
         # Header
         header_frame = ttk.Frame(self.main_frame)
@@ -372,46 +3285,21 @@ class ExpenseTracker:
         ttk.Label(header_frame, text=f"Welcome, {self.current_user[1]}", font=('Helvetica', 14, 'bold')).pack(side=tk.LEFT)
         
         # Current month and year
-        now = datetime.datetime.now()
-        current_month = now.strftime("%B %Y")
-        ttk.Label(header_frame, text=current_month, font=('Helvetica', 12)).pack(side=tk.RIGHT)
+        self.dashboard_month_label = ttk.Label(header_frame, font=('Helvetica', 12))
+        self.dashboard_month_label.pack(side=tk.RIGHT)
         
-        # Summary cards
+        # Summary cards, their values are filled in by refresh_dashboard
         summary_frame = ttk.Frame(self.main_frame)
         summary_frame.pack(fill=tk.X, padx=10, pady=10)
         
-        # Get summary data
-        total_expenses = self.get_monthly_expenses()
-        budget = self.get_current_budget()
-        savings = budget - total_expenses if budget else 0
-        top_category = self.get_top_category()
-        
-        # Expense card
-        expense_card = ttk.Frame(summary_frame, relief=tk.RIDGE, borderwidth=2)
-        expense_card.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.BOTH)
-        ttk.Label(expense_card, text="Total Expenses", font=('Helvetica', 10, 'bold')).pack(pady=5)
-        ttk.Label(expense_card, text=f"PKR {total_expenses:,.2f}", font=('Helvetica', 14)).pack(pady=5)
-        
-        # Budget card
-        budget_card = ttk.Frame(summary_frame, relief=tk.RIDGE, borderwidth=2)
-        budget_card.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.BOTH)
-        ttk.Label(budget_card, text="Monthly Budget", font=('Helvetica', 10, 'bold')).pack(pady=5)
-        budget_text = f"PKR {budget:,.2f}" if budget else "Not set"
-        ttk.Label(budget_card, text=budget_text, font=('Helvetica', 14)).pack(pady=5)
-        
-        # Savings card
-        savings_card = ttk.Frame(summary_frame, relief=tk.RIDGE, borderwidth=2)
-        savings_card.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.BOTH)
-        ttk.Label(savings_card, text="Savings", font=('Helvetica', 10, 'bold')).pack(pady=5)
-        savings_text = f"PKR {savings:,.2f}" if budget else "Budget not set"
-        ttk.Label(savings_card, text=savings_text, font=('Helvetica', 14)).pack(pady=5)
-        
-        # Top category card
-        category_card = ttk.Frame(summary_frame, relief=tk.RIDGE, borderwidth=2)
-        category_card.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.BOTH)
-        ttk.Label(category_card, text="Top Category", font=('Helvetica', 10, 'bold')).pack(pady=5)
-        category_text = top_category if top_category else "No expenses"
-        ttk.Label(category_card, text=category_text, font=('Helvetica', 14)).pack(pady=5)
+        self.dashboard_cards = {}
+        for key, title in (("expenses", "Total Expenses"), ("budget", "Monthly Budget"),
+                           ("savings", "Savings"), ("category", "Top Category")):
+            card = ttk.Frame(summary_frame, relief=tk.RIDGE, borderwidth=2)
+            card.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.BOTH)
+            ttk.Label(card, text=title, font=('Helvetica', 10, 'bold')).pack(pady=5)
+            self.dashboard_cards[key] = ttk.Label(card, font=('Helvetica', 14))
+            self.dashboard_cards[key].pack(pady=5)
         
         # Charts frame
         charts_frame = ttk.Frame(self.main_frame)
@@ -421,13 +3309,17 @@ class ExpenseTracker:
         pie_frame = ttk.Frame(charts_frame)
         pie_frame.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
         ttk.Label(pie_frame, text="Expense by Category", font=('Helvetica', 10, 'bold')).pack()
-        self.create_pie_chart(pie_frame)
+        self.pie_chart = self.create_chart_canvas(pie_frame)
         
         # Bar chart
         bar_frame = ttk.Frame(charts_frame)
         bar_frame.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
         ttk.Label(bar_frame, text="Monthly Trend", font=('Helvetica', 10, 'bold')).pack()
-        self.create_bar_chart(bar_frame)
+        self.bar_chart = self.create_chart_canvas(bar_frame)
+        
+        # Unusual spending this month
+        self.anomaly_frame = ttk.Frame(self.main_frame)
+        self.anomaly_frame.pack(fill=tk.X, padx=10)
         
         # Recent expenses
         recent_frame = ttk.Frame(self.main_frame)
@@ -444,6 +3336,34 @@ class ExpenseTracker:
         
         self.recent_tree.pack(fill=tk.BOTH, expand=True)
         
+        self.refresh_dashboard()
+    
+    @traced("refresh")
+    def refresh_dashboard(self):
+        # Fill the dashboard's widgets with current data, the widgets and canvases are reused
+        now = datetime.datetime.now()
+        self.dashboard_month_label.config(text=now.strftime("%B %Y"))
+        
+        # Get summary data
+        total_expenses = self.get_monthly_expenses()
+        budget = self.get_current_budget()
+        savings = budget - total_expenses if budget else 0
+        top_category = self.get_top_category()
+        
+        self.dashboard_cards["expenses"].config(text=f"PKR {total_expenses:,.2f}")
+        self.dashboard_cards["budget"].config(text=f"PKR {budget:,.2f}" if budget else "Not set")
+        self.dashboard_cards["savings"].config(text=f"PKR {savings:,.2f}" if budget else "Budget not set")
+        self.dashboard_cards["category"].config(text=top_category if top_category else "No expenses")
+        
+        self.draw_pie_chart()
+        self.draw_bar_chart()
+        
+        for widget in self.anomaly_frame.winfo_children():
+            widget.destroy()
+        ttk.Label(self.anomaly_frame, text="Unusual Spending", font=('Helvetica', 12, 'bold')).pack(anchor=tk.W)
+        for line in self.get_anomaly_summary():
+            ttk.Label(self.anomaly_frame, text=line).pack(anchor=tk.W)
+        
         # Load recent expenses
         self.load_recent_expenses()
         
@@ -455,17 +3375,41 @@ class ExpenseTracker:
             elif percentage > 80:
                 messagebox.showwarning("Budget Alert", f"You have used {percentage:.2f}% of your budget. Consider reducing expenses.")
     
+    def get_anomaly_summary(self, limit=5):
+        anomalies = find_anomalies(self.cursor, self.current_user[0])
+        
+        lines = []
+        for result in anomalies["categories"]:
+            lines.append(f"{result['category']}: PKR {result['total']:,.2f} this month, "
+                         f"usually around PKR {result['typical']:,.2f}")
+        for expense in anomalies["expenses"]:
+            lines.append(f"{expense['date']} {expense['category']}: PKR {expense['amount']:,.2f}, "
+                         f"usually around PKR {expense['typical']:,.2f}")
+        
+        if not lines:
+            return ["Nothing unusual this month"]
+        return lines[:limit]
+    
+    def check_expense_anomalies(self, category, amount, date):
+        # Notes for a just-saved expense, read from the rollups so it stays fast enough to run on every save
+        notes = []
+        
+        expense = expense_anomaly(self.cursor, self.current_user[0], category, amount)
+        if expense and expense["unusual"]:
+            notes.append(f"This is much more than you usually spend on {category} "
+                         f"(around PKR {expense['typical']:,.2f}).")
+        
+        month = date[:7]
+        for result in category_month_anomalies(self.cursor, self.current_user[0], month, category):
+            if result["unusual"]:
+                notes.append(f"{category} spending for {month} is PKR {result['total']:,.2f}, "
+                             f"well above your usual PKR {result['typical']:,.2f}.")
+        
+        return notes
+    
     def get_monthly_expenses(self):
         now = datetime.datetime.now()
-        month_year = now.strftime("%Y-%m")
-        
-        self.cursor.execute('''
-            SELECT COALESCE(SUM(amount), 0) 
-            FROM expenses 
-            WHERE user_id=? AND strftime('%Y-%m', date)=? AND is_deleted=0
-        ''', (self.current_user[0], month_year))
-        
-        return self.cursor.fetchone()[0]
+        return month_total(self.cursor, self.current_user[0], now.strftime("%Y-%m"))
     
     def get_current_budget(self):
         now = datetime.datetime.now()
@@ -483,91 +3427,76 @@ class ExpenseTracker:
         now = datetime.datetime.now()
         month_year = now.strftime("%Y-%m")
         
-        self.cursor.execute('''
-            SELECT category, SUM(amount) as total 
-            FROM expenses 
-            WHERE user_id=? AND strftime('%Y-%m', date)=? AND is_deleted=0
-            GROUP BY category 
-            ORDER BY total DESC 
-            LIMIT 1
-        ''', (self.current_user[0], month_year))
+        totals = month_category_totals(self.cursor, self.current_user[0], month_year)
         
-        result = self.cursor.fetchone()
-        return f"{result[0]}: PKR {result[1]:,.2f}" if result else None
+        return f"{totals[0][0]}: PKR {totals[0][1]:,.2f}" if totals else None
+    
+    def create_chart_canvas(self, parent):
+        # (axes, canvas) of a dashboard chart, redrawn in place on every refresh
+        fig, ax = plt.subplots(figsize=(5, 4))
+        canvas = FigureCanvasTkAgg(fig, master=parent)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        return ax, canvas
     
-    def create_pie_chart(self, parent):
+    @traced("chart")
+    def draw_pie_chart(self):
+        ax, canvas = self.pie_chart
+        ax.clear()
+        
         now = datetime.datetime.now()
         month_year = now.strftime("%Y-%m")
 
-        self.cursor.execute('''
-            SELECT category, SUM(amount) as total 
-            FROM expenses 
-            WHERE user_id=? AND strftime('%Y-%m', date)=? AND is_deleted=0
-            GROUP BY category
-        ''', (self.current_user[0], month_year))
-
-        data = self.cursor.fetchall()
+        data = month_category_totals(self.cursor, self.current_user[0], month_year)
 
         # Filter out categories with non-positive totals
         filtered_data = [(cat, amt) for cat, amt in data if amt > 0]
 
-        if not filtered_data:
-            ttk.Label(parent, text="No expense data available").pack()
-            return
-
-        categories = [item[0] for item in filtered_data]
-        amounts = [item[1] for item in filtered_data]
+        if filtered_data:
+            categories = [item[0] for item in filtered_data]
+            amounts = [item[1] for item in filtered_data]
 
-        fig, ax = plt.subplots(figsize=(5, 4))
-        ax.pie(amounts, labels=categories, autopct='%1.1f%%', startangle=90)
-        ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-        ax.set_title('Expense Distribution')
+            ax.pie(amounts, labels=categories, autopct='%1.1f%%', startangle=90)
+            ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+            ax.set_title('Expense Distribution')
+        else:
+            ax.axis('off')
+            ax.text(0.5, 0.5, "No expense data available", ha='center', va='center')
 
-        canvas = FigureCanvasTkAgg(fig, master=parent)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        with TRACER.span("canvas draw", "draw"):
+            canvas.draw()
     
-    def create_bar_chart(self, parent):
+    @traced("chart")
+    def draw_bar_chart(self):
+        ax, canvas = self.bar_chart
+        ax.clear()
+        
         # Get data for last 6 months
-        now = datetime.datetime.now()
-        months = []
-        totals = []
+        today = datetime.date.today()
+        current_month = period_start("month", today)
+        buckets = []
         
         for i in range(5, -1, -1):
-            month = (now - datetime.timedelta(days=30*i)).strftime("%Y-%m")
-            months.append(month)
-            
-            self.cursor.execute('''
-                SELECT COALESCE(SUM(amount), 0) 
-                FROM expenses 
-                WHERE user_id=? AND strftime('%Y-%m', date)=? AND is_deleted=0
-            ''', (self.current_user[0], month))
-            
-            totals.append(self.cursor.fetchone()[0])
+            start = shift_period("month", current_month, -i)
+            end = shift_period("month", start, 1)
+            buckets.append((start, end, start.strftime("%Y-%m")))
+        
+        months = [bucket[2] for bucket in buckets]
+        totals = sum_by_buckets(self.cursor, self.current_user[0], buckets)
         
-        fig, ax = plt.subplots(figsize=(5, 4))
         ax.bar(months, totals)
         ax.set_title('Monthly Spending Trend')
         ax.set_ylabel('Amount (PKR)')
         ax.tick_params(axis='x', rotation=45)
         
-        canvas = FigureCanvasTkAgg(fig, master=parent)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        with TRACER.span("canvas draw", "draw"):
+            canvas.draw()
     
+    @traced("populate")
     def load_recent_expenses(self):
         for item in self.recent_tree.get_children():
             self.recent_tree.delete(item)
         
-        self.cursor.execute('''
-            SELECT date, category, amount, description 
-            FROM expenses 
-            WHERE user_id=? AND is_deleted=0
-            ORDER BY date DESC 
-            LIMIT 10
-        ''', (self.current_user[0],))
-        
-        for expense in self.cursor.fetchall():
+        for expense in recent_expenses(self.cursor, self.current_user[0]):
             formatted_date = datetime.datetime.strptime(expense[0], "%Y-%m-%d").strftime("%d %b %Y")
             self.recent_tree.insert("", tk.END, values=(
                 formatted_date, 
@@ -576,8 +3505,10 @@ class ExpenseTracker:
                 expense[3] if expense[3] else ""
             ))
     
+    @traced("screen")
     def show_add_expense(self):
-        self.clear_main_frame()
+        if self.raise_screen("show_add_expense", cached=False):
+            return
         
         ttk.Label(self.main_frame, text="Add New Expense", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
@@ -594,6 +3525,12 @@ class ExpenseTracker:
         self.category_var = tk.StringVar()
         self.category_combo = ttk.Combobox(form_frame, textvariable=self.category_var)
         self.category_combo.grid(row=1, column=1, padx=5, pady=5)
+        self.category_hint = ttk.Label(form_frame, text="", foreground="gray")
+        self.category_hint.grid(row=1, column=2, padx=5, pady=5, sticky=tk.W)
+        
+        # Suggestions stop once a category is picked by hand
+        self.category_chosen = False
+        self.category_combo.bind("<<ComboboxSelected>>", lambda event: setattr(self, "category_chosen", True))
         
         # Load categories
         self.load_categories()
@@ -608,6 +3545,14 @@ class ExpenseTracker:
         ttk.Label(form_frame, text="Description:").grid(row=3, column=0, padx=5, pady=5, sticky=tk.E)
         self.desc_entry = ttk.Entry(form_frame)
         self.desc_entry.grid(row=3, column=1, padx=5, pady=5)
+        self.desc_entry.bind("<KeyRelease>", self.suggest_category)
+        
+        # Repeat
+        ttk.Label(form_frame, text="Repeat:").grid(row=4, column=0, padx=5, pady=5, sticky=tk.E)
+        self.repeat_var = tk.StringVar(value="Never")
+        repeat_combo = ttk.Combobox(form_frame, textvariable=self.repeat_var, state="readonly")
+        repeat_combo['values'] = ["Never"] + [frequency.capitalize() for frequency in RECURRING_FREQUENCIES]
+        repeat_combo.grid(row=4, column=1, padx=5, pady=5)
         
         # Buttons
         button_frame = ttk.Frame(self.main_frame)
@@ -619,6 +3564,90 @@ class ExpenseTracker:
         # Check for category limits
         self.check_category_limits()
     
+    def confirm_not_duplicate(self, amount, date, description):
+        duplicates = find_duplicates(self.cursor, self.current_user[0], amount, date, description)
+        if not duplicates:
+            return True
+        
+        _, existing_date, category, _, existing_description = duplicates[0]
+        details = f"{category}, {existing_description}" if existing_description else category
+        return messagebox.askyesno(
+            "Possible Duplicate",
+            f"You already have an expense of PKR {amount:,.2f} on {existing_date} ({details}).\n\nSave it anyway?")
+    
+    def get_category_model(self):
+        # Description -> category model of the current user, loaded once per login
+        if not self.category_model or self.category_model[0] != self.current_user[0]:
+            self.category_model = (self.current_user[0], load_category_model(self.cursor, self.current_user[0]))
+        return self.category_model[1]
+    
+    def suggest_category(self, event=None):
+        if self.category_chosen:
+            return
+        
+        category = self.get_category_model().suggest(self.desc_entry.get(), self.category_combo['values'])
+        if category:
+            self.category_var.set(category)
+            self.category_hint.config(text="Suggested from description")
+        else:
+            self.category_hint.config(text="")
+    
+    def import_expenses(self):
+        file_path = filedialog.askopenfilename(
+            filetypes=[("CSV files", "*.csv")],
+            title="Import expenses (columns: date, amount, description, category)"
+        )
+        
+        if not file_path:
+            return
+        
+        try:
+            frame = pd.read_csv(file_path, dtype=str)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to read file: {str(e)}")
+            return
+        
+        if not {"date", "amount"} <= {str(column).strip().lower() for column in frame.columns}:
+            messagebox.showerror("Error", "The file needs at least a date and an amount column")
+            return
+        
+        self.cursor.execute("SELECT category_name FROM categories WHERE user_id=?", (self.current_user[0],))
+        categories = [row[0] for row in self.cursor.fetchall()]
+        
+        model = self.get_category_model()
+        rows, skipped = prepare_expense_import(frame, model, categories)
+        
+        duplicate = np.array([bool(find_duplicates(self.cursor, self.current_user[0], amount, date, description))
+                              for date, amount, description in rows[["date", "amount", "description"]].itertuples(index=False)],
+                             dtype=bool)
+        if duplicate.any() and messagebox.askyesno(
+                "Possible Duplicates",
+                f"{duplicate.sum()} row(s) look like expenses you already have.\n\nSkip them?"):
+            rows = rows[~duplicate]
+        classified = int(rows["classified"].sum())
+        
+        self.cursor.executemany('''
+            INSERT INTO expenses (user_id, amount, category, date, description)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(self.current_user[0], amount, category, date, description)
+              for date, amount, description, category, _ in rows.itertuples(index=False)])
+        
+        # Learn only from categories given in the file
+        labeled = list(rows.loc[~rows["classified"], ["category", "description"]].itertuples(index=False, name=None))
+        record_category_tokens(self.cursor, self.current_user[0], labeled)
+        self.conn.commit()
+        
+        for category, description in labeled:
+            model.learn(category, description)
+        
+        message = f"Imported {len(rows)} expense(s)"
+        if classified:
+            message += f", {classified} categorized automatically"
+        if skipped:
+            message += f"\nSkipped {skipped} row(s) with an invalid date or amount"
+        messagebox.showinfo("Import", message)
+        self.show_dashboard()
+    
     def load_categories(self):
         self.cursor.execute("SELECT category_name FROM categories WHERE user_id=?", (self.current_user[0],))
         categories = [row[0] for row in self.cursor.fetchall()]
@@ -654,8 +3683,8 @@ class ExpenseTracker:
             self.cursor.execute('''
                 SELECT COALESCE(SUM(amount), 0) 
                 FROM expenses 
-                WHERE user_id=? AND category=? AND strftime('%Y-%m', date)=? AND is_deleted=0
-            ''', (self.current_user[0], category, month_year))
+                WHERE user_id=? AND category=? AND date >= ? AND date < ? AND is_deleted=0
+            ''', (self.current_user[0], category) + month_range(month_year))
             
             spent = self.cursor.fetchone()[0]
             
@@ -703,18 +3732,43 @@ class ExpenseTracker:
                 messagebox.showerror("Error", f"The {category} category is locked as you've exceeded its monthly limit.")
                 return
             
+            if not self.confirm_not_duplicate(amount, date, description):
+                return
+            
             # Save expense
             self.cursor.execute('''
                 INSERT INTO expenses (user_id, amount, category, date, description)
                 VALUES (?, ?, ?, ?, ?)
             ''', (self.current_user[0], amount, category, date, description))
             
+            record_category_tokens(self.cursor, self.current_user[0], [(category, description)])
+            
+            # Save recurring rule, the expense above is its first occurrence
+            frequency = self.repeat_var.get().lower()
+            if frequency in RECURRING_FREQUENCIES:
+                start_date = datetime.datetime.strptime(date, "%Y-%m-%d").date()
+                self.cursor.execute('''
+                    INSERT INTO recurring_expenses 
+                        (user_id, amount, category, description, frequency, start_date, next_date, occurrences)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+                ''', (self.current_user[0], amount, category, description, frequency, date,
+                     recurrence_date(start_date, frequency, 1).strftime("%Y-%m-%d")))
+            
             self.conn.commit()
+            self.get_category_model().learn(category, description)
+            
+            # Back-dated rules may already have further occurrences due
+            if frequency in RECURRING_FREQUENCIES:
+                self.generate_recurring_entries()
             
             # Check category limits
             self.check_category_limits()
             
-            messagebox.showinfo("Success", "Expense added successfully")
+            notes = self.check_expense_anomalies(category, amount, date)
+            if notes:
+                messagebox.showwarning("Unusual Spending", "Expense added successfully\n\n" + "\n".join(notes))
+            else:
+                messagebox.showinfo("Success", "Expense added successfully")
             self.show_dashboard()
             
         except ValueError:
@@ -722,8 +3776,10 @@ class ExpenseTracker:
     
     
     
+    @traced("screen")
     def show_expenses(self, period="all"):
-        self.clear_main_frame()
+        if self.raise_screen("show_expenses", key=(period, None, None)):
+            return
         
         ttk.Label(self.main_frame, text="View Expenses", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
@@ -735,13 +3791,13 @@ class ExpenseTracker:
         
         self.filter_var = tk.StringVar(value=period)
         ttk.Radiobutton(filter_frame, text="All", variable=self.filter_var, value="all", 
-                        command=lambda: self.show_expenses("all")).pack(side=tk.LEFT, padx=5)
+                        command=self.apply_expense_filters).pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(filter_frame, text="This Month", variable=self.filter_var, value="month", 
-                        command=lambda: self.show_expenses("month")).pack(side=tk.LEFT, padx=5)
+                        command=self.apply_expense_filters).pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(filter_frame, text="This Week", variable=self.filter_var, value="week", 
-                        command=lambda: self.show_expenses("week")).pack(side=tk.LEFT, padx=5)
+                        command=self.apply_expense_filters).pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(filter_frame, text="Today", variable=self.filter_var, value="today", 
-                        command=lambda: self.show_expenses("today")).pack(side=tk.LEFT, padx=5)
+                        command=self.apply_expense_filters).pack(side=tk.LEFT, padx=5)
         
         # Category filter
         ttk.Label(filter_frame, text="Category:").pack(side=tk.LEFT, padx=(10, 5))
@@ -763,7 +3819,8 @@ class ExpenseTracker:
         
         # Treeview for expenses
         columns = ("ID", "Date", "Category", "Amount", "Description", "Actions")
-        self.expense_tree = ttk.Treeview(self.main_frame, columns=columns, show="headings", height=15)
+        self.expense_tree = ttk.Treeview(self.main_frame, columns=columns, show="headings", height=15, selectmode="extended")
+        self.expense_tree.bind("<Control-a>", lambda event: self.expense_tree.selection_set(self.expense_tree.get_children()))
         
         for col in columns:
             self.expense_tree.heading(col, text=col)
@@ -783,66 +3840,133 @@ class ExpenseTracker:
         ttk.Button(action_frame, text="Edit", command=self.edit_expense).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Delete", command=self.delete_expense).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Undo Delete", command=self.undo_delete_expense).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="Find Duplicates", command=self.show_duplicates).pack(side=tk.LEFT, padx=5)
         ttk.Button(action_frame, text="Back", command=self.show_dashboard).pack(side=tk.LEFT, padx=5)
         
         # Load expenses
         self.load_expenses(period)
     
+    @traced("populate")
     def load_expenses(self, period="all", category=None, search=None):
         for item in self.expense_tree.get_children():
             self.expense_tree.delete(item)
         
-        query = '''
+        # The listed rows by expense_id and their (date, expense_id) sort keys in ascending
+        # order, so edits can patch the list in place instead of reloading it
+        self.expense_filter = (period, category, search)
+        self.screens["show_expenses"]["key"] = self.expense_filter
+        self.expense_rows = {}
+        self.expense_order = []
+        
+        self.cursor.execute(*expense_list_query(self.current_user[0], period, category, search))
+        
+        for expense in self.cursor.fetchall():
+            self.expense_tree.insert("", tk.END, iid=str(expense[0]), values=self.expense_values(*expense))
+            self.expense_rows[expense[0]] = expense[1:]
+            self.expense_order.append((expense[1], expense[0]))
+        
+        self.expense_order.reverse()
+    
+    def expense_values(self, expense_id, date, category, amount, description):
+        formatted_date = datetime.datetime.strptime(date, "%Y-%m-%d").strftime("%d %b %Y")
+        return (
+            expense_id, 
+            formatted_date, 
+            category, 
+            f"PKR {amount:,.2f}", 
+            description if description else "",
+            "Edit | Delete"
+        )
+    
+    def expense_matches_filter(self, date, category, description):
+        # Same conditions as the load_expenses query
+        period, category_filter, search = self.expense_filter
+        
+        if not self.date_in_period(date, period):
+            return False
+        if category_filter and category_filter != "All Categories" and category != category_filter:
+            return False
+        if search:
+            search = search.lower()
+            return search in category.lower() or search in (description or "").lower()
+        return True
+    
+    def date_in_period(self, date, period):
+        now = datetime.datetime.now()
+        if period == "month":
+            return date[:7] == now.strftime("%Y-%m")
+        if period == "week":
+            return date >= (now - datetime.timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+        if period == "today":
+            return date == now.strftime("%Y-%m-%d")
+        return True
+    
+    def upsert_expense_rows(self, expenses):
+        # Insert or update (expense_id, date, category, amount, description) rows at their sort
+        # position, dropping those the filters no longer match, without moving the scroll position
+        top = self.expense_tree.yview()[0]
+        
+        for expense_id, date, category, amount, description in expenses:
+            old = self.expense_rows.get(expense_id)
+            
+            if not self.expense_matches_filter(date, category, description):
+                if old:
+                    self.remove_expense_rows([expense_id])
+                continue
+            
+            self.expense_rows[expense_id] = (date, category, amount, description)
+            values = self.expense_values(expense_id, date, category, amount, description)
+            
+            if old and old[0] == date:
+                self.expense_tree.item(str(expense_id), values=values)
+                continue
+            
+            if old:
+                self.expense_order.pop(bisect.bisect_left(self.expense_order, (old[0], expense_id)))
+            
+            position = bisect.bisect_left(self.expense_order, (date, expense_id))
+            self.expense_order.insert(position, (date, expense_id))
+            index = len(self.expense_order) - 1 - position
+            
+            if old:
+                self.expense_tree.item(str(expense_id), values=values)
+                self.expense_tree.move(str(expense_id), "", index)
+            else:
+                self.expense_tree.insert("", index, iid=str(expense_id), values=values)
+        
+        self.expense_tree.yview_moveto(top)
+    
+    def remove_expense_rows(self, expense_ids):
+        for expense_id in expense_ids:
+            old = self.expense_rows.pop(expense_id, None)
+            if old:
+                self.expense_order.pop(bisect.bisect_left(self.expense_order, (old[0], expense_id)))
+                self.expense_tree.delete(str(expense_id))
+    
+    def refresh_expense_rows(self, expense_ids):
+        # Re-read changed expenses and patch them into the list
+        if not self.expense_tree.winfo_exists():
+            return
+        
+        placeholders = ",".join("?" * len(expense_ids))
+        self.cursor.execute(f'''
             SELECT expense_id, date, category, amount, description 
             FROM expenses 
-            WHERE user_id=? AND is_deleted=0
-        '''
-        params = [self.current_user[0]]
-        
-        now = datetime.datetime.now()
-        
-        if period == "month":
-            month_year = now.strftime("%Y-%m")
-            query += " AND strftime('%Y-%m', date)=?"
-            params.append(month_year)
-        elif period == "week":
-            week_start = (now - datetime.timedelta(days=now.weekday())).strftime("%Y-%m-%d")
-            query += " AND date >= ?"
-            params.append(week_start)
-        elif period == "today":
-            today = now.strftime("%Y-%m-%d")
-            query += " AND date=?"
-            params.append(today)
-        
-        if category and category != "All Categories":
-            query += " AND category=?"
-            params.append(category)
+            WHERE user_id=? AND is_deleted=0 AND expense_id IN ({placeholders})
+        ''', [self.current_user[0]] + list(expense_ids))
         
-        if search:
-            query += " AND (category LIKE ? OR description LIKE ?)"
-            params.extend([f"%{search}%", f"%{search}%"])
-        
-        query += " ORDER BY date DESC"
-        
-        self.cursor.execute(query, params)
-        
-        for expense in self.cursor.fetchall():
-            formatted_date = datetime.datetime.strptime(expense[1], "%Y-%m-%d").strftime("%d %b %Y")
-            self.expense_tree.insert("", tk.END, values=(
-                expense[0], 
-                formatted_date, 
-                expense[2], 
-                f"PKR {expense[3]:,.2f}", 
-                expense[4] if expense[4] else "",
-                "Edit | Delete"
-            ))
+        rows = self.cursor.fetchall()
+        live = {row[0] for row in rows}
+        self.remove_expense_rows([expense_id for expense_id in expense_ids if expense_id not in live])
+        self.upsert_expense_rows(rows)
     
     def apply_expense_filters(self):
         period = self.filter_var.get()
         category = self.expense_category_var.get()
         search = self.search_entry.get()
         
-        self.load_expenses(period, category if category != "" else None, search if search != "" else None)
+        self.load_expenses(period, category if category not in ("", "All Categories") else None,
+                           search if search != "" else None)
     
     def edit_expense(self):
         selected = self.expense_tree.selection()
@@ -850,8 +3974,11 @@ class ExpenseTracker:
             messagebox.showwarning("Warning", "Please select an expense to edit")
             return
         
-        item = self.expense_tree.item(selected[0])
-        expense_id = item['values'][0]
+        if len(selected) > 1:
+            self.bulk_edit_expenses(selected)
+            return
+        
+        expense_id = int(selected[0])
         
         # Get expense details
         self.cursor.execute('''
@@ -938,7 +4065,7 @@ class ExpenseTracker:
                 
                 messagebox.showinfo("Success", "Expense updated successfully")
                 edit_window.destroy()
-                self.show_expenses(self.filter_var.get())
+                self.upsert_expense_rows([(expense_id, date, category, amount, description)])
                 
             except ValueError:
                 messagebox.showerror("Error", "Invalid amount. Please enter a number")
@@ -946,52 +4073,142 @@ class ExpenseTracker:
         ttk.Button(button_frame, text="Save", command=save_changes).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Cancel", command=edit_window.destroy).pack(side=tk.LEFT, padx=5)
     
+    def bulk_edit_expenses(self, selected):
+        # Recategorize and/or re-date many expenses at once, empty fields are left unchanged
+        edit_window = tk.Toplevel(self.root)
+        edit_window.title("Edit Expenses")
+        edit_window.geometry("400x220")
+        
+        ttk.Label(edit_window, text=f"Edit {len(selected)} Expenses", font=('Helvetica', 12, 'bold')).pack(pady=10)
+        
+        form_frame = ttk.Frame(edit_window)
+        form_frame.pack(pady=10)
+        
+        # Category
+        ttk.Label(form_frame, text="Category:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.E)
+        category_var = tk.StringVar()
+        category_combo = ttk.Combobox(form_frame, textvariable=category_var)
+        category_combo.grid(row=0, column=1, padx=5, pady=5)
+        
+        self.cursor.execute("SELECT category_name FROM categories WHERE user_id=?", (self.current_user[0],))
+        category_combo['values'] = [row[0] for row in self.cursor.fetchall()]
+        
+        # Date
+        ttk.Label(form_frame, text="Date:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.E)
+        date_entry = ttk.Entry(form_frame)
+        date_entry.grid(row=1, column=1, padx=5, pady=5)
+        
+        ttk.Label(edit_window, text="Leave a field empty to keep the current values").pack()
+        
+        def save_changes():
+            category = category_var.get().strip() or None
+            date = date_entry.get().strip() or None
+            
+            if not category and not date:
+                messagebox.showwarning("Warning", "Enter a category or a date to change")
+                return
+            
+            if date:
+                try:
+                    datetime.datetime.strptime(date, "%Y-%m-%d")
+                except ValueError:
+                    messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
+                    return
+            
+            # One statement for every row, one commit
+            self.cursor.executemany('''
+                UPDATE expenses 
+                SET category=COALESCE(?, category), date=COALESCE(?, date) 
+                WHERE expense_id=? AND user_id=?
+            ''', [(category, date, int(item), self.current_user[0]) for item in selected])
+            
+            self.conn.commit()
+            
+            edit_window.destroy()
+            self.upsert_expense_rows([
+                (expense_id, date or old_date, category or old_category, amount, description)
+                for expense_id, (old_date, old_category, amount, description)
+                in ((int(item), self.expense_rows[int(item)]) for item in selected)])
+        
+        button_frame = ttk.Frame(edit_window)
+        button_frame.pack(pady=10)
+        
+        ttk.Button(button_frame, text="Save", command=save_changes).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=edit_window.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def start_trash_purge(self, user_id=None, on_done=None):
+        # Purge trash on a background thread with its own connection: expired items of every
+        # user, or all of user_id's. on_done(purged, error) runs back on the Tk thread.
+        task = {"done": False, "purged": 0, "error": None}
+        
+        def run():
+            conn = connect_instrumented(DATABASE_FILE, timeout=30)
+            try:
+                task["purged"] = purge_trash(conn, user_id)
+            except sqlite3.Error as e:
+                task["error"] = e
+            finally:
+                conn.close()
+                task["done"] = True
+        
+        threading.Thread(target=run, name="trash purge", daemon=True).start()
+        if on_done:
+            self.poll_trash_purge(task, on_done)
+    
+    def poll_trash_purge(self, task, on_done):
+        if task["done"]:
+            on_done(task["purged"], task["error"])
+        else:
+            self.root.after(100, self.poll_trash_purge, task, on_done)
+    
     def delete_expense(self):
         selected = self.expense_tree.selection()
         if not selected:
             messagebox.showwarning("Warning", "Please select an expense to delete")
             return
         
-        item = self.expense_tree.item(selected[0])
-        expense_id = item['values'][0]
+        if len(selected) == 1:
+            question = "Are you sure you want to delete this expense?"
+        else:
+            question = f"Are you sure you want to delete these {len(selected)} expenses?"
         
-        if messagebox.askyesno("Confirm", "Are you sure you want to delete this expense?"):
+        if messagebox.askyesno("Confirm", question):
             # Soft delete (move to trash)
-            self.cursor.execute('''
+            self.cursor.executemany('''
                 UPDATE expenses 
                 SET is_deleted=1 
-                WHERE expense_id=?
-            ''', (expense_id,))
+                WHERE expense_id=? AND user_id=?
+            ''', [(int(item), self.current_user[0]) for item in selected])
             
             self.conn.commit()
             
-            messagebox.showinfo("Success", "Expense moved to trash")
-            self.show_expenses(self.filter_var.get())
+            self.remove_expense_rows([int(item) for item in selected])
+            
+            messagebox.showinfo("Success", f"{len(selected)} expense(s) moved to trash")
     
     def undo_delete_expense(self):
-        # Show items in trash
+        # Show items in trash, one page at a time
         self.cursor.execute('''
-            SELECT expense_id, date, category, amount, description 
-            FROM expenses 
+            SELECT COUNT(*) FROM expenses 
             WHERE user_id=? AND is_deleted=1
-            ORDER BY date DESC
         ''', (self.current_user[0],))
         
-        deleted_expenses = self.cursor.fetchall()
+        trash_count = self.cursor.fetchone()[0]
         
-        if not deleted_expenses:
+        if not trash_count:
             messagebox.showinfo("Info", "Trash is empty")
             return
         
         # Create undo window
         undo_window = tk.Toplevel(self.root)
         undo_window.title("Restore Deleted Expenses")
-        undo_window.geometry("600x400")
+        undo_window.geometry("700x450")
         
         ttk.Label(undo_window, text="Deleted Expenses (Trash)", font=('Helvetica', 12, 'bold')).pack(pady=10)
         
-        columns = ("ID", "Date", "Category", "Amount", "Description")
-        tree = ttk.Treeview(undo_window, columns=columns, show="headings", height=10)
+        columns = ("ID", "Date", "Category", "Amount", "Description", "Deleted")
+        tree = ttk.Treeview(undo_window, columns=columns, show="headings", height=10, selectmode="extended")
+        tree.bind("<Control-a>", lambda event: tree.selection_set(tree.get_children()))
         
         for col in columns:
             tree.heading(col, text=col)
@@ -1000,972 +4217,563 @@ class ExpenseTracker:
         tree.column("ID", width=50)
         tree.column("Date", width=100)
         tree.column("Amount", width=100)
+        tree.column("Deleted", width=130)
         
         tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        for expense in deleted_expenses:
-            formatted_date = datetime.datetime.strptime(expense[1], "%Y-%m-%d").strftime("%d %b %Y")
-            tree.insert("", tk.END, values=(
-                expense[0], 
-                formatted_date, 
-                expense[2], 
-                f"PKR {expense[3]:,.2f}", 
-                expense[4] if expense[4] else ""
-            ))
+        page_label = ttk.Label(undo_window, text="")
+        page_label.pack()
+        
+        # (deleted_at, expense_id) each page shown so far starts after, for going back
+        pages = [None]
+        last_row = None
+        
+        def show_page():
+            nonlocal last_row
+            tree.delete(*tree.get_children())
+            page = load_trash_page(self.cursor, self.current_user[0], pages[-1])
+            
+            for expense in page:
+                formatted_date = datetime.datetime.strptime(expense[1], "%Y-%m-%d").strftime("%d %b %Y")
+                tree.insert("", tk.END, iid=str(expense[0]), values=(
+                    expense[0], 
+                    formatted_date, 
+                    expense[2], 
+                    f"PKR {expense[3]:,.2f}", 
+                    expense[4] if expense[4] else "",
+                    expense[5] or ""
+                ))
+            
+            last_row = (page[-1][5], page[-1][0]) if len(page) == TRASH_PAGE_SIZE else None
+            first = (len(pages) - 1) * TRASH_PAGE_SIZE
+            page_label.config(text=f"Showing {first + 1 if page else 0}-{first + len(page)} of {trash_count}")
+            newer_button.config(state=tk.NORMAL if len(pages) > 1 else tk.DISABLED)
+            older_button.config(state=tk.NORMAL if last_row else tk.DISABLED)
+        
+        def show_older():
+            pages.append(last_row)
+            show_page()
+        
+        def show_newer():
+            pages.pop()
+            show_page()
         
         def restore_selected():
+            nonlocal trash_count
             selected = tree.selection()
             if not selected:
                 messagebox.showwarning("Warning", "Please select an expense to restore")
                 return
             
-            item = tree.item(selected[0])
-            expense_id = item['values'][0]
-            
-            self.cursor.execute('''
+            self.cursor.executemany('''
                 UPDATE expenses 
                 SET is_deleted=0 
-                WHERE expense_id=?
-            ''', (expense_id,))
+                WHERE expense_id=? AND user_id=?
+            ''', [(int(item), self.current_user[0]) for item in selected])
             
             self.conn.commit()
             
-            messagebox.showinfo("Success", "Expense restored successfully")
-            undo_window.destroy()
-            self.show_expenses(self.filter_var.get())
+            messagebox.showinfo("Success", f"{len(selected)} expense(s) restored successfully")
+            self.refresh_expense_rows([int(item) for item in selected])
+            
+            trash_count -= len(selected)
+            if not trash_count:
+                undo_window.destroy()
+                return
+            show_page()
         
         def empty_trash():
-            if messagebox.askyesno("Confirm", "Are you sure you want to permanently delete all items in trash?"):
-                self.cursor.execute('''
-                    DELETE FROM expenses 
-                    WHERE user_id=? AND is_deleted=1
-                ''', (self.current_user[0],))
-                
-                self.conn.commit()
-                
-                messagebox.showinfo("Success", "Trash emptied")
+            if not messagebox.askyesno("Confirm", "Are you sure you want to permanently delete all items in trash?"):
+                return
+            
+            # Purged in batches on the purge thread, the window stays responsive meanwhile
+            for button in (restore_button, empty_button, newer_button, older_button):
+                button.config(state=tk.DISABLED)
+            page_label.config(text="Emptying trash...")
+            self.start_trash_purge(self.current_user[0], trash_emptied)
+        
+        def trash_emptied(purged, error):
+            nonlocal trash_count
+            if error:
+                messagebox.showerror("Error", f"Could not empty trash: {error}")
+            else:
+                messagebox.showinfo("Success", f"Trash emptied, {purged} expense(s) deleted")
+            
+            if not undo_window.winfo_exists():
+                return
+            
+            self.cursor.execute("SELECT COUNT(*) FROM expenses WHERE user_id=? AND is_deleted=1",
+                                (self.current_user[0],))
+            trash_count = self.cursor.fetchone()[0]
+            if not trash_count:
                 undo_window.destroy()
+                return
+            
+            restore_button.config(state=tk.NORMAL)
+            empty_button.config(state=tk.NORMAL)
+            pages[1:] = []
+            show_page()
+        
+        nav_frame = ttk.Frame(undo_window)
+        nav_frame.pack(pady=5)
+        
+        newer_button = ttk.Button(nav_frame, text="< Newer", command=show_newer)
+        newer_button.pack(side=tk.LEFT, padx=5)
+        older_button = ttk.Button(nav_frame, text="Older >", command=show_older)
+        older_button.pack(side=tk.LEFT, padx=5)
         
         button_frame = ttk.Frame(undo_window)
         button_frame.pack(pady=10)
         
-        ttk.Button(button_frame, text="Restore Selected", command=restore_selected).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Empty Trash", command=empty_trash).pack(side=tk.LEFT, padx=5)
+        restore_button = ttk.Button(button_frame, text="Restore Selected", command=restore_selected)
+        restore_button.pack(side=tk.LEFT, padx=5)
+        empty_button = ttk.Button(button_frame, text="Empty Trash", command=empty_trash)
+        empty_button.pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Close", command=undo_window.destroy).pack(side=tk.LEFT, padx=5)
-    
-    def show_reports(self):
-        self.clear_main_frame()
-        
-        ttk.Label(self.main_frame, text="Reports", font=('Helvetica', 14, 'bold')).pack(pady=10)
-        
-        # Report type selection
-        report_frame = ttk.Frame(self.main_frame)
-        report_frame.pack(fill=tk.X, padx=10, pady=10)
-        
-        ttk.Label(report_frame, text="Report Type:").pack(side=tk.LEFT)
-        
-        self.report_type = tk.StringVar(value="category")
-        
-        ttk.Radiobutton(report_frame, text="By Category", variable=self.report_type, 
-                        value="category", command=self.generate_report).pack(side=tk.LEFT, padx=5)
-        ttk.Radiobutton(report_frame, text="By Time Period", variable=self.report_type, 
-                        value="period", command=self.generate_report).pack(side=tk.LEFT, padx=5)
-        ttk.Radiobutton(report_frame, text="Comparison", variable=self.report_type, 
-                        value="comparison", command=self.generate_report).pack(side=tk.LEFT, padx=5)
-        
-        # Time period selection
-        self.time_frame = ttk.Frame(self.main_frame)
-        self.time_frame.pack(fill=tk.X, padx=10, pady=5)
-        
-        ttk.Label(self.time_frame, text="Time Period:").pack(side=tk.LEFT)
-        
-        self.time_period = tk.StringVar(value="month")
-        
-        ttk.Radiobutton(self.time_frame, text="Month", variable=self.time_period, 
-                        value="month", command=self.generate_report).pack(side=tk.LEFT, padx=5)
-        ttk.Radiobutton(self.time_frame, text="Quarter", variable=self.time_period, 
-                        value="quarter", command=self.generate_report).pack(side=tk.LEFT, padx=5)
-        ttk.Radiobutton(self.time_frame, text="Year", variable=self.time_period, 
-                        value="year", command=self.generate_report).pack(side=tk.LEFT, padx=5)
-        ttk.Radiobutton(self.time_frame, text="Custom", variable=self.time_period, 
-                        value="custom", command=self.generate_report).pack(side=tk.LEFT, padx=5)
-        
-        # Custom date range (hidden by default)
-        self.custom_frame = ttk.Frame(self.main_frame)
-        
-        ttk.Label(self.custom_frame, text="From:").grid(row=0, column=0, padx=5, pady=5)
-        self.from_date = ttk.Entry(self.custom_frame)
-        self.from_date.grid(row=0, column=1, padx=5, pady=5)
-        
-        ttk.Label(self.custom_frame, text="To:").grid(row=0, column=2, padx=5, pady=5)
-        self.to_date = ttk.Entry(self.custom_frame)
-        self.to_date.grid(row=0, column=3, padx=5, pady=5)
-        
-        ttk.Button(self.custom_frame, text="Apply", command=self.generate_report).grid(row=0, column=4, padx=5)
-        
-        # Chart frame
-        self.chart_frame = ttk.Frame(self.main_frame)
-        self.chart_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
-        # Generate initial report
-        self.generate_report()
-        
-        # Export button
-        ttk.Button(self.main_frame, text="Export to PDF", command=self.export_report).pack(side=tk.LEFT, padx=5)
-        ttk.Button(self.main_frame, text="Back", command=self.show_dashboard).pack(side=tk.LEFT, padx=5)
-    
-    def generate_report(self):
-        # Show/hide custom date frame
-        if self.time_period.get() == "custom":
-            self.custom_frame.pack(fill=tk.X, padx=10, pady=5)
-        else:
-            self.custom_frame.pack_forget()
-        
-        # Clear previous chart
-        for widget in self.chart_frame.winfo_children():
-            widget.destroy()
-        
-        report_type = self.report_type.get()
         
-        if report_type == "category":
-            self.generate_category_report()
-        elif report_type == "period":
-            self.generate_period_report()
-        elif report_type == "comparison":
-            self.generate_comparison_report()
+        show_page()
     
-    def generate_category_report(self):
-        # Get time period
-        start_date, end_date = self.get_date_range()
-        
-        # Get data
-        self.cursor.execute('''
-            SELECT category, SUM(amount) as total 
-            FROM expenses 
-            WHERE user_id=? AND date BETWEEN ? AND ? AND is_deleted=0
-            GROUP BY category 
-            ORDER BY total DESC
-        ''', (self.current_user[0], start_date, end_date))
-        
-        data = self.cursor.fetchall()
-        
-        if not data:
-            ttk.Label(self.chart_frame, text="No expense data available for the selected period").pack()
-            return
+    def show_duplicates(self):
+        pairs = find_duplicate_pairs(self.cursor, self.current_user[0])
         
-        # Filter out categories with non-positive totals
-        filtered = [(cat, amt) for cat, amt in data if amt > 0]
-        if not filtered:
-            ttk.Label(self.chart_frame, text="No expense data available for the selected period").pack()
+        if not pairs:
+            messagebox.showinfo("Info", "No duplicate expenses found")
             return
-
-        categories = [item[0] for item in filtered]
-        amounts = [item[1] for item in filtered]
-
-        # Create chart
-        fig, ax = plt.subplots(figsize=(8, 6))
-
-        if len(categories) <= 5:
-            # Pie chart for small number of categories
-            ax.pie(amounts, labels=categories, autopct='%1.1f%%', startangle=90)
-            ax.set_title('Expense Distribution by Category')
-        else:
-            # Bar chart for many categories
-            bars = ax.bar(categories, amounts)
-            ax.set_title('Expenses by Category')
-            ax.set_ylabel('Amount (PKR)')
-            ax.tick_params(axis='x', rotation=45)
-            # Add value labels
-            for bar in bars:
-                height = bar.get_height()
-                ax.annotate(f'{height:,.2f}',
-                            xy=(bar.get_x() + bar.get_width() / 2, height),
-                            xytext=(0, 3),  # 3 points vertical offset
-                            textcoords="offset points",
-                            ha='center', va='bottom')
-        
-        canvas = FigureCanvasTkAgg(fig, master=self.chart_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-
-        
-    def generate_period_report(self):
-        # Get time period
-        time_period = self.time_period.get()
-        now = datetime.datetime.now()
         
-        if time_period == "month":
-            # Monthly breakdown for the year
-            months = []
-            totals = []
-            
-            for i in range(1, 13):
-                month = f"{now.year}-{i:02d}"
-                months.append(datetime.datetime.strptime(month, "%Y-%m").strftime("%b %Y"))
-                
-                self.cursor.execute('''
-                    SELECT COALESCE(SUM(amount), 0) 
-                    FROM expenses 
-                    WHERE user_id=? AND strftime('%Y-%m', date)=? AND is_deleted=0
-                ''', (self.current_user[0], month))
-                
-                totals.append(self.cursor.fetchone()[0])
-            
-            # Create chart
-            fig, ax = plt.subplots(figsize=(8, 6))
-            bars = ax.bar(months, totals)
-            ax.set_title('Monthly Expenses')
-            ax.set_ylabel('Amount (PKR)')
-            ax.tick_params(axis='x', rotation=45)
-            
-            # Add value labels
-            for bar in bars:
-                height = bar.get_height()
-                ax.annotate(f'{height:,.2f}',
-                            xy=(bar.get_x() + bar.get_width() / 2, height),
-                            xytext=(0, 3),  # 3 points vertical offset
-                            textcoords="offset points",
-                            ha='center', va='bottom')
-            
-            canvas = FigureCanvasTkAgg(fig, master=self.chart_frame)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-            
-        elif time_period == "quarter":
-            # Quarterly breakdown
-            quarters = []
-            totals = []
-            
-            for q in range(1, 5):
-                start_month = (q-1)*3 + 1
-                end_month = q*3
-                
-                start_date = f"{now.year}-{start_month:02d}-01"
-                end_date = f"{now.year}-{end_month:02d}-{31 if end_month in [1,3,5,7,8,10,12] else 30}"
-                
-                quarters.append(f"Q{q} {now.year}")
-                
-                self.cursor.execute('''
-                    SELECT COALESCE(SUM(amount), 0) 
-                    FROM expenses 
-                    WHERE user_id=? AND date BETWEEN ? AND ? AND is_deleted=0
-                ''', (self.current_user[0], start_date, end_date))
-                
-                totals.append(self.cursor.fetchone()[0])
-            
-            # Create chart
-            fig, ax = plt.subplots(figsize=(8, 6))
-            bars = ax.bar(quarters, totals)
-            ax.set_title('Quarterly Expenses')
-            ax.set_ylabel('Amount (PKR)')
-            
-            # Add value labels
-            for bar in bars:
-                height = bar.get_height()
-                ax.annotate(f'{height:,.2f}',
-                            xy=(bar.get_x() + bar.get_width() / 2, height),
-                            xytext=(0, 3),  # 3 points vertical offset
-                            textcoords="offset points",
-                            ha='center', va='bottom')
-            
-            canvas = FigureCanvasTkAgg(fig, master=self.chart_frame)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-            
-        elif time_period == "year":
-            # Yearly breakdown for last 5 years
-            years = []
-            totals = []
-            
-            for y in range(now.year-4, now.year+1):
-                years.append(str(y))
-                
-                self.cursor.execute('''
-                    SELECT COALESCE(SUM(amount), 0) 
-                    FROM expenses 
-                    WHERE user_id=? AND strftime('%Y', date)=? AND is_deleted=0
-                ''', (self.current_user[0], str(y)))
-                
-                totals.append(self.cursor.fetchone()[0])
-            
-            # Create chart
-            fig, ax = plt.subplots(figsize=(8, 6))
-            bars = ax.bar(years, totals)
-            ax.set_title('Yearly Expenses')
-            ax.set_ylabel('Amount (PKR)')
-            
-            # Add value labels
-            for bar in bars:
-                height = bar.get_height()
-                ax.annotate(f'{height:,.2f}',
-                            xy=(bar.get_x() + bar.get_width() / 2, height),
-                            xytext=(0, 3),  # 3 points vertical offset
-                            textcoords="offset points",
-                            ha='center', va='bottom')
-            
-            canvas = FigureCanvasTkAgg(fig, master=self.chart_frame)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-            
-        elif time_period == "custom":
-            # Custom date range
-            try:
-                start_date = self.from_date.get()
-                end_date = self.to_date.get()
-                
-                # Validate dates
-                datetime.datetime.strptime(start_date, "%Y-%m-%d")
-                datetime.datetime.strptime(end_date, "%Y-%m-%d")
-                
-                # Get daily expenses
-                self.cursor.execute('''
-                    SELECT date, SUM(amount) 
-                    FROM expenses 
-                    WHERE user_id=? AND date BETWEEN ? AND ? AND is_deleted=0
-                    GROUP BY date 
-                    ORDER BY date
-                ''', (self.current_user[0], start_date, end_date))
-                
-                data = self.cursor.fetchall()
-                
-                if not data:
-                    ttk.Label(self.chart_frame, text="No expense data available for the selected period , (format for date is yy-mm-dd)").pack()
-                    return
-                
-                dates = [datetime.datetime.strptime(item[0], "%Y-%m-%d").strftime("%d %b") for item in data]
-                amounts = [item[1] for item in data]
-                
-                # Create chart
-                fig, ax = plt.subplots(figsize=(8, 6))
-                ax.plot(dates, amounts, marker='o')
-                ax.set_title('Daily Expenses')
-                ax.set_ylabel('Amount (PKR)')
-                ax.tick_params(axis='x', rotation=45)
-                
-                # Add value labels
-                for i, amount in enumerate(amounts):
-                    ax.annotate(f'{amount:,.2f}',
-                                xy=(i, amount),
-                                xytext=(0, 5),  # 5 points vertical offset
-                                textcoords="offset points",
-                                ha='center', va='bottom')
-                
-                canvas = FigureCanvasTkAgg(fig, master=self.chart_frame)
-                canvas.draw()
-                canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-                
-            except ValueError:
-                messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
-    
-    def generate_comparison_report(self):
-        # Compare two time periods
-        now = datetime.datetime.now()
+        # Create duplicates window
+        duplicates_window = tk.Toplevel(self.root)
+        duplicates_window.title("Possible Duplicates")
+        duplicates_window.geometry("700x400")
         
-        # Get previous period
-        if self.time_period.get() == "month":
-            current_start = f"{now.year}-{now.month:02d}-01"
-            current_end = now.strftime("%Y-%m-%d")
-            
-            prev_month = now - datetime.timedelta(days=30)
-            prev_start = f"{prev_month.year}-{prev_month.month:02d}-01"
-            prev_end = prev_month.strftime("%Y-%m-%d")
-            
-            labels = [now.strftime("%B %Y"), prev_month.strftime("%B %Y")]
-            
-        elif self.time_period.get() == "quarter":
-            current_quarter = (now.month - 1) // 3 + 1
-            current_start_month = (current_quarter - 1) * 3 + 1
-            current_start = f"{now.year}-{current_start_month:02d}-01"
-            current_end = now.strftime("%Y-%m-%d")
-            
-            prev_quarter = current_quarter - 1 if current_quarter > 1 else 4
-            prev_year = now.year if current_quarter > 1 else now.year - 1
-            prev_start_month = (prev_quarter - 1) * 3 + 1
-            prev_start = f"{prev_year}-{prev_start_month:02d}-01"
-            prev_end = f"{prev_year}-{prev_start_month+2:02d}-{31 if prev_start_month+2 in [1,3,5,7,8,10,12] else 30}"
-            
-            labels = [f"Q{current_quarter} {now.year}", f"Q{prev_quarter} {prev_year}"]
+        ttk.Label(duplicates_window, text=f"Possible Duplicates ({len(pairs)})", font=('Helvetica', 12, 'bold')).pack(pady=10)
+        
+        columns = ("ID", "Date", "Category", "Amount", "Description", "Duplicate Of")
+        tree = ttk.Treeview(duplicates_window, columns=columns, show="headings", height=10)
+        
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100)
+        
+        tree.column("ID", width=50)
+        tree.column("Duplicate Of", width=150)
+        
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        # A row can pair with several originals, list it once
+        listed = set()
+        for expense_id, date, category, amount, description, original_id, original_date in pairs:
+            if expense_id in listed:
+                continue
+            listed.add(expense_id)
+            formatted_date = datetime.datetime.strptime(date, "%Y-%m-%d").strftime("%d %b %Y")
+            tree.insert("", tk.END, iid=str(expense_id), values=(
+                expense_id, 
+                formatted_date, 
+                category, 
+                f"PKR {amount:,.2f}", 
+                description if description else "",
+                f"#{original_id} on {original_date}"
+            ))
+        
+        def delete_selected():
+            selected = tree.selection()
+            if not selected:
+                messagebox.showwarning("Warning", "Please select the duplicates to delete")
+                return
             
-        elif self.time_period.get() == "year":
-            current_start = f"{now.year}-01-01"
-            current_end = now.strftime("%Y-%m-%d")
+            if not messagebox.askyesno("Confirm", f"Move {len(selected)} duplicate(s) to trash?"):
+                return
             
-            prev_start = f"{now.year-1}-01-01"
-            prev_end = f"{now.year-1}-12-31"
+            placeholders = ",".join("?" * len(selected))
+            self.cursor.execute(f'''
+                UPDATE expenses 
+                SET is_deleted=1 
+                WHERE user_id=? AND expense_id IN ({placeholders})
+            ''', [self.current_user[0]] + [int(item) for item in selected])
             
-            labels = [str(now.year), str(now.year-1)]
+            self.conn.commit()
             
-        elif self.time_period.get() == "custom":
-            try:
-                current_start = self.from_date.get()
-                current_end = self.to_date.get()
-                
-                # Validate dates
-                datetime.datetime.strptime(current_start, "%Y-%m-%d")
-                datetime.datetime.strptime(current_end, "%Y-%m-%d")
-                
-                # Calculate previous period
-                start_date = datetime.datetime.strptime(current_start, "%Y-%m-%d")
-                end_date = datetime.datetime.strptime(current_end, "%Y-%m-%d")
-                delta = end_date - start_date
-                
-                prev_start_date = start_date - delta - datetime.timedelta(days=1)
-                prev_end_date = start_date - datetime.timedelta(days=1)
-                
-                prev_start = prev_start_date.strftime("%Y-%m-%d")
-                prev_end = prev_end_date.strftime("%Y-%m-%d")
-                
-                labels = [
-                    f"{start_date.strftime('%d %b %Y')} to {end_date.strftime('%d %b %Y')}",
-                    f"{prev_start_date.strftime('%d %b %Y')} to {prev_end_date.strftime('%d %b %Y')}"
-                ]
-                
-            except ValueError:
-                messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
+            tree.delete(*selected)
+            self.refresh_expense_rows([int(item) for item in selected])
         
-        # Get data for both periods
-        periods = [
-            (current_start, current_end),
-            (prev_start, prev_end)
-        ]
+        button_frame = ttk.Frame(duplicates_window)
+        button_frame.pack(pady=10)
         
-        categories = set()
-        data = {}
+        ttk.Button(button_frame, text="Delete Selected", command=delete_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Close", command=duplicates_window.destroy).pack(side=tk.LEFT, padx=5)
+    
+    @traced("screen")
+    def show_reports(self):
+        if self.raise_screen("show_reports"):
+            return
         
-        for i, (start, end) in enumerate(periods):
-            self.cursor.execute('''
-                SELECT category, SUM(amount) 
-                FROM expenses 
-                WHERE user_id=? AND date BETWEEN ? AND ? AND is_deleted=0
-                GROUP BY category
-            ''', (self.current_user[0], start, end))
-            
-            results = self.cursor.fetchall()
-            data[labels[i]] = {}
-            
-            for category, amount in results:
-                data[labels[i]][category] = amount
-                categories.add(category)
+        ttk.Label(self.main_frame, text="Reports", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
-        # Prepare data for chart
-        categories = sorted(categories)
-        x = range(len(categories))
-        width = 0.35
+        # Report type selection
+        report_frame = ttk.Frame(self.main_frame)
+        report_frame.pack(fill=tk.X, padx=10, pady=10)
         
-        fig, ax = plt.subplots(figsize=(8, 6))
+        ttk.Label(report_frame, text="Report Type:").pack(side=tk.LEFT)
         
-        for i, label in enumerate(labels):
-            amounts = [data[label].get(cat, 0) for cat in categories]
-            ax.bar([p + i*width for p in x], amounts, width, label=label)
+        self.report_type = tk.StringVar(value="category")
         
-        ax.set_title('Expense Comparison')
-        ax.set_ylabel('Amount (PKR)')
-        ax.set_xticks([p + width/2 for p in x])
-        ax.set_xticklabels(categories, rotation=45)
-        ax.legend()
+        ttk.Radiobutton(report_frame, text="By Category", variable=self.report_type, 
+                        value="category", command=self.generate_report).pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(report_frame, text="By Time Period", variable=self.report_type, 
+                        value="period", command=self.generate_report).pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(report_frame, text="Comparison", variable=self.report_type, 
+                        value="comparison", command=self.generate_report).pack(side=tk.LEFT, padx=5)
         
-        canvas = FigureCanvasTkAgg(fig, master=self.chart_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-    
-    def get_date_range(self):
-        time_period = self.time_period.get()
-        now = datetime.datetime.now()
+        # Number of periods a comparison covers
+        self.compare_periods = tk.StringVar(value=str(COMPARISON_PERIODS))
+        ttk.Spinbox(report_frame, from_=2, to=MAX_COMPARISON_PERIODS, width=4, state="readonly",
+                    textvariable=self.compare_periods, command=self.generate_report).pack(side=tk.RIGHT)
+        ttk.Label(report_frame, text="Periods to compare:").pack(side=tk.RIGHT, padx=5)
         
-        if time_period == "month":
-            start_date = f"{now.year}-{now.month:02d}-01"
-            end_date = now.strftime("%Y-%m-%d")
-        elif time_period == "quarter":
-            quarter = (now.month - 1) // 3 + 1
-            start_month = (quarter - 1) * 3 + 1
-            end_month = quarter * 3
-            
-            start_date = f"{now.year}-{start_month:02d}-01"
-            end_date = f"{now.year}-{end_month:02d}-{31 if end_month in [1,3,5,7,8,10,12] else 30}"
-        elif time_period == "year":
-            start_date = f"{now.year}-01-01"
-            end_date = now.strftime("%Y-%m-%d")
-        elif time_period == "custom":
-            start_date = self.from_date.get()
-            end_date = self.to_date.get()
-            
-            # Validate dates
-            try:
-                datetime.datetime.strptime(start_date, "%Y-%m-%d")
-                datetime.datetime.strptime(end_date, "%Y-%m-%d")
-            except ValueError:
-                return (None, None)
+        # Time period selection
+        self.time_frame = ttk.Frame(self.main_frame)
+        self.time_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(self.time_frame, text="Time Period:").pack(side=tk.LEFT)
+        
+        self.time_period = tk.StringVar(value="month")
+        
+        ttk.Radiobutton(self.time_frame, text="Week", variable=self.time_period, 
+                        value="week", command=self.generate_report).pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(self.time_frame, text="Month", variable=self.time_period, 
+                        value="month", command=self.generate_report).pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(self.time_frame, text="Quarter", variable=self.time_period, 
+                        value="quarter", command=self.generate_report).pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(self.time_frame, text="Year", variable=self.time_period, 
+                        value="year", command=self.generate_report).pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(self.time_frame, text="Fiscal Year", variable=self.time_period, 
+                        value="fiscal", command=self.generate_report).pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(self.time_frame, text="Custom", variable=self.time_period, 
+                        value="custom", command=self.generate_report).pack(side=tk.LEFT, padx=5)
+        
+        # Custom date range (hidden by default)
+        self.custom_frame = ttk.Frame(self.main_frame)
+        
+        ttk.Label(self.custom_frame, text="From:").grid(row=0, column=0, padx=5, pady=5)
+        self.from_date = ttk.Entry(self.custom_frame)
+        self.from_date.grid(row=0, column=1, padx=5, pady=5)
+        
+        ttk.Label(self.custom_frame, text="To:").grid(row=0, column=2, padx=5, pady=5)
+        self.to_date = ttk.Entry(self.custom_frame)
+        self.to_date.grid(row=0, column=3, padx=5, pady=5)
+        
+        ttk.Button(self.custom_frame, text="Apply", command=self.generate_report).grid(row=0, column=4, padx=5)
+        
+        # Progress of report generation and export
+        progress_frame = ttk.Frame(self.main_frame)
+        progress_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        self.report_progress = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, length=200, mode='determinate')
+        self.report_progress.pack(side=tk.LEFT)
+        self.report_cancel_button = ttk.Button(progress_frame, text="Cancel", command=self.cancel_report_task, state=tk.DISABLED)
+        self.report_cancel_button.pack(side=tk.LEFT, padx=5)
+        self.report_status = ttk.Label(progress_frame, text="")
+        self.report_status.pack(side=tk.LEFT, padx=5)
+        
+        # Chart frame
+        self.chart_frame = ttk.Frame(self.main_frame)
+        self.chart_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        # Generate initial report
+        self.generate_report()
         
-        return (start_date, end_date)
+        # Export button
+        ttk.Button(self.main_frame, text="Export to PDF", command=self.export_report).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.main_frame, text="Back", command=self.show_dashboard).pack(side=tk.LEFT, padx=5)
     
+    def get_report_chart(self, data):
+        # Figure and PNG for a dataset; the on-screen figure is reused for the PDF
+        # and the PNG is rasterized at most once per dataset
+        key = id(data)
+        cached = self.report_figures.get(key)
+        if cached and cached[0] is data:
+            return cached[1], cached[2]
+        
+        fig = render_report_figure(data)
+        self.report_figures[key] = [data, fig, None]
+        
+        # Drop the oldest figures
+        while len(self.report_figures) > REPORT_FIGURE_CACHE_SIZE:
+            oldest = next(iter(self.report_figures))
+            self.report_figures.pop(oldest)
+        
+        return fig, None
     
-    def export_report(self):
-        try:
-            # Create a new PDF document
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=12)
-            
-            # Add title
-            pdf.set_font("Arial", 'B', 16)
-            pdf.cell(200, 10, txt="Expense Report", ln=1, align='C')
-            pdf.set_font("Arial", size=12)
-            
-            # Add user info and date
-            pdf.cell(200, 10, txt=f"User: {self.current_user[1]}", ln=1)
-            pdf.cell(200, 10, txt=f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=1)
-            pdf.ln(5)
-            
-            # Get the report type and time period
-            report_type = self.report_type.get()
-            time_period = self.time_period.get()
-            
-            # Add report parameters
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(200, 10, txt="Report Parameters:", ln=1)
-            pdf.set_font("Arial", size=12)
-            pdf.cell(200, 10, txt=f"Report Type: {report_type.capitalize()}", ln=1)
-            pdf.cell(200, 10, txt=f"Time Period: {time_period.capitalize()}", ln=1)
-            
-            if time_period == "custom":
-                pdf.cell(200, 10, txt=f"From: {self.from_date.get()} To: {self.to_date.get()}", ln=1)
-            
-            pdf.ln(10)
-            
-            # Get the appropriate data based on report type
-            if report_type == "category":
-                self.export_category_report(pdf, time_period)
-            elif report_type == "period":
-                self.export_period_report(pdf, time_period)
-            elif report_type == "comparison":
-                self.export_comparison_report(pdf, time_period)
-            
-            # Ask for save location
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".pdf",
-                filetypes=[("PDF files", "*.pdf")],
-                initialfile=f"Expense_Report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            )
-            
-            if file_path:
-                pdf.output(file_path)
-                messagebox.showinfo("Success", f"Report successfully exported to:\n{file_path}")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to export report: {str(e)}")
-
-    def export_category_report(self, pdf, time_period):
-        # Get date range
-        start_date, end_date = self.get_date_range()
+    def generate_report(self):
+        # Show/hide custom date frame
+        if self.time_period.get() == "custom":
+            self.custom_frame.pack(fill=tk.X, padx=10, pady=5)
+        else:
+            self.custom_frame.pack_forget()
         
-        if start_date is None or end_date is None:
-            raise ValueError("Invalid date range")
+        # Clear previous chart
+        for widget in self.chart_frame.winfo_children():
+            widget.destroy()
         
-        # Get category data
-        self.cursor.execute('''
-            SELECT category, SUM(amount) as total 
-            FROM expenses 
-            WHERE user_id=? AND date BETWEEN ? AND ? AND is_deleted=0
-            GROUP BY category 
-            ORDER BY total DESC
-        ''', (self.current_user[0], start_date, end_date))
+        # Starting the preview would cancel a running export, it is shown once that is done
+        if self.report_task and self.report_task["export"]:
+            self.report_task["show_report"] = True
+            ttk.Label(self.chart_frame, text="The report is shown once the export is done").pack()
+            return
         
-        data = self.cursor.fetchall()
+        try:
+            key = self.get_report_key()
+        except ValueError:
+            self.cancel_report_task()
+            if self.from_date.get() or self.to_date.get():
+                messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
+            ttk.Label(self.chart_frame, text="Enter a date range (format for date is yyyy-mm-dd) and press Apply").pack()
+            return
         
-        if not data:
-            pdf.cell(200, 10, txt="No expense data available for the selected period", ln=1)
+        data = self.get_cached_report(key)
+        if data:
+            self.cancel_report_task()
+            self.show_report_chart(data)
             return
         
-        # Add section header
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(200, 10, txt="Expenses by Category", ln=1)
-        pdf.set_font("Arial", size=12)
+        ttk.Label(self.chart_frame, text="Generating report...").pack()
         
-        # Calculate total expenses
-        total = sum(item[1] for item in data)
+        # Build the dataset off the UI thread
+        _, report_type, time_period, _, periods = key
+        from_date = self.from_date.get()
+        to_date = self.to_date.get()
+        user_id = self.current_user[0]
+        version = self.conn.total_changes
         
-        # Add summary
-        pdf.cell(200, 10, txt=f"Date Range: {start_date} to {end_date}", ln=1)
-        pdf.cell(200, 10, txt=f"Total Expenses: PKR {total:,.2f}", ln=1)
-        pdf.ln(5)
+        def work(conn, task):
+            return build_report(conn.cursor(), user_id, report_type, time_period, from_date, to_date, periods)
         
-        # Create table header
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(90, 10, "Category", border=1)
-        pdf.cell(50, 10, "Amount", border=1)
-        pdf.cell(50, 10, "Percentage", border=1)
-        pdf.ln()
-        pdf.set_font("Arial", size=12)
+        def done(data):
+            self.report_cache[key] = (version, data)
+            for widget in self.chart_frame.winfo_children():
+                widget.destroy()
+            self.show_report_chart(data)
         
-        # Add table rows
-        for category, amount in data:
-            percentage = (amount / total) * 100 if total > 0 else 0
-            
-            pdf.cell(90, 10, category, border=1)
-            pdf.cell(50, 10, f"PKR {amount:,.2f}", border=1)
-            pdf.cell(50, 10, f"{percentage:.1f}%", border=1)
-            pdf.ln()
+        self.start_report_task(work, done)
+    
+    @traced("chart")
+    def show_report_chart(self, data):
+        if data["empty"]:
+            ttk.Label(self.chart_frame, text="No expense data available for the selected period").pack()
+            return
         
-        pdf.ln(10)
+        fig = self.get_report_chart(data)[0]
         
-        # Add pie chart (simple representation)
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(200, 10, txt="Expense Distribution:", ln=1)
-        pdf.set_font("Arial", size=10)
+        canvas = FigureCanvasTkAgg(fig, master=self.chart_frame)
+        with TRACER.span("canvas draw", "draw"):
+            canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+    
+    def get_report_key(self):
+        # Cache key for the selected options, raises ValueError for an invalid custom range
+        time_period = self.time_period.get()
+        report_type = self.report_type.get()
+        date_range = report_range(time_period, self.from_date.get(), self.to_date.get())
+        periods = int(self.compare_periods.get()) if report_type == "comparison" else None
+        return (self.current_user[0], report_type, time_period, date_range, periods)
+    
+    def get_cached_report(self, key):
+        # Report dataset reused until any data changes
+        cached = self.report_cache.get(key)
+        if cached and cached[0] == self.conn.total_changes:
+            return cached[1]
+        return None
+    
+    def start_report_task(self, work, on_done, total=None, export=False):
+        # Run work(conn, task) on a background thread with its own database connection.
+        # The task dict carries progress counters and the cancel flag; on_done(result)
+        # runs back on the Tk thread once the work succeeds. An export keeps running when
+        # the Reports screen is rebuilt, a preview is dropped with its screen.
+        self.cancel_report_task()
+        
+        task = {"cancel": threading.Event(), "rows": 0, "pages": 0, "total": total, "export": export,
+                "progress": self.report_progress, "show_report": False,
+                "done": False, "result": None, "error": None}
+        self.report_task = task
+        
+        def run():
+            conn = connect_instrumented(DATABASE_FILE)
+            # Abort long-running statements as soon as the task is cancelled
+            conn.set_progress_handler(lambda: 1 if task["cancel"].is_set() else 0, 10000)
+            try:
+                task["result"] = work(conn, task)
+            except Exception as e:
+                task["error"] = e
+            finally:
+                conn.close()
+                task["done"] = True
+        
+        threading.Thread(target=run, name="report task", daemon=True).start()
+        
+        self.report_progress.config(mode="determinate" if total else "indeterminate", value=0)
+        self.report_cancel_button.config(state=tk.NORMAL)
+        self.poll_report_task(task, on_done)
+    
+    def poll_report_task(self, task, on_done):
+        if task is not self.report_task:
+            return
         
-        for category, amount in data:
-            percentage = (amount / total) * 100 if total > 0 else 0
-            pdf.cell(200, 10, txt=f"{category}: {percentage:.1f}% (PKR {amount:,.2f})", ln=1)
-
-    def export_period_report(self, pdf, time_period):
-        now = datetime.datetime.now()
+        # The Reports frame is rebuilt after data changes: a preview goes with the old
+        # frame, an export moves on to the new frame's progress bar
+        attached = self.report_progress.winfo_exists()
+        if not attached and not task["export"]:
+            task["cancel"].set()
+            self.report_task = None
+            return
         
-        if time_period == "month":
-            # Monthly breakdown for the year
-            months = []
-            totals = []
-            
-            for i in range(1, 13):
-                month = f"{now.year}-{i:02d}"
-                months.append(datetime.datetime.strptime(month, "%Y-%m").strftime("%b %Y"))
-                
-                self.cursor.execute('''
-                    SELECT COALESCE(SUM(amount), 0) 
-                    FROM expenses 
-                    WHERE user_id=? AND strftime('%Y-%m', date)=? AND is_deleted=0
-                ''', (self.current_user[0], month))
-                
-                totals.append(self.cursor.fetchone()[0])
-            
-            # Add section header
-            pdf.set_font("Arial", 'B', 14)
-            pdf.cell(200, 10, txt="Monthly Expenses", ln=1)
-            pdf.set_font("Arial", size=12)
-            pdf.cell(200, 10, txt=f"Year: {now.year}", ln=1)
-            pdf.ln(5)
-            
-            # Create table header
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(100, 10, "Month", border=1)
-            pdf.cell(90, 10, "Amount", border=1)
-            pdf.ln()
-            pdf.set_font("Arial", size=12)
-            
-            # Add table rows
-            for month, amount in zip(months, totals):
-                pdf.cell(100, 10, month, border=1)
-                pdf.cell(90, 10, f"PKR {amount:,.2f}", border=1)
-                pdf.ln()
-            
-            # Add summary
-            pdf.ln(5)
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(100, 10, "Total:", border=1)
-            pdf.cell(90, 10, f"PKR {sum(totals):,.2f}", border=1)
-            pdf.ln()
-            
-        elif time_period == "quarter":
-            # Quarterly breakdown
-            quarters = []
-            totals = []
-            
-            for q in range(1, 5):
-                start_month = (q-1)*3 + 1
-                end_month = q*3
-                
-                start_date = f"{now.year}-{start_month:02d}-01"
-                end_date = f"{now.year}-{end_month:02d}-{31 if end_month in [1,3,5,7,8,10,12] else 30}"
-                
-                quarters.append(f"Q{q} {now.year}")
-                
-                self.cursor.execute('''
-                    SELECT COALESCE(SUM(amount), 0) 
-                    FROM expenses 
-                    WHERE user_id=? AND date BETWEEN ? AND ? AND is_deleted=0
-                ''', (self.current_user[0], start_date, end_date))
-                
-                totals.append(self.cursor.fetchone()[0])
-            
-            # Add section header
-            pdf.set_font("Arial", 'B', 14)
-            pdf.cell(200, 10, txt="Quarterly Expenses", ln=1)
-            pdf.set_font("Arial", size=12)
-            pdf.cell(200, 10, txt=f"Year: {now.year}", ln=1)
-            pdf.ln(5)
-            
-            # Create table header
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(100, 10, "Quarter", border=1)
-            pdf.cell(90, 10, "Amount", border=1)
-            pdf.ln()
-            pdf.set_font("Arial", size=12)
-            
-            # Add table rows
-            for quarter, amount in zip(quarters, totals):
-                pdf.cell(100, 10, quarter, border=1)
-                pdf.cell(90, 10, f"PKR {amount:,.2f}", border=1)
-                pdf.ln()
-            
-            # Add summary
-            pdf.ln(5)
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(100, 10, "Total:", border=1)
-            pdf.cell(90, 10, f"PKR {sum(totals):,.2f}", border=1)
-            pdf.ln()
-            
-        elif time_period == "year":
-            # Yearly breakdown for last 5 years
-            years = []
-            totals = []
-            
-            for y in range(now.year-4, now.year+1):
-                years.append(str(y))
-                
-                self.cursor.execute('''
-                    SELECT COALESCE(SUM(amount), 0) 
-                    FROM expenses 
-                    WHERE user_id=? AND strftime('%Y', date)=? AND is_deleted=0
-                ''', (self.current_user[0], str(y)))
-                
-                totals.append(self.cursor.fetchone()[0])
-            
-            # Add section header
-            pdf.set_font("Arial", 'B', 14)
-            pdf.cell(200, 10, txt="Yearly Expenses", ln=1)
-            pdf.set_font("Arial", size=12)
-            pdf.ln(5)
-            
-            # Create table header
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(100, 10, "Year", border=1)
-            pdf.cell(90, 10, "Amount", border=1)
-            pdf.ln()
-            pdf.set_font("Arial", size=12)
-            
-            # Add table rows
-            for year, amount in zip(years, totals):
-                pdf.cell(100, 10, year, border=1)
-                pdf.cell(90, 10, f"PKR {amount:,.2f}", border=1)
-                pdf.ln()
-            
-            # Add summary
-            pdf.ln(5)
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(100, 10, "5-Year Total:", border=1)
-            pdf.cell(90, 10, f"PKR {sum(totals):,.2f}", border=1)
-            pdf.ln()
-            
-        elif time_period == "custom":
-            # Custom date range
-            start_date = self.from_date.get()
-            end_date = self.to_date.get()
-            
-            # Get daily expenses
-            self.cursor.execute('''
-                SELECT date, SUM(amount) 
-                FROM expenses 
-                WHERE user_id=? AND date BETWEEN ? AND ? AND is_deleted=0
-                GROUP BY date 
-                ORDER BY date
-            ''', (self.current_user[0], start_date, end_date))
-            
-            data = self.cursor.fetchall()
+        if attached:
+            if task["progress"] is not self.report_progress:
+                task["progress"] = self.report_progress
+                self.report_cancel_button.config(state=tk.NORMAL)
             
-            if not data:
-                pdf.cell(200, 10, txt="No expense data available for the selected period", ln=1)
-                return
-            
-            # Add section header
-            pdf.set_font("Arial", 'B', 14)
-            pdf.cell(200, 10, txt="Daily Expenses", ln=1)
-            pdf.set_font("Arial", size=12)
-            pdf.cell(200, 10, txt=f"From: {start_date} To: {end_date}", ln=1)
-            pdf.ln(5)
-            
-            # Create table header
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(70, 10, "Date", border=1)
-            pdf.cell(60, 10, "Day", border=1)
-            pdf.cell(60,  10, "Amount", border=1)
-            pdf.ln()
-            pdf.set_font("Arial", size=12)
-            
-            # Add table rows
-            total = 0
-            for date_str, amount in data:
-                date = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-                formatted_date = date.strftime("%d %b %Y")
-                day_name = date.strftime("%A")
-                
-                pdf.cell(70, 10, formatted_date, border=1)
-                pdf.cell(60, 10, day_name, border=1)
-                pdf.cell(60, 10, f"PKR {amount:,.2f}", border=1)
-                pdf.ln()
-                total += amount
-            
-            # Add summary
-            pdf.ln(5)
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(130, 10, "Total:", border=1)
-            pdf.cell(60, 10, f"PKR {total:,.2f}", border=1)
-            pdf.ln()
-
-    def export_comparison_report(self, pdf, time_period):
-        now = datetime.datetime.now()
+            # The total may only be known once the task has counted its rows
+            if task["total"]:
+                self.report_progress.config(mode="determinate", value=min(task["rows"] / task["total"] * 100, 100))
+            else:
+                self.report_progress.config(mode="indeterminate")
+                self.report_progress.step(5)
+            self.report_status.config(text=f"Rows scanned: {task['rows']:,}   Pages written: {task['pages']:,}")
         
-        # Get previous period
-        if time_period == "month":
-            current_start = f"{now.year}-{now.month:02d}-01"
-            current_end = now.strftime("%Y-%m-%d")
-            
-            prev_month = now - datetime.timedelta(days=30)
-            prev_start = f"{prev_month.year}-{prev_month.month:02d}-01"
-            prev_end = prev_month.strftime("%Y-%m-%d")
-            
-            labels = [now.strftime("%B %Y"), prev_month.strftime("%B %Y")]
-            
-        elif time_period == "quarter":
-            current_quarter = (now.month - 1) // 3 + 1
-            current_start_month = (current_quarter - 1) * 3 + 1
-            current_start = f"{now.year}-{current_start_month:02d}-01"
-            current_end = now.strftime("%Y-%m-%d")
-            
-            prev_quarter = current_quarter - 1 if current_quarter > 1 else 4
-            prev_year = now.year if current_quarter > 1 else now.year - 1
-            prev_start_month = (prev_quarter - 1) * 3 + 1
-            prev_start = f"{prev_year}-{prev_start_month:02d}-01"
-            prev_end = f"{prev_year}-{prev_start_month+2:02d}-{31 if prev_start_month+2 in [1,3,5,7,8,10,12] else 30}"
-            
-            labels = [f"Q{current_quarter} {now.year}", f"Q{prev_quarter} {prev_year}"]
-            
-        elif time_period == "year":
-            current_start = f"{now.year}-01-01"
-            current_end = now.strftime("%Y-%m-%d")
-            
-            prev_start = f"{now.year-1}-01-01"
-            prev_end = f"{now.year-1}-12-31"
-            
-            labels = [str(now.year), str(now.year-1)]
-            
-        elif time_period == "custom":
-            current_start = self.from_date.get()
-            current_end = self.to_date.get()
-            
-            # Calculate previous period
-            start_date = datetime.datetime.strptime(current_start, "%Y-%m-%d")
-            end_date = datetime.datetime.strptime(current_end, "%Y-%m-%d")
-            delta = end_date - start_date
-            
-            prev_start_date = start_date - delta - datetime.timedelta(days=1)
-            prev_end_date = start_date - datetime.timedelta(days=1)
-            
-            prev_start = prev_start_date.strftime("%Y-%m-%d")
-            prev_end = prev_end_date.strftime("%Y-%m-%d")
-            
-            labels = [
-                f"{start_date.strftime('%d %b %Y')} to {end_date.strftime('%d %b %Y')}",
-                f"{prev_start_date.strftime('%d %b %Y')} to {prev_end_date.strftime('%d %b %Y')}"
-            ]
+        if not task["done"]:
+            self.root.after(100, self.poll_report_task, task, on_done)
+            return
         
-        # Get data for both periods
-        periods = [
-            (current_start, current_end),
-            (prev_start, prev_end)
-        ]
+        self.report_task = None
+        if attached:
+            self.report_progress.config(mode="determinate", value=0)
+            self.report_cancel_button.config(state=tk.DISABLED)
+            self.report_status.config(text="")
         
-        categories = set()
-        data = {}
+        if task["cancel"].is_set() or isinstance(task["error"], ReportCancelled):
+            if attached:
+                self.report_status.config(text="Cancelled")
+            else:
+                messagebox.showinfo("Cancelled", "The report export was cancelled")
+        elif task["error"]:
+            messagebox.showerror("Error", f"Failed to generate report: {str(task['error'])}")
+        else:
+            on_done(task["result"])
         
-        for i, (start, end) in enumerate(periods):
-            self.cursor.execute('''
-                SELECT category, SUM(amount) 
-                FROM expenses 
-                WHERE user_id=? AND date BETWEEN ? AND ? AND is_deleted=0
-                GROUP BY category
-            ''', (self.current_user[0], start, end))
-            
-            results = self.cursor.fetchall()
-            data[labels[i]] = {}
-            
-            for category, amount in results:
-                data[labels[i]][category] = amount
-                categories.add(category)
+        # A preview asked for while the export ran
+        if task["show_report"] and self.chart_frame.winfo_exists():
+            self.generate_report()
+    
+    def cancel_report_task(self):
+        if self.report_task:
+            self.report_task["cancel"].set()
+            self.report_task = None
+            if self.report_progress.winfo_exists():
+                self.report_progress.config(mode="determinate", value=0)
+                self.report_cancel_button.config(state=tk.DISABLED)
+                self.report_status.config(text="Cancelled")
+    
+    def export_report(self):
+        report_type = self.report_type.get()
+        time_period = self.time_period.get()
+        from_date = self.from_date.get()
+        to_date = self.to_date.get()
         
-        # Add section header
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(200, 10, txt="Expense Comparison", ln=1)
-        pdf.set_font("Arial", size=12)
-        pdf.cell(200, 10, txt=f"Comparing: {labels[0]} vs {labels[1]}", ln=1)
-        pdf.ln(5)
+        try:
+            key = self.get_report_key()
+        except ValueError:
+            messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD")
+            return
         
-        # Create table header
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(90, 10, "Category", border=1)
-        pdf.cell(50, 10, labels[0], border=1)
-        pdf.cell(50, 10, labels[1], border=1)
-        pdf.ln()
-        pdf.set_font("Arial", size=12)
+        # Ask for save location
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            filetypes=[("PDF files", "*.pdf")],
+            initialfile=f"Expense_Report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        )
         
-        # Add table rows
-        for category in sorted(categories):
-            current_amount = data[labels[0]].get(category, 0)
-            prev_amount = data[labels[1]].get(category, 0)
-            difference = current_amount - prev_amount
-            change = (difference / prev_amount * 100) if prev_amount != 0 else float('inf')
-            
-            pdf.cell(90, 10, category, border=1)
-            pdf.cell(50, 10, f"PKR {current_amount:,.2f}", border=1)
-            pdf.cell(50, 10, f"PKR {prev_amount:,.2f}", border=1)
-            pdf.ln()
-            
-            # Add change indicator
-            pdf.set_font("Arial", size=10)
-            if difference > 0:
-                pdf.cell(90, 10, "")
-                pdf.cell(50, 10, f"Increased by PKR {difference:,.2f}", border=1)
-                pdf.cell(50, 10, f"{change:.1f}%", border=1)
-            elif difference < 0:
-                pdf.cell(90, 10, "")
-                pdf.cell(50, 10, f"Decreased by PKR {abs(difference):,.2f}", border=1)
-                pdf.cell(50, 10, f"{abs(change):.1f}%", border=1)
-            else:
-                pdf.cell(90, 10, "")
-                pdf.cell(50, 10, "No change", border=1)
-                pdf.cell(50, 10, "0%", border=1)
-            
-            pdf.ln()
-            pdf.set_font("Arial", size=12)
+        if not file_path:
+            return
         
-        # Add totals
-        current_total = sum(data[labels[0]].values())
-        prev_total = sum(data[labels[1]].values())
-        total_diff = current_total - prev_total
-        total_change = (total_diff / prev_total * 100) if prev_total != 0 else float('inf')
+        # Write next to the target and only rename once complete, so a cancelled
+        # or failed export never leaves a partial file behind
+        partial_path = file_path + ".part"
+        user_id, username = self.current_user[0], self.current_user[1]
         
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(90, 10, "Total", border=1)
-        pdf.cell(50, 10, f"PKR {current_total:,.2f}", border=1)
-        pdf.cell(50, 10, f"PKR {prev_total:,.2f}", border=1)
-        pdf.ln()
+        def exported(_=None):
+            messagebox.showinfo("Success", f"Report successfully exported to:\n{file_path}")
         
-        # Add total change
-        pdf.set_font("Arial", 'B', 12)
-        if total_diff > 0:
-            pdf.cell(90, 10, "")
-            pdf.cell(50, 10, f"Increased by PKR {total_diff:,.2f}", border=1)
-            pdf.cell(50, 10, f"{total_change:.1f}%", border=1)
-        elif total_diff < 0:
-            pdf.cell(90, 10, "")
-            pdf.cell(50, 10, f"Decreased by PKR {abs(total_diff):,.2f}", border=1)
-            pdf.cell(50, 10, f"{abs(total_change):.1f}%", border=1)
-        else:
-            pdf.cell(90, 10, "")
-            pdf.cell(50, 10, "No change", border=1)
-            pdf.cell(50, 10, "0%", border=1)
+        if use_streaming_export(report_type, time_period, from_date, to_date):
+            start, end = key[3]
+            
+            def work(conn, task):
+                def progress(rows, pages):
+                    task["rows"], task["pages"] = rows, pages
+                    if task["cancel"].is_set():
+                        raise ReportCancelled()
+                
+                task["total"] = expense_day_count(conn.cursor(), user_id, start, end)
+                try:
+                    with open(partial_path, "wb") as output:
+                        write_daily_report_stream(conn.cursor(), user_id, username, from_date, to_date,
+                                                  output, progress)
+                    # A cancel after the last progress call
+                    if task["cancel"].is_set():
+                        raise ReportCancelled()
+                    os.replace(partial_path, file_path)
+                except BaseException:
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+                    raise
+            
+            self.start_report_task(work, exported, export=True)
+            return
         
-        pdf.ln()
+        # The dataset and the chart are reused when the screen already has them: the
+        # on-screen figure is rasterized here, as it belongs to the Tk thread. Everything
+        # else (query, chart for an uncached dataset, PDF) is done by the task.
+        cached = self.get_cached_report(key)
+        chart = self.report_figures.get(id(cached)) if cached else None
+        cached_png = None
+        if chart and chart[0] is cached and not cached["empty"]:
+            if chart[2] is None:
+                chart[2] = render_figure_png(chart[1])
+            cached_png = chart[2]
+        version = self.conn.total_changes
+        periods = key[4]
+        
+        def work(conn, task):
+            data = cached or build_report(conn.cursor(), user_id, report_type, time_period, from_date, to_date, periods)
+            chart_png = cached_png
+            if chart_png is None and not data["empty"]:
+                # A figure of its own, the on-screen one belongs to the Tk thread
+                chart_png = render_figure_png(render_report_figure(data))
+            
+            try:
+                create_report_pdf(username, data, chart_png).output(partial_path)
+                if task["cancel"].is_set():
+                    raise ReportCancelled()
+                os.replace(partial_path, file_path)
+            except BaseException:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+            return data, chart_png
+        
+        def done(result):
+            data, chart_png = result
+            if not cached:
+                self.report_cache[key] = (version, data)
+            chart = self.report_figures.get(id(data))
+            if chart and chart[0] is data:
+                chart[2] = chart_png
+            exported()
+        
+        self.start_report_task(work, done, export=True)
+    
+    @traced("screen")
     def show_add_goal(self):
-        self.clear_main_frame()
+        if self.raise_screen("show_add_goal", cached=False):
+            return
         
         ttk.Label(self.main_frame, text="Set New Savings Goal", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
@@ -2031,11 +4839,16 @@ class ExpenseTracker:
                 messagebox.showerror("Error", "Goal name is required")
                 return
             
-            # Save goal
+            # Save goal, any starting amount is its first contribution
+            today = datetime.datetime.now().strftime("%Y-%m-%d")
             self.cursor.execute('''
                 INSERT INTO goals (user_id, goal_name, target_amount, current_amount, target_date, created_date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (self.current_user[0], name, target, current, date, datetime.datetime.now().strftime("%Y-%m-%d")))
+                VALUES (?, ?, ?, 0, ?, ?)
+            ''', (self.current_user[0], name, target, date, today))
+            
+            if current:
+                add_goal_contribution(self.cursor, self.current_user[0], self.cursor.lastrowid, current, today,
+                                      "Starting amount")
             
             self.conn.commit()
             
@@ -2045,83 +4858,167 @@ class ExpenseTracker:
         except ValueError:
             messagebox.showerror("Error", "Invalid amount. Please enter a number")
     
+    @traced("screen")
     def show_goals(self):
-        self.clear_main_frame()
+        if self.raise_screen("show_goals"):
+            return
         
         ttk.Label(self.main_frame, text="Your Savings Goals", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
-        # Get goals
-        self.cursor.execute('''
-            SELECT goal_id, goal_name, target_amount, current_amount, target_date, is_completed 
-            FROM goals 
-            WHERE user_id=?
-            ORDER BY is_completed, target_date
-        ''', (self.current_user[0],))
-        
-        goals = self.cursor.fetchall()
+        goal_total = goal_count(self.cursor, self.current_user[0])
         
-        if not goals:
+        if not goal_total:
             ttk.Label(self.main_frame, text="You don't have any savings goals yet.").pack()
             ttk.Button(self.main_frame, text="Add New Goal", command=self.show_add_goal).pack(pady=5)
             ttk.Button(self.main_frame, text="Back", command=self.show_dashboard).pack(pady=5)
             return
         
-        # Create a frame for each goal
-        for goal in goals:
-            goal_id, name, target, current, target_date, is_completed = goal
-            
-            goal_frame = ttk.Frame(self.main_frame, relief=tk.RIDGE, borderwidth=2)
-            goal_frame.pack(fill=tk.X, padx=10, pady=5)
+        # Add new goal button
+        button_frame = ttk.Frame(self.main_frame)
+        button_frame.pack(side=tk.BOTTOM, pady=10)
+        ttk.Button(button_frame, text="Add New Goal", command=self.show_add_goal).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Back", command=self.show_dashboard).pack(side=tk.LEFT, padx=5)
+        
+        # Planning summary, every goal's projection comes from the same cached pass
+        projections = self.get_goal_projections()
+        plan_text = (f"Open goals need PKR {projections['required']:,.2f} a month, your average monthly surplus "
+                     f"over the last {SURPLUS_MONTHS} months is PKR {projections['surplus']:,.2f}")
+        ttk.Label(self.main_frame, text=plan_text).pack(pady=5)
+        
+        list_frame = ttk.Frame(self.main_frame)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        rows_frame = ttk.Frame(list_frame)
+        rows_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # Only the goals in view have widgets: a pool of fixed-height row slots is refilled
+        # from pages of goals as the list scrolls
+        now = datetime.datetime.now()
+        pages = {}
+        slots = []
+        top = 0
+        visible = GOALS_VISIBLE_ROWS
+        
+        def goal_at(index):
+            page = index // GOALS_PAGE_SIZE
+            if page not in pages:
+                pages[page] = [goal + (goal_date_text(goal[4], now),)
+                               for goal in load_goals_page(self.cursor, self.current_user[0], page * GOALS_PAGE_SIZE)]
+            return pages[page][index % GOALS_PAGE_SIZE]
+        
+        def on_wheel(event):
+            scroll("scroll", -1 if event.num == 4 or event.delta > 0 else 1, "units")
+        
+        def bind_wheel(widget):
+            widget.bind("<MouseWheel>", on_wheel)
+            widget.bind("<Button-4>", on_wheel)
+            widget.bind("<Button-5>", on_wheel)
+            for child in widget.winfo_children():
+                bind_wheel(child)
+        
+        def make_slot():
+            slot = {"goal_id": None}
+            
+            slot["frame"] = ttk.Frame(rows_frame, relief=tk.RIDGE, borderwidth=2, height=GOAL_ROW_HEIGHT)
+            slot["frame"].pack_propagate(False)
             
             # Goal info
-            info_frame = ttk.Frame(goal_frame)
+            info_frame = ttk.Frame(slot["frame"])
             info_frame.pack(fill=tk.X, padx=5, pady=5)
             
-            ttk.Label(info_frame, text=name, font=('Helvetica', 10, 'bold')).pack(anchor=tk.W)
+            slot["name"] = ttk.Label(info_frame, font=('Helvetica', 10, 'bold'))
+            slot["name"].pack(anchor=tk.W)
             
             # Progress bar
-            progress = current / target if target > 0 else 0
-            progress_bar = ttk.Progressbar(info_frame, orient=tk.HORIZONTAL, length=200, mode='determinate')
-            progress_bar.pack(fill=tk.X, pady=5)
-            progress_bar['value'] = progress * 100
+            slot["progress"] = ttk.Progressbar(info_frame, orient=tk.HORIZONTAL, length=200, mode='determinate')
+            slot["progress"].pack(fill=tk.X, pady=5)
             
             # Details
             details_frame = ttk.Frame(info_frame)
             details_frame.pack(fill=tk.X)
             
-            ttk.Label(details_frame, text=f"PKR {current:,.2f} of PKR {target:,.2f}").pack(side=tk.LEFT)
-            ttk.Label(details_frame, text=f"{progress*100:.1f}%").pack(side=tk.LEFT, padx=10)
+            slot["amounts"] = ttk.Label(details_frame)
+            slot["amounts"].pack(side=tk.LEFT)
+            slot["percent"] = ttk.Label(details_frame)
+            slot["percent"].pack(side=tk.LEFT, padx=10)
+            slot["date"] = ttk.Label(details_frame)
+            slot["date"].pack(side=tk.LEFT, padx=10)
             
-            # Target date
-            try:
-                formatted_date = datetime.datetime.strptime(target_date, "%Y-%m-%d").strftime("%d %b %Y")
-                days_left = (datetime.datetime.strptime(target_date, "%Y-%m-%d") - datetime.datetime.now()).days
-                date_text = f"Target: {formatted_date} ({days_left} days left)"
-            except ValueError:
-                date_text = "Target: No date set"
+            slot["projection"] = ttk.Label(info_frame)
+            slot["projection"].pack(anchor=tk.W)
             
-            ttk.Label(info_frame, text=date_text).pack(anchor=tk.W)
+            # Action buttons, the ones shown depend on the goal in the slot
+            action_frame = ttk.Frame(slot["frame"])
+            action_frame.pack(fill=tk.X, padx=5)
             
-            # Action buttons
-            action_frame = ttk.Frame(goal_frame)
-            action_frame.pack(fill=tk.X, padx=5, pady=5)
+            slot["open"] = [
+                ttk.Button(action_frame, text="Add Savings", command=lambda: self.add_to_goal(slot["goal_id"])),
+                ttk.Button(action_frame, text="Edit", command=lambda: self.edit_goal(slot["goal_id"])),
+                ttk.Button(action_frame, text="Complete", command=lambda: self.complete_goal(slot["goal_id"])),
+            ]
+            slot["completed"] = ttk.Label(action_frame, text="Completed!", font=('Helvetica', 9, 'bold'))
+            slot["history"] = ttk.Button(action_frame, text="History",
+                                         command=lambda: self.show_goal_history(slot["goal_id"]))
+            slot["delete"] = ttk.Button(action_frame, text="Delete", command=lambda: self.delete_goal(slot["goal_id"]))
             
-            if not is_completed:
-                ttk.Button(action_frame, text="Add Savings", 
-                          command=lambda gid=goal_id: self.add_to_goal(gid)).pack(side=tk.LEFT, padx=2)
-                ttk.Button(action_frame, text="Edit", 
-                          command=lambda gid=goal_id: self.edit_goal(gid)).pack(side=tk.LEFT, padx=2)
-                ttk.Button(action_frame, text="Complete", 
-                          command=lambda gid=goal_id: self.complete_goal(gid)).pack(side=tk.LEFT, padx=2)
-            else:
-                ttk.Label(action_frame, text="Completed!", font=('Helvetica', 9, 'bold')).pack(side=tk.LEFT, padx=2)
+            bind_wheel(slot["frame"])
+            return slot
+        
+        def fill_slot(slot, goal):
+            goal_id, name, target, current, target_date, is_completed, date_text = goal
+            slot["goal_id"] = goal_id
+            
+            progress = current / target if target > 0 else 0
+            slot["name"].config(text=name)
+            slot["progress"]['value'] = progress * 100
+            slot["amounts"].config(text=f"PKR {current:,.2f} of PKR {target:,.2f}")
+            slot["percent"].config(text=f"{progress*100:.1f}%")
+            slot["date"].config(text=date_text)
+            slot["projection"].config(text=goal_projection_text(projections["goals"].get(goal_id)))
+            
+            for widget in slot["open"] + [slot["completed"], slot["history"], slot["delete"]]:
+                widget.pack_forget()
+            for widget in ([slot["completed"]] if is_completed else slot["open"]) + [slot["history"], slot["delete"]]:
+                widget.pack(side=tk.LEFT, padx=2)
+        
+        def render():
+            nonlocal top, visible
+            height = rows_frame.winfo_height()
+            if height > 1:
+                visible = max(1, height // GOAL_ROW_HEIGHT)
+            visible = min(visible, goal_total)
+            top = max(0, min(top, goal_total - visible))
+            
+            while len(slots) < visible:
+                slots.append(make_slot())
+            
+            for i, slot in enumerate(slots):
+                if i < visible:
+                    fill_slot(slot, goal_at(top + i))
+                    if not slot["frame"].winfo_ismapped():
+                        slot["frame"].pack(fill=tk.X, pady=2)
+                else:
+                    slot["frame"].pack_forget()
             
-            ttk.Button(action_frame, text="Delete", 
-                      command=lambda gid=goal_id: self.delete_goal(gid)).pack(side=tk.LEFT, padx=2)
+            scrollbar.set(top / goal_total, (top + visible) / goal_total)
         
-        # Add new goal button
-        ttk.Button(self.main_frame, text="Add New Goal", command=self.show_add_goal).pack(pady=10)
-        ttk.Button(self.main_frame, text="Back", command=self.show_dashboard).pack(pady=5)
+        def scroll(action, amount, unit=None):
+            nonlocal top
+            if action == "moveto":
+                top = int(float(amount) * goal_total)
+            elif unit == "pages":
+                top += int(amount) * visible
+            else:
+                top += int(amount)
+            render()
+        
+        scrollbar.config(command=scroll)
+        bind_wheel(rows_frame)
+        rows_frame.bind("<Configure>", lambda event: render())
+        render()
     
     def add_to_goal(self, goal_id):
         # Get goal details
@@ -2160,19 +5057,18 @@ class ExpenseTracker:
                     messagebox.showerror("Error", "Amount must be positive")
                     return
                 
-                new_current = current + amount
+                # The amount may have changed in another window since this one opened
+                self.cursor.execute("SELECT current_amount FROM goals WHERE goal_id=?", (goal_id,))
+                latest = self.cursor.fetchone()
+                if not latest:
+                    messagebox.showerror("Error", "Goal not found")
+                    add_window.destroy()
+                    return
                 
-                if new_current > target:
+                if latest[0] + amount > target:
                     if not messagebox.askyesno("Confirm", 
                                             f"Adding PKR {amount:,.2f} will exceed your target of PKR {target:,.2f}. Continue?"):
                         return
-                
-                # Update goal
-                self.cursor.execute('''
-                    UPDATE goals 
-                    SET current_amount=? 
-                    WHERE goal_id=?
-                ''', (new_current, goal_id))
 
                 # Also add as an expense (deduct from savings)
                 now = datetime.datetime.now().strftime("%Y-%m-%d")
@@ -2186,6 +5082,10 @@ class ExpenseTracker:
                     now,
                     name         # Use the goal name as the description
                 ))
+                
+                # Update goal, the contribution is added to current_amount in the database
+                add_goal_contribution(self.cursor, self.current_user[0], goal_id, amount, now,
+                                      expense_id=self.cursor.lastrowid)
 
                 self.conn.commit()
 
@@ -2198,6 +5098,59 @@ class ExpenseTracker:
         
         ttk.Button(add_window, text="Add", command=save_addition).pack(pady=10)
     
+    def get_goal_projections(self):
+        # Projections of all open goals, recomputed only once contributions, budgets or spending changed
+        version = (self.conn.total_changes, datetime.date.today())
+        if self.goal_projections is None or self.goal_projections[0] != version:
+            self.goal_projections = (version, project_goals(self.cursor, self.current_user[0]))
+        return self.goal_projections[1]
+    
+    def show_goal_history(self, goal_id):
+        self.cursor.execute('''
+            SELECT goal_name, target_amount, current_amount, is_completed 
+            FROM goals 
+            WHERE goal_id=? AND user_id=?
+        ''', (goal_id, self.current_user[0]))
+        
+        goal = self.cursor.fetchone()
+        if not goal:
+            messagebox.showerror("Error", "Goal not found")
+            return
+        
+        name, target, current, is_completed = goal
+        contributions = load_goal_contributions(self.cursor, goal_id)
+        
+        # Create history window
+        history_window = tk.Toplevel(self.root)
+        history_window.title(f"Goal History: {name}")
+        history_window.geometry("500x400")
+        
+        ttk.Label(history_window, text=f"{name} Contributions", font=('Helvetica', 12, 'bold')).pack(pady=10)
+        ttk.Label(history_window, text=f"PKR {current:,.2f} of PKR {target:,.2f}").pack()
+        
+        # Projected completion from the recent contribution rate
+        projection = None if is_completed else self.get_goal_projections()["goals"].get(goal_id)
+        if projection and projection["rate"] > 0:
+            ttk.Label(history_window, text=f"Saving about PKR {projection['rate']:,.2f} a month").pack()
+        ttk.Label(history_window, text=goal_projection_text(projection)).pack(pady=5)
+        
+        columns = ("Date", "Amount", "Note")
+        tree = ttk.Treeview(history_window, columns=columns, show="headings", height=10)
+        
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100)
+        
+        tree.column("Note", width=250)
+        
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        for date, amount, note in reversed(contributions):
+            formatted_date = datetime.datetime.strptime(date, "%Y-%m-%d").strftime("%d %b %Y")
+            tree.insert("", tk.END, values=(formatted_date, f"PKR {amount:,.2f}", note or ""))
+        
+        ttk.Button(history_window, text="Close", command=history_window.destroy).pack(pady=10)
+    
     def edit_goal(self, goal_id):
         # Get goal details
         self.cursor.execute('''
@@ -2278,12 +5231,15 @@ class ExpenseTracker:
                     messagebox.showerror("Error", "Goal name is required")
                     return
                 
-                # Update goal
+                # Update goal, a changed amount goes into the ledger as an adjustment
                 self.cursor.execute('''
                     UPDATE goals 
-                    SET goal_name=?, target_amount=?, current_amount=?, target_date=? 
+                    SET goal_name=?, target_amount=?, target_date=? 
                     WHERE goal_id=?
-                ''', (new_name, new_target, new_current, new_date, goal_id))
+                ''', (new_name, new_target, new_date, goal_id))
+                
+                if new_current != current:
+                    set_goal_amount(self.cursor, goal_id, new_current, datetime.datetime.now().strftime("%Y-%m-%d"))
                 
                 self.conn.commit()
                 
@@ -2321,8 +5277,10 @@ class ExpenseTracker:
             messagebox.showinfo("Success", "Goal deleted")
             self.show_goals()
     
+    @traced("screen")
     def show_add_shared(self):
-        self.clear_main_frame()
+        if self.raise_screen("show_add_shared", cached=False):
+            return
         
         ttk.Label(self.main_frame, text="Add Shared Expense", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
@@ -2428,6 +5386,9 @@ class ExpenseTracker:
                 messagebox.showerror("Error", "At least one friend is required")
                 return
             
+            if not self.confirm_not_duplicate(amount, date, description):
+                return
+            
             # Calculate share
             share = amount / len(friends)
             
@@ -2441,10 +5402,11 @@ class ExpenseTracker:
             
             # Save shared expenses
             for name, paid in friends:
+                friend_id = friend_id_for(self.cursor, self.current_user[0], name)
                 self.cursor.execute('''
-                    INSERT INTO shared_expenses (expense_id, user_id, friend_name, amount_owed, is_paid)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (expense_id, self.current_user[0], name, share, 1 if paid else 0))
+                    INSERT INTO shared_expenses (expense_id, user_id, friend_name, friend_id, amount_owed, is_paid)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (expense_id, self.current_user[0], name, friend_id, share, 1 if paid else 0))
             
             self.conn.commit()
             
@@ -2454,23 +5416,15 @@ class ExpenseTracker:
         except ValueError:
             messagebox.showerror("Error", "Invalid amount. Please enter a number")
     
+    @traced("screen")
     def show_shared(self):
-        self.clear_main_frame()
+        if self.raise_screen("show_shared"):
+            return
         
         ttk.Label(self.main_frame, text="Shared Expenses", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
         # Get shared expenses
-        self.cursor.execute('''
-            SELECT e.expense_id, e.date, e.description, e.amount, 
-                   GROUP_CONCAT(se.friend_name || ' (PKR ' || se.amount_owed || ')', ', ')
-            FROM expenses e
-            JOIN shared_expenses se ON e.expense_id = se.expense_id
-            WHERE e.user_id=?
-            GROUP BY e.expense_id
-            ORDER BY e.date DESC
-        ''', (self.current_user[0],))
-        
-        shared_expenses = self.cursor.fetchall()
+        shared_expenses = shared_expense_list(self.cursor, self.current_user[0])
         
         if not shared_expenses:
             ttk.Label(self.main_frame, text="You don't have any shared expenses yet.").pack()
@@ -2535,14 +5489,7 @@ class ExpenseTracker:
         expense = self.cursor.fetchone()
 
         # Get shared details
-        self.cursor.execute('''
-            SELECT friend_name, amount_owed, is_paid 
-            FROM shared_expenses 
-            WHERE expense_id=?
-            ORDER BY friend_name
-        ''', (expense_id,))
-
-        friends = self.cursor.fetchall()
+        friends = shared_expense_friends(self.cursor, expense_id)
 
         # Create details window
         detail_window = tk.Toplevel(self.root)
@@ -2659,8 +5606,90 @@ class ExpenseTracker:
             messagebox.showinfo("Success", "Shared expense deleted")
             self.show_shared()
     
+    @traced("screen")
+    def show_friend_balances(self):
+        if self.raise_screen("show_friend_balances"):
+            return
+        
+        ttk.Label(self.main_frame, text="Friend Balances", font=('Helvetica', 14, 'bold')).pack(pady=10)
+        
+        balances = load_friend_balances(self.cursor, self.current_user[0])
+        
+        if not balances:
+            ttk.Label(self.main_frame, text="You don't have any shared expenses yet.").pack()
+            ttk.Button(self.main_frame, text="Add Shared Expense", command=self.show_add_shared).pack(pady=5)
+            ttk.Button(self.main_frame, text="Back", command=self.show_dashboard).pack(pady=5)
+            return
+        
+        outstanding = sum(balance[2] for balance in balances)
+        ttk.Label(self.main_frame, text=f"Friends owe you PKR {outstanding:,.2f} in total").pack(pady=5)
+        
+        columns = ("Friend", "Outstanding", "Paid", "Shares")
+        self.balance_tree = ttk.Treeview(self.main_frame, columns=columns, show="headings", height=10)
+        
+        for col in columns:
+            self.balance_tree.heading(col, text=col)
+            self.balance_tree.column(col, width=120)
+        
+        self.balance_tree.column("Friend", width=180)
+        self.balance_tree.column("Shares", width=80)
+        
+        self.balance_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        for friend_id, name, owed, paid, shares in balances:
+            self.balance_tree.insert("", tk.END, iid=str(friend_id), values=(
+                name,
+                f"PKR {owed:,.2f}",
+                f"PKR {paid:,.2f}",
+                shares
+            ))
+        
+        self.balance_tree.bind("<Double-1>", lambda event: self.view_friend_balance())
+        
+        # Action buttons
+        action_frame = ttk.Frame(self.main_frame)
+        action_frame.pack(pady=5)
+        
+        ttk.Button(action_frame, text="View Unpaid", command=self.view_friend_balance).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="Shared Expenses", command=self.show_shared).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="Back", command=self.show_dashboard).pack(side=tk.LEFT, padx=5)
+    
+    def view_friend_balance(self):
+        selected = self.balance_tree.selection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a friend to view")
+            return
+        
+        friend_id = int(selected[0])
+        name = self.balance_tree.item(selected[0])['values'][0]
+        shares = friend_shared_expenses(self.cursor, self.current_user[0], friend_id)
+        
+        detail_window = tk.Toplevel(self.root)
+        detail_window.title(f"{name} - Unpaid")
+        detail_window.geometry("500x400")
+        
+        ttk.Label(detail_window, text=f"Unpaid shares of {name}", font=('Helvetica', 12, 'bold')).pack(pady=10)
+        
+        columns = ("Date", "Description", "Amount")
+        tree = ttk.Treeview(detail_window, columns=columns, show="headings", height=10)
+        
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120)
+        
+        tree.column("Description", width=200)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        for expense_id, date, description, amount_owed in shares:
+            formatted_date = datetime.datetime.strptime(date, "%Y-%m-%d").strftime("%d %b %Y")
+            tree.insert("", tk.END, values=(formatted_date, description or "", f"PKR {amount_owed:,.2f}"))
+        
+        ttk.Button(detail_window, text="Close", command=detail_window.destroy).pack(pady=10)
+    
+    @traced("screen")
     def manage_categories(self):
-        self.clear_main_frame()
+        if self.raise_screen("manage_categories"):
+            return
         
         ttk.Label(self.main_frame, text="Manage Categories", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
@@ -2878,8 +5907,10 @@ class ExpenseTracker:
             messagebox.showinfo("Success", "All categories unlocked")
             self.manage_categories()
     
+    @traced("screen")
     def manage_budget(self):
-        self.clear_main_frame()
+        if self.raise_screen("manage_budget"):
+            return
         
         ttk.Label(self.main_frame, text="Manage Budget", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
@@ -2906,6 +5937,10 @@ class ExpenseTracker:
         self.budget_entry.grid(row=0, column=1, padx=5, pady=5)
         self.budget_entry.insert(0, current_budget)
         
+        self.budget_template_var = tk.BooleanVar(value=self.get_budget_template() is not None)
+        ttk.Checkbutton(form_frame, text="Use this budget for the following months", 
+                        variable=self.budget_template_var).grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
+        
         # Buttons
         button_frame = ttk.Frame(self.main_frame)
         button_frame.pack(pady=10)
@@ -2913,19 +5948,14 @@ class ExpenseTracker:
         ttk.Button(button_frame, text="Save", command=self.save_budget).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Back", command=self.show_dashboard).pack(side=tk.LEFT, padx=5)
         
+        # Spending forecast
+        self.show_budget_forecast(current_budget)
+        
         # Budget history
         ttk.Label(self.main_frame, text="Budget History", font=('Helvetica', 12, 'bold')).pack(pady=10)
         
         # Get budget history
-        self.cursor.execute('''
-            SELECT month_year, amount 
-            FROM budgets 
-            WHERE user_id=?
-            ORDER BY month_year DESC
-            LIMIT 12
-        ''', (self.current_user[0],))
-        
-        history = self.cursor.fetchall()
+        history = budget_history(self.cursor, self.current_user[0])
         
         if not history:
             ttk.Label(self.main_frame, text="No budget history available").pack()
@@ -2947,17 +5977,8 @@ class ExpenseTracker:
         history_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         # Load data
-        for month_year, amount in history:
+        for month_year, amount, actual in history:
             month = datetime.datetime.strptime(month_year, "%Y-%m").strftime("%B %Y")
-            
-            # Get actual expenses
-            self.cursor.execute('''
-                SELECT COALESCE(SUM(amount), 0) 
-                FROM expenses 
-                WHERE user_id=? AND strftime('%Y-%m', date)=? AND is_deleted=0
-            ''', (self.current_user[0], month_year))
-            
-            actual = self.cursor.fetchone()[0]
             difference = amount - actual
             
             history_tree.insert("", tk.END, values=(
@@ -2967,6 +5988,45 @@ class ExpenseTracker:
                 f"PKR {difference:,.2f}",
             ))
     
+    @traced("chart")
+    def show_budget_forecast(self, current_budget, months_ahead=3):
+        ttk.Label(self.main_frame, text="Spending Forecast", font=('Helvetica', 12, 'bold')).pack(pady=10)
+        
+        history = load_monthly_history(self.cursor, self.current_user[0])
+        start_month = datetime.datetime.now().strftime("%Y-%m")
+        forecast = forecast_spending(history, months_ahead=months_ahead, start_month=start_month)
+        
+        if forecast.empty:
+            ttk.Label(self.main_frame, text="Not enough expense history for a forecast").pack()
+            return
+        
+        budget = self.get_budget_template() or current_budget
+        
+        columns = ("Month", "Projected Spending", "Budget", "Difference", "Largest Category")
+        forecast_tree = ttk.Treeview(self.main_frame, columns=columns, show="headings", height=months_ahead)
+        
+        for col in columns:
+            forecast_tree.heading(col, text=col)
+            forecast_tree.column(col, width=150, anchor=tk.CENTER)
+        
+        forecast_tree.pack(fill=tk.X, padx=10, pady=5)
+        
+        totals = forecast.sum(axis=1)
+        largest = forecast.idxmax(axis=1)
+        
+        for month_year in forecast.index:
+            month = datetime.datetime.strptime(month_year, "%Y-%m").strftime("%B %Y")
+            projected = totals[month_year]
+            category = largest[month_year]
+            
+            forecast_tree.insert("", tk.END, values=(
+                month,
+                f"PKR {projected:,.2f}",
+                f"PKR {budget:,.2f}" if budget else "Not set",
+                f"PKR {budget - projected:,.2f}" if budget else "-",
+                f"{category} (PKR {forecast.at[month_year, category]:,.2f})"
+            ))
+    
     def start_budget(self):
         now = datetime.datetime.now()
         current_month = now.strftime("%Y-%m")
@@ -2982,6 +6042,10 @@ class ExpenseTracker:
         ttk.Label(entry_frame, text="Amount (PKR):").grid(row=0, column=0, padx=5, pady=5, sticky=tk.E)
         self.budget_entry = ttk.Entry(entry_frame)
         self.budget_entry.grid(row=0, column=1, padx=5, pady=5)
+        
+        self.budget_template_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(entry_frame, text="Use this budget for the following months", 
+                        variable=self.budget_template_var).grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
     
         button_frame = ttk.Frame(self.budget_frame)
         button_frame.pack(pady=10)
@@ -3005,6 +6069,8 @@ class ExpenseTracker:
                 VALUES (?, ?, ?)
             ''', (self.current_user[0], month_year, amount))
             
+            self.save_budget_template(amount, self.budget_template_var.get())
+            
             self.conn.commit()
             
             messagebox.showinfo("Success", "Budget saved successfully")
@@ -3031,6 +6097,8 @@ class ExpenseTracker:
                 VALUES (?, ?, ?)
             ''', (self.current_user[0], month_year, amount))
             
+            self.save_budget_template(amount, self.budget_template_var.get())
+            
             self.conn.commit()
             
             messagebox.showinfo("Success", "Budget saved successfully")
@@ -3039,8 +6107,101 @@ class ExpenseTracker:
         except ValueError:
             messagebox.showerror("Error", "Invalid amount. Please enter a number")
     
+    @traced("screen")
+    def manage_recurring(self):
+        if self.raise_screen("manage_recurring"):
+            return
+        
+        ttk.Label(self.main_frame, text="Recurring Expenses", font=('Helvetica', 14, 'bold')).pack(pady=10)
+        
+        self.cursor.execute('''
+            SELECT recurring_id, description, category, amount, frequency, next_date, is_active 
+            FROM recurring_expenses 
+            WHERE user_id=?
+            ORDER BY is_active DESC, next_date
+        ''', (self.current_user[0],))
+        
+        rules = self.cursor.fetchall()
+        
+        if not rules:
+            ttk.Label(self.main_frame, text="You don't have any recurring expenses yet. Choose a repeat interval when adding an expense.").pack()
+            ttk.Button(self.main_frame, text="Add Expense", command=self.show_add_expense).pack(pady=5)
+            ttk.Button(self.main_frame, text="Back", command=self.show_dashboard).pack(pady=5)
+            return
+        
+        columns = ("ID", "Description", "Category", "Amount", "Repeats", "Next Due", "Status")
+        self.recurring_tree = ttk.Treeview(self.main_frame, columns=columns, show="headings", height=10)
+        
+        for col in columns:
+            self.recurring_tree.heading(col, text=col)
+            self.recurring_tree.column(col, width=100)
+        
+        self.recurring_tree.column("ID", width=50)
+        self.recurring_tree.column("Description", width=200)
+        
+        self.recurring_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        for recurring_id, description, category, amount, frequency, next_date, is_active in rules:
+            formatted_date = datetime.datetime.strptime(next_date, "%Y-%m-%d").strftime("%d %b %Y")
+            self.recurring_tree.insert("", tk.END, values=(
+                recurring_id,
+                description if description else "",
+                category,
+                f"PKR {amount:,.2f}",
+                frequency.capitalize(),
+                formatted_date if is_active else "-",
+                "Active" if is_active else "Stopped"
+            ))
+        
+        action_frame = ttk.Frame(self.main_frame)
+        action_frame.pack(pady=5)
+        
+        ttk.Button(action_frame, text="Stop", command=self.stop_recurring).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="Delete", command=self.delete_recurring).pack(side=tk.LEFT, padx=5)
+        ttk.Button(action_frame, text="Back", command=self.show_dashboard).pack(side=tk.LEFT, padx=5)
+    
+    def stop_recurring(self):
+        selected = self.recurring_tree.selection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a recurring expense to stop")
+            return
+        
+        recurring_id = self.recurring_tree.item(selected[0])['values'][0]
+        
+        self.cursor.execute('''
+            UPDATE recurring_expenses 
+            SET is_active=0 
+            WHERE recurring_id=? AND user_id=?
+        ''', (recurring_id, self.current_user[0]))
+        
+        self.conn.commit()
+        
+        messagebox.showinfo("Success", "Recurring expense stopped. Past entries are kept.")
+        self.manage_recurring()
+    
+    def delete_recurring(self):
+        selected = self.recurring_tree.selection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a recurring expense to delete")
+            return
+        
+        recurring_id = self.recurring_tree.item(selected[0])['values'][0]
+        
+        if messagebox.askyesno("Confirm", "Delete this recurring expense? Expenses it already created are kept."):
+            self.cursor.execute('''
+                DELETE FROM recurring_expenses 
+                WHERE recurring_id=? AND user_id=?
+            ''', (recurring_id, self.current_user[0]))
+            
+            self.conn.commit()
+            
+            messagebox.showinfo("Success", "Recurring expense deleted")
+            self.manage_recurring()
+    
+    @traced("screen")
     def manage_challenges(self):
-        self.clear_main_frame()
+        if self.raise_screen("manage_challenges"):
+            return
         
         ttk.Label(self.main_frame, text="Monthly Challenges", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
@@ -3048,45 +6209,19 @@ class ExpenseTracker:
         now = datetime.datetime.now()
         current_month = now.strftime("%Y-%m")
         # Get all current month challenges
-        self.cursor.execute('''
-            SELECT challenge_id, category FROM challenges
-            WHERE user_id=? AND strftime('%Y-%m', start_date) <= ? AND strftime('%Y-%m', end_date) >= ?
-        ''', (self.current_user[0], current_month, current_month))
-        challenges = self.cursor.fetchall()
-        for challenge_id, category in challenges:
-            # Sum only positive expenses for this category in this month
-            self.cursor.execute('''
-                SELECT COALESCE(SUM(amount), 0)
-                FROM expenses
-                WHERE user_id=? AND category=? AND strftime('%Y-%m', date)=? AND is_deleted=0 AND amount > 0
-            ''', (self.current_user[0], category, current_month))
-            spent = self.cursor.fetchone()[0]
+        challenges = current_challenges(self.cursor, self.current_user[0], current_month)
+        for challenge_id, category, _, _, _ in challenges:
+            spent = category_month_spending(self.cursor, self.current_user[0], category, current_month)
+            # Only write changed amounts, an unchanged screen must not bump the data version
             self.cursor.execute('''
                 UPDATE challenges SET current_amount=?
-                WHERE challenge_id=?
-            ''', (spent, challenge_id))
+                WHERE challenge_id=? AND current_amount IS NOT ?
+            ''', (spent, challenge_id, spent))
         self.conn.commit()
         # --- END AUTO-UPDATE ---
         
         # Now fetch and display challenges as before
-        self.cursor.execute('''
-            SELECT challenge_id, category, target_amount, current_amount, is_completed 
-            FROM challenges 
-            WHERE user_id=? AND strftime('%Y-%m', start_date) <= ? AND strftime('%Y-%m', end_date) >= ?
-        ''', (self.current_user[0], current_month, current_month))
-        challenges = self.cursor.fetchall()
-        
-        # Get current month challenges
-        now = datetime.datetime.now()
-        current_month = now.strftime("%Y-%m")
-        
-        self.cursor.execute('''
-            SELECT challenge_id, category, target_amount, current_amount, is_completed 
-            FROM challenges 
-            WHERE user_id=? AND strftime('%Y-%m', start_date) <= ? AND strftime('%Y-%m', end_date) >= ?
-        ''', (self.current_user[0], current_month, current_month))
-        
-        challenges = self.cursor.fetchall()
+        challenges = current_challenges(self.cursor, self.current_user[0], current_month)
         
         # Create a frame for each challenge
         if challenges:
@@ -3225,11 +6360,11 @@ class ExpenseTracker:
             SELECT c.category, COALESCE(SUM(e.amount), 0) 
             FROM challenges c
             LEFT JOIN expenses e ON e.user_id = c.user_id AND e.category = c.category 
-                                AND strftime('%Y-%m', e.date) = strftime('%Y-%m', date('now')) 
+                                AND e.date >= ? AND e.date < ? 
                                 AND e.is_deleted=0
             WHERE c.challenge_id=?
             GROUP BY c.category
-        ''', (challenge_id,))
+        ''', month_range(datetime.date.today().strftime("%Y-%m")) + (challenge_id,))
         
         result = self.cursor.fetchone()
         if not result:
@@ -3304,8 +6439,10 @@ class ExpenseTracker:
             messagebox.showinfo("Success", "Challenge deleted")
             self.manage_challenges()
     
+    @traced("screen")
     def view_completed_challenges(self):
-        self.clear_main_frame()
+        if self.raise_screen("view_completed_challenges"):
+            return
         
         ttk.Label(self.main_frame, text="Completed Challenges", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
@@ -3384,14 +6521,16 @@ class ExpenseTracker:
             messagebox.showinfo("Success", "Challenge deleted")
             self.view_completed_challenges()
     
+    @traced("screen")
     def manage_profile(self):
-        self.clear_main_frame()
+        if self.raise_screen("manage_profile"):
+            return
         
         ttk.Label(self.main_frame, text="Your Profile", font=('Helvetica', 14, 'bold')).pack(pady=10)
         
         # Get user details
         self.cursor.execute('''
-            SELECT username, email, theme 
+            SELECT username, email, theme, trash_retention_days 
             FROM users 
             WHERE user_id=?
         ''', (self.current_user[0],))
@@ -3419,8 +6558,15 @@ class ExpenseTracker:
         ttk.Radiobutton(form_frame, text="Light", variable=self.theme_var, value="light").grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
         ttk.Radiobutton(form_frame, text="Dark", variable=self.theme_var, value="dark").grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
         
+        # Trash retention
+        ttk.Label(form_frame, text="Keep deleted expenses:").grid(row=4, column=0, padx=5, pady=5, sticky=tk.E)
+        self.retention_var = tk.StringVar(value=self.retention_label(user[3]))
+        retention_combo = ttk.Combobox(form_frame, textvariable=self.retention_var, state="readonly")
+        retention_combo['values'] = [self.retention_label(days) for days in TRASH_RETENTION_CHOICES]
+        retention_combo.grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
+        
         # Change password button
-        ttk.Button(form_frame, text="Change Password", command=self.change_password).grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
+        ttk.Button(form_frame, text="Change Password", command=self.change_password).grid(row=5, column=1, padx=5, pady=5, sticky=tk.W)
         
         # Buttons
         button_frame = ttk.Frame(self.main_frame)
@@ -3429,19 +6575,27 @@ class ExpenseTracker:
         ttk.Button(button_frame, text="Save", command=self.save_profile).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Back", command=self.show_dashboard).pack(side=tk.LEFT, padx=5)
     
+    def retention_label(self, days):
+        return f"{days} days" if days else "Forever"
+    
     def save_profile(self):
         email = self.email_entry.get()
         theme = self.theme_var.get()
+        retention = self.retention_var.get()
+        retention_days = int(retention.split()[0]) if retention != "Forever" else 0
         
         # Update profile
         self.cursor.execute('''
             UPDATE users 
-            SET email=?, theme=?
+            SET email=?, theme=?, trash_retention_days=?
             WHERE user_id=?
-        ''', (email if email else None, theme, self.current_user[0]))
+        ''', (email if email else None, theme, retention_days, self.current_user[0]))
         
         self.conn.commit()
         
+        # A shorter retention may have expired items right away
+        self.start_trash_purge()
+        
         # Update current theme if changed
         if self.theme != theme:
             self.theme = theme
@@ -3515,9 +6669,132 @@ class ExpenseTracker:
         
         ttk.Button(change_window, text="Save", command=save_password).pack(pady=10)
     
-    def clear_main_frame(self):
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
+    def show_diagnostics(self):
+        # Query timings collected since start-up (or the last reset), slowest screens first
+        diagnostics_window = tk.Toplevel(self.root)
+        diagnostics_window.title("Diagnostics")
+        diagnostics_window.geometry("900x600")
+        
+        ttk.Label(diagnostics_window, text="Query Timings", font=('Helvetica', 12, 'bold')).pack(pady=10)
+        
+        columns = ("Screen", "Statement", "Calls", "Total ms", "Avg ms", "Max ms", "Rows")
+        top_tree = ttk.Treeview(diagnostics_window, columns=columns, show="headings", height=10)
+        
+        for col in columns:
+            top_tree.heading(col, text=col)
+            top_tree.column(col, width=90, anchor=tk.E)
+        
+        top_tree.column("Screen", width=160, anchor=tk.W)
+        top_tree.column("Statement", width=200, anchor=tk.W)
+        
+        top_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        threshold_frame = ttk.Frame(diagnostics_window)
+        threshold_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(threshold_frame, text="Slow Queries", font=('Helvetica', 10, 'bold')).pack(side=tk.LEFT)
+        ttk.Label(threshold_frame, text="Threshold (ms):").pack(side=tk.LEFT, padx=(20, 5))
+        threshold = ttk.Spinbox(threshold_frame, from_=1, to=60000, increment=50, width=8)
+        threshold.pack(side=tk.LEFT)
+        threshold.set(QUERY_STATS.slow_ms)
+        
+        columns = ("Time", "Screen", "Statement", "ms", "Rows", "SQL")
+        slow_tree = ttk.Treeview(diagnostics_window, columns=columns, show="headings", height=8)
+        
+        for col in columns:
+            slow_tree.heading(col, text=col)
+            slow_tree.column(col, width=80)
+        
+        slow_tree.column("Time", width=140)
+        slow_tree.column("Screen", width=120)
+        slow_tree.column("Statement", width=140)
+        slow_tree.column("SQL", width=300)
+        
+        slow_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        def refresh():
+            top_tree.delete(*top_tree.get_children())
+            for screen, statement, calls, total, longest, rows in QUERY_STATS.top():
+                top_tree.insert("", tk.END, values=(
+                    screen, statement, calls,
+                    f"{total * 1000:,.1f}", f"{total * 1000 / calls:,.2f}", f"{longest * 1000:,.1f}", f"{rows:,}"
+                ))
+            
+            slow_tree.delete(*slow_tree.get_children())
+            for logged, screen, statement, ms, rows, sql in reversed(QUERY_STATS.slow):
+                slow_tree.insert("", tk.END, values=(logged, screen, statement, f"{ms:,.1f}", rows, sql))
+        
+        def apply_threshold():
+            try:
+                QUERY_STATS.slow_ms = float(threshold.get())
+            except ValueError:
+                messagebox.showerror("Error", "Threshold must be a number of milliseconds")
+                threshold.set(QUERY_STATS.slow_ms)
+        
+        def reset():
+            QUERY_STATS.reset()
+            TRACER.clear()
+            refresh()
+        
+        def export_trace():
+            file_path = filedialog.asksaveasfilename(
+                defaultextension=".json",
+                filetypes=[("Chrome trace", "*.json")],
+                title="Export Trace"
+            )
+            if not file_path:
+                return
+            
+            try:
+                count = TRACER.export(file_path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to export trace: {str(e)}")
+                return
+            messagebox.showinfo("Success", f"Exported {count:,} trace events to {file_path}")
+        
+        def toggle_trace():
+            TRACER.enabled = not TRACER.enabled
+            trace_button.config(text="Stop Trace" if TRACER.enabled else "Start Trace")
+        
+        button_frame = ttk.Frame(diagnostics_window)
+        button_frame.pack(pady=10)
+        
+        ttk.Button(button_frame, text="Set Threshold", command=apply_threshold).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Refresh", command=refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Reset", command=reset).pack(side=tk.LEFT, padx=5)
+        trace_button = ttk.Button(button_frame, text="Stop Trace" if TRACER.enabled else "Start Trace",
+                                  command=toggle_trace)
+        trace_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Export Trace", command=export_trace).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Close", command=diagnostics_window.destroy).pack(side=tk.LEFT, padx=5)
+        
+        refresh()
+    
+    def raise_screen(self, name, refresh=None, key=None, cached=True):
+        # Raise the cached frame of a screen. Returns True when that is all there is to do:
+        # nothing changed since it was built, or refresh() brought its data up to date.
+        # Otherwise the screen gets a new, empty main_frame to build into and False.
+        # key is what the frame must be showing (such as the expense filters) to be reused,
+        # forms pass cached=False so they always start out empty.
+        # Writes on the worker threads' connections count as well as those on self.conn,
+        # and screens showing the current month go stale at midnight.
+        version = (self.conn.total_changes, InstrumentedConnection.commits, datetime.date.today())
+        screen = self.screens.get(name)
+        
+        if screen and screen["frame"].winfo_exists():
+            if cached and screen["key"] == key and (screen["version"] == version or screen["refresh"]):
+                self.main_frame = screen["frame"]
+                self.main_frame.tkraise()
+                if screen["version"] != version:
+                    screen["version"] = version
+                    screen["refresh"]()
+                return True
+            screen["frame"].destroy()
+        
+        self.main_frame = ttk.Frame(self.screen_container)
+        self.main_frame.grid(row=0, column=0, sticky=tk.NSEW)
+        self.screens[name] = {"frame": self.main_frame, "version": version, "refresh": refresh, "key": key}
+        return False
     
     def logout(self):
         self.current_user = None
@@ -3527,6 +6804,33 @@ class ExpenseTracker:
         self.root.mainloop()
 
 if __name__ == "__main__":
+    args = parse_arguments()
+    DATABASE_FILE = args.database
+    QUERY_STATS.slow_ms = args.slow_query_ms
+    QUERY_STATS.log_file = args.slow_query_log or None
+    TRACER.enabled = bool(args.trace)
+    
+    if args.check_query_plans:
+        sys.exit(0 if run_query_plan_checks() else 1)
+    
+    if args.generate_data or args.benchmark:
+        try:
+            if args.generate_data:
+                generate_synthetic_data(args.database, args.generate_data, args.seed, args.synthetic_users)
+            if args.benchmark:
+                run_benchmarks(args.database, args.benchmark_repeats, args.benchmark_output)
+        except ValueError as e:
+            sys.exit(str(e))
+        sys.exit(0)
+    
+    if args.batch_reports:
+        failed = run_batch_reports(args.database, args.users, args.reports, args.periods,
+                                   args.from_date, args.to_date, args.output, args.workers, args.compare_periods)
+        sys.exit(1 if failed else 0)
+    
     root = tk.Tk()
     app = ExpenseTracker(root)
-    app.run()
\ No newline at end of file
+    app.run()
+    
+    if args.trace:
+        print(f"Wrote {TRACER.export(args.trace):,} trace events to {args.trace}")
\ No newline at end of file